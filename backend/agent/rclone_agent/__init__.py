@@ -0,0 +1,3 @@
+"""Rclone Backup Manager agent: runs backup jobs leased from the server"""
+
+__version__ = "2.0.0"
@@ -0,0 +1,36 @@
+import argparse
+import asyncio
+import json
+import os
+from . import __version__
+from .agent import Agent
+from .client import ServerClient
+
+DEFAULT_CONFIG = "/opt/rclone-agent/config.json"
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="rclone-agent", description="Rclone Backup Manager agent")
+    parser.add_argument("--config", default=DEFAULT_CONFIG,
+                        help="JSON file with agent_id, agent_token and server_url (written by install.sh)")
+    parser.add_argument("--max-jobs", type=int, help="Jobs to run at once (default: max_jobs in the config, else 2)")
+    parser.add_argument("--work-dir", help="Where job configs and logs go (default: the config's directory)")
+    parser.add_argument("--once", action="store_true", help="Run the jobs queued now, then exit")
+    parser.add_argument("--version", action="version", version=__version__)
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    max_jobs = args.max_jobs or int(config.get("max_jobs") or 2)
+    work_dir = args.work_dir or config.get("work_dir") or os.path.dirname(os.path.abspath(args.config))
+
+    async def run():
+        client = ServerClient(config["server_url"], config["agent_id"], config["agent_token"],
+                              max_connections=max_jobs * 2 + 2)
+        await Agent(client, work_dir, max_jobs=max_jobs, once=args.once).run()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import asyncio
+import signal
+from .client import ServerClient, POLL_WAIT
+from .runner import JobRunner
+
+# Back off this long after the server could not be reached
+RETRY_DELAY = 5
+
+
+class Agent:
+    """Long-polls the server for jobs and runs up to max_jobs of them at once"""
+
+    def __init__(self, client: ServerClient, work_dir: str, max_jobs: int = 2, once: bool = False):
+        self.client = client
+        self.work_dir = work_dir
+        self.max_jobs = max_jobs
+        self.once = once
+        self.runners = {}  # job id -> (JobRunner, task)
+        self.control_task = None
+        self.stopping = asyncio.Event()
+        self.slot_freed = asyncio.Event()
+
+    def stop(self):
+        self.stopping.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop)
+
+        print(f"Rclone agent started, running up to {self.max_jobs} jobs at once", flush=True)
+        try:
+            while not self.stopping.is_set():
+                free = self.max_jobs - len(self.runners)
+                if free <= 0:
+                    await self._until(self.slot_freed.wait())
+                    self.slot_freed.clear()
+                    continue
+
+                try:
+                    jobs = await self._until(self.client.claim_jobs(free, 0 if self.once else POLL_WAIT))
+                except Exception as e:
+                    print(f"Polling the server failed: {e}", flush=True)
+                    await self._until(asyncio.sleep(RETRY_DELAY))
+                    continue
+
+                for job in jobs or ():
+                    self._start(job)
+                if self.once and not jobs:
+                    if not self.runners:
+                        break
+                    await self._until(self.slot_freed.wait())
+                    self.slot_freed.clear()
+        finally:
+            await self._shutdown()
+
+    async def _until(self, aw):
+        """Await aw unless stop() is called first (then returns None)"""
+        task = asyncio.ensure_future(aw)
+        stopped = asyncio.ensure_future(self.stopping.wait())
+        done, _ = await asyncio.wait({task, stopped}, return_when=asyncio.FIRST_COMPLETED)
+        stopped.cancel()
+        if task in done:
+            return task.result()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return None
+
+    def _start(self, job: dict):
+        if job["id"] in self.runners:
+            return  # Re-handed while we still run it (lease renewal hiccup)
+        runner = JobRunner(self.client, job, self.work_dir)
+        task = asyncio.create_task(runner.run())
+        self.runners[job["id"]] = (runner, task)
+        task.add_done_callback(lambda _: self._finished(job["id"]))
+        if self.control_task is None or self.control_task.done():
+            self.control_task = asyncio.create_task(self._control())
+
+    async def _control(self):
+        """Apply the server's control messages while any job runs"""
+        while self.runners and not self.stopping.is_set():
+            try:
+                messages = await self.client.control()
+            except Exception as e:
+                print(f"Polling for control messages failed: {e}", flush=True)
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            for message in messages:
+                entry = self.runners.get(message.get("job_id"))
+                if entry is None:
+                    continue
+                runner = entry[0]
+                kind = message.get("type")
+                if kind == "cancel":
+                    # The server already dropped the lease; don't report back
+                    runner.lease_lost = True
+                    asyncio.create_task(runner.cancel("Cancelled by server"))
+                elif kind == "pause":
+                    runner.pause()
+                elif kind == "resume":
+                    runner.resume()
+                elif kind == "bwlimit":
+                    await runner.set_bwlimit(message["rate"])
+                elif kind == "transfers":
+                    await runner.set_transfers(message["transfers"])
+
+    def _finished(self, job_id: int):
+        self.runners.pop(job_id, None)
+        self.slot_freed.set()
+
+    async def _shutdown(self):
+        """Stop running jobs and report them as interrupted"""
+        if self.runners:
+            print(f"Stopping {len(self.runners)} running jobs", flush=True)
+        if self.control_task:
+            self.control_task.cancel()
+        runners = list(self.runners.values())
+        await asyncio.gather(*(runner.cancel("Interrupted: agent stopped") for runner, _ in runners))
+        await asyncio.gather(*(task for _, task in runners), return_exceptions=True)
+        await self.client.close()
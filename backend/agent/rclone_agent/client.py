@@ -0,0 +1,92 @@
+import gzip
+import httpx
+
+# Long-polls are held by the server for up to this long
+POLL_WAIT = 55
+REQUEST_TIMEOUT = 30
+
+
+class LeaseLost(Exception):
+    """The server gave the job to someone else (or it was cancelled); stop working on it"""
+
+
+class LogLimitReached(Exception):
+    """The server keeps no more of this job's log; stop shipping it"""
+
+
+class ServerClient:
+    """All agent -> server calls, over one pooled keep-alive client"""
+
+    def __init__(self, server_url: str, agent_id: int, agent_token: str, max_connections: int = 10):
+        self.http = httpx.AsyncClient(
+            base_url=server_url.rstrip("/"),
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self.prefix = f"/api/agents/{agent_id}"
+        self.auth = {"agent_token": agent_token}
+
+    async def close(self):
+        await self.http.aclose()
+
+    async def claim_jobs(self, limit: int, wait: int = POLL_WAIT) -> list:
+        """Lease up to limit jobs, waiting up to wait seconds for one to be queued"""
+        resp = await self.http.get(
+            f"{self.prefix}/jobs",
+            params={**self.auth, "wait": wait, "limit": limit},
+            timeout=wait + REQUEST_TIMEOUT
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    async def control(self, wait: int = POLL_WAIT) -> list:
+        """Cancel/pause/resume/bwlimit/transfers messages for running jobs, long-polled"""
+        resp = await self.http.get(
+            f"{self.prefix}/control",
+            params={**self.auth, "wait": wait},
+            timeout=wait + REQUEST_TIMEOUT
+        )
+        resp.raise_for_status()
+        return resp.json()
+
+    async def report_progress(self, job_id: int, lease_token: str, stats: dict) -> dict:
+        """Send rclone stats; this also renews the lease. Returns the server's reply (bwlimit etc.)"""
+        resp = await self.http.post(
+            f"{self.prefix}/jobs/{job_id}/progress",
+            params={**self.auth, "lease_token": lease_token},
+            json=stats
+        )
+        if resp.status_code == 409:
+            raise LeaseLost(resp.json().get("detail"))
+        resp.raise_for_status()
+        return resp.json()
+
+    async def log_offset(self, job_id: int) -> int:
+        resp = await self.http.get(f"{self.prefix}/jobs/{job_id}/logs", params=self.auth)
+        resp.raise_for_status()
+        return resp.json()["offset"]
+
+    async def upload_log(self, job_id: int, offset: int, data: bytes) -> int:
+        """Append data at offset; returns the server's new size (its current size on a conflict)"""
+        resp = await self.http.post(
+            f"{self.prefix}/jobs/{job_id}/logs",
+            params={**self.auth, "offset": offset},
+            content=gzip.compress(data, compresslevel=6),
+            headers={"Content-Type": "application/octet-stream", "Content-Encoding": "gzip"}
+        )
+        if resp.status_code == 409:
+            return resp.json()["detail"]["offset"]
+        if resp.status_code == 413:
+            raise LogLimitReached(resp.json().get("detail"))
+        resp.raise_for_status()
+        return resp.json()["offset"]
+
+    async def complete(self, job_id: int, lease_token: str, report: dict):
+        resp = await self.http.post(
+            f"{self.prefix}/jobs/{job_id}/complete",
+            params={**self.auth, "lease_token": lease_token},
+            json=report
+        )
+        if resp.status_code == 409:
+            raise LeaseLost(resp.json().get("detail"))
+        resp.raise_for_status()
@@ -0,0 +1,13 @@
+"""How rclone's JSON log becomes job log text; shared by the agent and the server"""
+
+# How often rclone emits a stats block while a job runs
+STATS_INTERVAL = "10s"
+
+
+def format_log_entry(entry: dict) -> str:
+    """Render an rclone --use-json-log entry like rclone's plain text log"""
+    level = entry.get("level", "info").upper()
+    msg = entry.get("msg", "").rstrip("\n")
+    if entry.get("object"):
+        msg = f"{entry['object']}: {msg}"
+    return f"{entry.get('time', '')} {level:<6}: {msg}\n"
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import os
+import signal
+from collections import deque
+import httpx
+from .client import LeaseLost, LogLimitReached
+from .logformat import STATS_INTERVAL, format_log_entry
+
+# Progress reports double as lease renewals; keep well inside the lease
+PROGRESS_INTERVAL = 10
+LOG_SHIP_INTERVAL = 5
+LOG_CHUNK_SIZE = 1024 * 1024
+# rclone gets this long to exit after SIGTERM before it is killed
+TERMINATE_TIMEOUT = 30
+STREAM_LIMIT = 1024 * 1024
+ERROR_TAIL_LINES = 5
+DEFAULT_FLAGS = ["--transfers", "8"]
+
+
+class JobRunner:
+    """Runs one leased job: rclone sync, live log shipping, progress/lease reports"""
+
+    def __init__(self, client, job: dict, work_dir: str):
+        self.client = client
+        self.job = job
+        self.id = job["id"]
+        self.lease_token = job["lease_token"]
+        self.config_path = os.path.join(work_dir, f"job-{self.id}.conf")
+        self.rc_socket = os.path.join(work_dir, f"job-{self.id}.rc.sock")
+        self.log_path = os.path.join(work_dir, "logs", f"job_{self.id}.log")
+        self.process = None
+        self.stats = {}
+        self.errors = deque(maxlen=ERROR_TAIL_LINES)
+        self.cancel_reason = None
+        self.lease_lost = False
+        self.bwlimit = None
+        self.shipped = None
+        self.shipping_stopped = False
+
+    def command(self) -> list:
+        cmd = [
+            "rclone", "sync",
+            self.job["source_path"],
+            self.job["remote"],
+            "--config", self.config_path,
+            "--log-level", "INFO",
+            "--use-json-log",
+            "--stats", STATS_INTERVAL,
+            # rc on a private socket lets the server's bandwidth allocator resize the job
+            "--rc", "--rc-addr", f"unix://{self.rc_socket}", "--rc-no-auth",
+            *(self.job.get("rclone_flags") or DEFAULT_FLAGS)
+        ]
+        if self.job.get("backup_dir"):
+            cmd.extend(["--backup-dir", self.job["backup_dir"]])
+        return cmd
+
+    async def run(self):
+        """Run the job to the end and report it; never raises"""
+        print(f"Job {self.id}: {self.job['source_path']} -> {self.job['remote']}", flush=True)
+        try:
+            returncode = await self._run_rclone()
+        except Exception as e:
+            returncode = None
+            self.errors.append(f"Agent error: {e}")
+
+        if self.lease_lost:
+            print(f"Job {self.id}: lease lost, not reporting", flush=True)
+            return
+        if self.cancel_reason:
+            status, error = "failed", self.cancel_reason
+        elif returncode == 0:
+            status, error = "success", ""
+        else:
+            status = "failed"
+            error = "".join(self.errors).strip() or f"rclone exited with code {returncode}"
+
+        report = {
+            "status": status,
+            "error": error,
+            "bytes_transferred": int(self.stats.get("bytes") or 0),
+            "stats": self.stats
+        }
+        try:
+            await self.client.complete(self.id, self.lease_token, report)
+        except LeaseLost:
+            pass
+        except Exception as e:
+            print(f"Job {self.id}: failed to report completion: {e}", flush=True)
+        print(f"Job {self.id} completed: {status}", flush=True)
+
+    async def _run_rclone(self):
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        fd = os.open(self.config_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(self.job["rclone_config"])
+
+        helpers = []
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                *self.command(),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT,
+                limit=STREAM_LIMIT,
+                start_new_session=True
+            )
+            helpers = [
+                asyncio.create_task(self._report_progress()),
+                asyncio.create_task(self._ship_logs())
+            ]
+            with open(self.log_path, "a") as log:
+                await self._pump(log)
+            return await self.process.wait()
+        finally:
+            for task in helpers:
+                task.cancel()
+            await asyncio.gather(*helpers, return_exceptions=True)
+            if not self.lease_lost:
+                await self._ship_once()
+            for path in (self.config_path, self.rc_socket):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    async def _pump(self, log):
+        while True:
+            raw = await self.process.stdout.readline()
+            if not raw:
+                break
+            line = raw.decode(errors="replace")
+            if line.startswith("{"):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if entry is not None:
+                    if isinstance(entry.get("stats"), dict):
+                        self.stats = entry["stats"]
+                    line = format_log_entry(entry)
+                    if entry.get("level") in ("error", "critical"):
+                        self.errors.append(line)
+            log.write(line)
+            log.flush()
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            try:
+                reply = await self.client.report_progress(self.id, self.lease_token, self.stats)
+            except LeaseLost as e:
+                self.lease_lost = True
+                await self.cancel(f"Lease lost: {e}")
+                return
+            except Exception as e:
+                print(f"Job {self.id}: progress report failed: {e}", flush=True)
+                continue
+            rate = reply.get("bwlimit")
+            if rate and rate != self.bwlimit:
+                await self.set_bwlimit(rate)
+
+    async def _rc(self, method: str, params: dict):
+        async with httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=self.rc_socket), base_url="http://rc") as rc:
+            resp = await rc.post(f"/{method}", json=params)
+            resp.raise_for_status()
+
+    async def set_bwlimit(self, rate: str):
+        try:
+            await self._rc("core/bwlimit", {"rate": rate})
+            self.bwlimit = rate
+        except Exception as e:
+            print(f"Job {self.id}: could not set bandwidth limit {rate}: {e}", flush=True)
+
+    async def set_transfers(self, transfers: int):
+        try:
+            await self._rc("options/set", {"main": {"Transfers": transfers}})
+        except Exception as e:
+            print(f"Job {self.id}: could not set transfers to {transfers}: {e}", flush=True)
+
+    def _signal(self, sig) -> bool:
+        if self.process is None or self.process.returncode is not None:
+            return False
+        try:
+            os.killpg(self.process.pid, sig)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def pause(self):
+        """Freeze rclone (SIGSTOP); the lease keeps being renewed meanwhile"""
+        if self._signal(signal.SIGSTOP):
+            print(f"Job {self.id}: paused", flush=True)
+
+    def resume(self):
+        if self._signal(signal.SIGCONT):
+            print(f"Job {self.id}: resumed", flush=True)
+
+    async def _ship_logs(self):
+        while True:
+            await asyncio.sleep(LOG_SHIP_INTERVAL)
+            await self._ship_once()
+
+    async def _ship_once(self):
+        """Upload whatever the server doesn't have yet, resuming from its offset"""
+        if self.shipping_stopped:
+            return
+        try:
+            if self.shipped is None:
+                self.shipped = await self.client.log_offset(self.id)
+            size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+            while self.shipped < size:
+                with open(self.log_path, "rb") as f:
+                    f.seek(self.shipped)
+                    data = f.read(LOG_CHUNK_SIZE)
+                self.shipped = await self.client.upload_log(self.id, self.shipped, data)
+        except asyncio.CancelledError:
+            raise
+        except LogLimitReached:
+            # Retrying can't help; the server already marked its copy as truncated
+            self.shipping_stopped = True
+            with open(self.log_path, "a") as f:
+                f.write("[log shipping stopped: the server's job log size limit was reached]\n")
+            print(f"Job {self.id}: log size limit reached on the server, no longer shipping", flush=True)
+        except Exception as e:
+            # Resync the offset next time round
+            self.shipped = None
+            print(f"Job {self.id}: log upload failed: {e}", flush=True)
+
+    async def cancel(self, reason: str):
+        """Stop rclone: SIGTERM first, SIGKILL if it hasn't exited in time"""
+        self.cancel_reason = self.cancel_reason or reason
+        if not self._signal(signal.SIGTERM):
+            return
+        # A paused rclone can't act on SIGTERM until it is continued
+        self._signal(signal.SIGCONT)
+        try:
+            await asyncio.wait_for(self.process.wait(), TERMINATE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._signal(signal.SIGKILL)
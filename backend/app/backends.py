@@ -0,0 +1,127 @@
+def conf_value(value) -> str:
+    """A value for one rclone.conf line; line breaks would start a new option or [section]"""
+    value = str(value)
+    if "\n" in value or "\r" in value:
+        raise ValueError("rclone config values can't contain line breaks")
+    return value
+
+
+def section_name(remote_name) -> str:
+    """A remote name for its [section] header; brackets would end the header early"""
+    name = conf_value(remote_name).strip()
+    if not name or "[" in name or "]" in name:
+        raise ValueError(f"Invalid remote name: {remote_name!r}")
+    return name
+
+
+class Backend:
+    """How one remote type maps credentials onto an rclone.conf stanza
+
+    fields maps credential keys to rclone option names. performance holds the
+    tuned option defaults for the backend; a config can override any of them
+    through an "options" dict in its credentials.
+    """
+
+    def __init__(self, name: str, rclone_type: str, label: str, fields: dict,
+                 required: tuple = (), defaults: dict = None, performance: dict = None):
+        self.name = name
+        self.rclone_type = rclone_type
+        self.label = label
+        self.fields = fields
+        self.required = required
+        self.defaults = defaults or {}
+        self.performance = performance or {}
+
+    def validate(self, creds: dict):
+        missing = [key for key in self.required if not creds.get(key)]
+        if missing:
+            raise ValueError(f"Missing {self.name} credentials: {', '.join(missing)}")
+        self._entries(creds)
+
+    def render(self, remote_name: str, creds: dict) -> str:
+        """rclone.conf stanza for a remote of this type"""
+        lines = [f"[{section_name(remote_name)}]", f"type = {self.rclone_type}"]
+        lines += [f"{option} = {value}" for option, value in self._entries(creds)]
+        return "\n".join(lines) + "\n"
+
+    def _entries(self, creds: dict) -> list:
+        """(option, value) lines of the stanza; raises ValueError on anything that could break out of it"""
+        entries = []
+        for key, option in self.fields.items():
+            value = creds.get(key) or self.defaults.get(key)
+            if value:
+                entries.append((option, conf_value(value)))
+        options = {**self.performance, **(creds.get("options") or {})}
+        for option, value in options.items():
+            if isinstance(value, bool):
+                value = "true" if value else "false"
+            option = str(option).strip()
+            if not option or "=" in option or option[0] in "[#;":
+                raise ValueError(f"Invalid rclone option name: {option!r}")
+            entries.append((conf_value(option), conf_value(value)))
+        return entries
+
+    def schema(self) -> dict:
+        return {
+            "name": self.name,
+            "label": self.label,
+            "fields": list(self.fields),
+            "required": list(self.required),
+            "defaults": self.defaults,
+            "performance": self.performance
+        }
+
+
+BACKENDS = {}
+
+
+def register(backend: Backend):
+    BACKENDS[backend.name] = backend
+
+
+def get_backend(remote_type: str) -> Backend:
+    backend = BACKENDS.get(remote_type)
+    if not backend:
+        raise ValueError(f"Unsupported remote type: {remote_type}")
+    return backend
+
+
+register(Backend(
+    "s3", "s3", "S3 (Wasabi/AWS/compatible)",
+    fields={
+        "provider": "provider",
+        "access_key": "access_key_id",
+        "secret_key": "secret_access_key",
+        "region": "region",
+        "endpoint": "endpoint"
+    },
+    required=("access_key", "secret_key"),
+    defaults={"provider": "Wasabi", "region": "us-east-1", "endpoint": "s3.wasabisys.com"},
+    performance={
+        # Bigger parts in parallel: multipart uploads were bottlenecked on 5M parts, 4 at a time
+        "chunk_size": "32M",
+        "upload_concurrency": 8,
+        "upload_cutoff": "64M",
+        # sync compares size and modtime; hashing every large file before upload doubles the reads
+        "disable_checksum": True
+    }
+))
+
+register(Backend(
+    "gdrive", "drive", "Google Drive",
+    fields={
+        "client_id": "client_id",
+        "client_secret": "client_secret",
+        "token": "token"
+    },
+    required=("client_id", "client_secret", "token"),
+    performance={
+        # Fewer, larger upload requests; Drive rate-limits per request
+        "chunk_size": "64M"
+    }
+))
+
+register(Backend(
+    "local", "local", "Local / mounted filesystem",
+    fields={}
+))
@@ -0,0 +1,305 @@
+import asyncio
+import logging
+import os
+import re
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Total upload rate shared by all running jobs, as an rclone --bwlimit value or
+# timetable (e.g. "08:00,20M 18:00,200M 23:00,off"); unset means no budget
+BANDWIDTH_BUDGET = os.environ.get("BANDWIDTH_BUDGET", "")
+BANDWIDTH_REBALANCE_SECONDS = int(os.environ.get("BANDWIDTH_REBALANCE_SECONDS", "15"))
+# No running job is squeezed below this, however many share the budget
+BANDWIDTH_MIN_RATE = 256 * 1024
+# Smaller changes to a job's allocation aren't worth an rc call
+BANDWIDTH_CHANGE_THRESHOLD = 0.1
+# A job moving less than this fraction of its allocation is limited by something
+# else (disk, remote, small files); it keeps a margin above its speed and the
+# rest goes to jobs that can use it
+BANDWIDTH_UNDERUSE = 0.7
+BANDWIDTH_HEADROOM = 1.5
+
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+UNITS = {"b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+RATE_RE = re.compile(r"^(\d+(?:\.\d+)?)([bkmgt]?)$", re.IGNORECASE)
+ENTRY_RE = re.compile(r"^(?:([a-z]{3})-)?(\d{1,2}):(\d{2}),(.+)$", re.IGNORECASE)
+
+
+def parse_rate(value: str):
+    """Bytes/s of an rclone bandwidth value; None for "off"
+
+    "UP:DOWN" pairs give the upload rate, which is what backups use. A bare
+    number is in KiB/s, as in rclone.
+    """
+    value = value.split(":", 1)[0].strip()
+    if value.lower() in ("off", ""):
+        return None
+    match = RATE_RE.match(value)
+    if not match:
+        raise ValueError(f"Invalid bandwidth value: {value}")
+    number, unit = match.groups()
+    return float(number) * UNITS[(unit or "k").lower()]
+
+
+def parse_schedule(text: str) -> list:
+    """Sorted (minute of week, bytes/s or None) entries of an rclone --bwlimit timetable"""
+    tokens = text.split()
+    if len(tokens) == 1 and "," not in tokens[0]:
+        return [(0, parse_rate(tokens[0]))]
+    entries = []
+    for token in tokens:
+        match = ENTRY_RE.match(token)
+        if not match:
+            raise ValueError(f"Invalid bandwidth timetable entry: {token}")
+        day, hour, minute, rate = match.groups()
+        hour, minute = int(hour), int(minute)
+        if hour > 23 or minute > 59:
+            raise ValueError(f"Invalid time in bandwidth timetable: {token}")
+        if day and day.lower() not in DAYS:
+            raise ValueError(f"Invalid day in bandwidth timetable: {token}")
+        rate = parse_rate(rate)
+        days = [DAYS.index(day.lower())] if day else range(7)
+        entries += [(d * 1440 + hour * 60 + minute, rate) for d in days]
+    return sorted(entries)
+
+
+def validate_schedule(text: str):
+    if text:
+        parse_schedule(text)
+
+
+def rate_at(text: str, now: datetime = None):
+    """Limit a timetable sets at local time now; None for unlimited"""
+    if not text:
+        return None
+    entries = parse_schedule(text)
+    now = now or datetime.now()
+    minute = now.weekday() * 1440 + now.hour * 60 + now.minute
+    # Before the first entry of the week, the last one is still in force
+    current = entries[-1][1]
+    for start, rate in entries:
+        if start > minute:
+            break
+        current = rate
+    return current
+
+
+def format_rate(rate) -> str:
+    """Bytes/s as an rclone bandwidth value"""
+    if rate is None:
+        return "off"
+    return f"{max(int(rate // 1024), 1)}k"
+
+
+def water_fill(budget: float, caps: dict) -> dict:
+    """Max-min fair split of budget; a cap of None wants as much as it can get"""
+    allocation = {}
+    remaining = dict(caps)
+    left = budget
+    while remaining:
+        share = left / len(remaining)
+        satisfied = {key: cap for key, cap in remaining.items() if cap is not None and cap <= share}
+        if not satisfied:
+            for key in remaining:
+                allocation[key] = share
+            break
+        for key, cap in satisfied.items():
+            allocation[key] = cap
+            left -= cap
+            del remaining[key]
+    return allocation
+
+
+class Flow:
+    """A running job the allocator hands bandwidth to"""
+
+    def __init__(self, job_id: int, sink_key, schedule: str = None,
+                 group=None, group_schedule: str = None, ttl: float = None):
+        self.job_id = job_id
+        self.sink_key = sink_key
+        self.schedule = schedule
+        self.group = group
+        self.group_schedule = group_schedule
+        self.ttl = ttl
+        self.speed = None
+        self.allocated = None
+        self.seen = asyncio.get_running_loop().time()
+
+
+class BandwidthAllocator:
+    """Splits a global bandwidth budget across running jobs and resizes them live
+
+    Each job's own timetable (config bwlimit) caps it, and jobs in a group (an
+    agent) share the group's timetable. What is left of the budget is split
+    max-min fairly: jobs that can't use their share keep what they use plus a
+    margin, and the rest is divided among the others, so the total stays high.
+
+    Allocations are applied through sinks, one per rate limiter: a local rclone
+    process, a shared rcd daemon (which gets the sum of its jobs) or an agent.
+    """
+
+    def __init__(self, budget: str = BANDWIDTH_BUDGET):
+        validate_schedule(budget)
+        self.budget = budget
+        self.flows = {}  # job_id -> Flow
+        self.sinks = {}  # sink key -> async callable(rate string), returns False if not ready
+        self.applied = {}  # sink key -> bytes/s last pushed (None = off); absent if never limited
+        self.wake = None
+        self.task = None
+
+    def start(self):
+        self.wake = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    def add(self, job_id: int, sink_key, sink, schedule: str = None,
+            group=None, group_schedule: str = None, ttl: float = None):
+        """Start allocating to a job; ttl drops it if not reported on for that long"""
+        self.flows[job_id] = Flow(job_id, sink_key, schedule, group, group_schedule, ttl)
+        self.sinks[sink_key] = sink
+        self._kick()
+
+    def remove(self, job_id: int):
+        if self.flows.pop(job_id, None):
+            self._kick()
+
+    def override(self, job_id: int, schedule: str) -> bool:
+        """Replace a running job's own limit; False if the job isn't tracked"""
+        flow = self.flows.get(job_id)
+        if flow is None:
+            return False
+        flow.schedule = schedule
+        self._kick()
+        return True
+
+    def report(self, job_id: int, speed: float):
+        """Latest measured transfer rate of a job, in bytes/s"""
+        flow = self.flows.get(job_id)
+        if flow:
+            flow.speed = speed
+            flow.seen = asyncio.get_running_loop().time()
+
+    def allocated(self, job_id: int):
+        """Current allocation of a job as an rclone bandwidth value, or None if unmanaged"""
+        flow = self.flows.get(job_id)
+        if flow is None or flow.sink_key not in self.applied:
+            return None
+        return format_rate(flow.allocated)
+
+    def _kick(self):
+        if self.wake:
+            self.wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), BANDWIDTH_REBALANCE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            try:
+                await self.rebalance()
+            except Exception as e:
+                logger.warning("Bandwidth rebalance failed: %s", e)
+
+    def _demand(self, flow: Flow, now: datetime):
+        """What a job can use right now: its own timetable, less if it is underusing"""
+        cap = rate_at(flow.schedule, now)
+        if flow.speed is not None and flow.allocated is not None and flow.speed < flow.allocated * BANDWIDTH_UNDERUSE:
+            wanted = max(flow.speed * BANDWIDTH_HEADROOM, BANDWIDTH_MIN_RATE)
+            cap = wanted if cap is None else min(cap, wanted)
+        return cap
+
+    def allocate(self, now: datetime = None) -> dict:
+        """Bytes/s (None = unlimited) for every flow"""
+        now = now or datetime.now()
+        caps = {job_id: self._demand(flow, now) for job_id, flow in self.flows.items()}
+
+        # Jobs in a group first split the group's limit among themselves
+        groups = {}
+        for job_id, flow in self.flows.items():
+            if flow.group is not None and flow.group_schedule:
+                groups.setdefault(flow.group, []).append(job_id)
+        for job_ids in groups.values():
+            limit = rate_at(self.flows[job_ids[0]].group_schedule, now)
+            if limit is not None:
+                caps.update(water_fill(limit, {job_id: caps[job_id] for job_id in job_ids}))
+
+        budget = rate_at(self.budget, now)
+        if budget is None:
+            return caps
+        allocation = water_fill(budget, caps)
+        return {job_id: max(rate, BANDWIDTH_MIN_RATE) for job_id, rate in allocation.items()}
+
+    async def rebalance(self):
+        loop = asyncio.get_running_loop()
+        for job_id, flow in list(self.flows.items()):
+            if flow.ttl and loop.time() - flow.seen > flow.ttl:
+                del self.flows[job_id]
+
+        allocation = self.allocate()
+        totals = {}
+        for job_id, rate in allocation.items():
+            flow = self.flows[job_id]
+            flow.allocated = rate
+            key = flow.sink_key
+            if key not in totals:
+                totals[key] = rate
+            elif totals[key] is None or rate is None:
+                totals[key] = None
+            else:
+                totals[key] += rate
+
+        # Sinks whose last job finished go back to unlimited
+        for key in self.applied:
+            totals.setdefault(key, None)
+
+        for key, rate in totals.items():
+            if key not in self.applied:
+                if rate is None:
+                    continue  # Never limited; the job's own --bwlimit is in charge
+            elif not self._changed(self.applied[key], rate):
+                continue
+            try:
+                if await self.sinks[key](format_rate(rate)) is False:
+                    continue  # Not reachable yet (process still starting); retried next round
+                self.applied[key] = rate
+            except Exception as e:
+                logger.warning("Failed to set bandwidth for %s: %s", key, e)
+
+        active = {flow.sink_key for flow in self.flows.values()}
+        for key in list(self.sinks):
+            if key not in active:
+                self.sinks.pop(key)
+                self.applied.pop(key, None)
+
+    def _changed(self, old, new) -> bool:
+        if old is None or new is None:
+            return old is not new
+        return abs(new - old) > old * BANDWIDTH_CHANGE_THRESHOLD
+
+    def status(self) -> dict:
+        now = datetime.now()
+        budget = rate_at(self.budget, now)
+        return {
+            "budget": self.budget or None,
+            "budget_now": format_rate(budget) if self.budget else None,
+            "jobs": [
+                {
+                    "job_id": flow.job_id,
+                    "schedule": flow.schedule,
+                    "group": flow.group,
+                    "speed": flow.speed,
+                    "allocated": format_rate(flow.allocated) if flow.sink_key in self.applied else None
+                }
+                for flow in self.flows.values()
+            ]
+        }
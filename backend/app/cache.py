@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CREDENTIAL_CACHE_TTL = int(os.environ.get("CREDENTIAL_CACHE_TTL", "300"))
+CREDENTIAL_CACHE_SIZE = int(os.environ.get("CREDENTIAL_CACHE_SIZE", "256"))
+
+
+class CachedSecret:
+    def __init__(self, plaintext: bytes, value, ttl: int):
+        # Our own mutable copy of the plaintext, so it can be zeroed on eviction
+        self.buffer = bytearray(plaintext)
+        self.value = value
+        self.expires_at = time.monotonic() + ttl
+
+    def wipe(self):
+        for i in range(len(self.buffer)):
+            self.buffer[i] = 0
+        if isinstance(self.value, dict):
+            self.value.clear()
+        self.value = None
+
+
+class SecretCache:
+    """LRU + TTL cache for decrypted credentials and rendered remote stanzas
+
+    Keys are (kind, object id, updated_at) so an edited row never hits a stale
+    entry. Evicted entries are wiped: the plaintext buffer is zeroed and dicts
+    are cleared. Python strings handed out to callers can't be wiped, so keep
+    them short-lived.
+    """
+
+    def __init__(self, max_entries: int = CREDENTIAL_CACHE_SIZE, ttl: int = CREDENTIAL_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        # Sync endpoints run in FastAPI's threadpool
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at < time.monotonic():
+                self._evict(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry.value
+
+    def put(self, key, plaintext: bytes, value):
+        with self.lock:
+            if key in self.entries:
+                self._evict(key)
+            self.entries[key] = CachedSecret(plaintext, value, self.ttl)
+            while len(self.entries) > self.max_entries:
+                self._evict(next(iter(self.entries)))
+
+    def invalidate(self, kind: str, obj_id: int):
+        """Drop every entry for an object, whatever its updated_at"""
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == kind and k[1] == obj_id]:
+                self._evict(key)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self._evict(key)
+
+    def _evict(self, key):
+        self.entries.pop(key).wipe()
@@ -0,0 +1,129 @@
+import fcntl
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# Write a minimal rclone.conf per job instead of pointing every sync at the shared one
+PER_JOB_CONFIG = os.environ.get("RCLONE_PER_JOB_CONFIG", "0") == "1"
+
+
+def parse_sections(text: str) -> dict:
+    """{remote name: stanza text} in file order"""
+    sections = {}
+    name = None
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('[') and stripped.endswith(']'):
+            if name is not None:
+                sections[name] = _stanza(lines)
+            name = stripped[1:-1]
+            lines = [stripped]
+        elif name is not None:
+            lines.append(line)
+    if name is not None:
+        sections[name] = _stanza(lines)
+    return sections
+
+
+def _stanza(lines: list) -> str:
+    return '\n'.join(lines).strip() + '\n'
+
+
+class ConfigStore:
+    """rclone.conf kept as an index of sections
+
+    Updates touch one section in memory and are written out through a temp file
+    and os.replace(), so a sync starting at the same moment reads either the old
+    or the new file, never a half-written one. An flock on a sidecar lock file
+    serializes writers across processes; if the file changed underneath us the
+    index is re-read before applying the update.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.jobs_dir = os.path.join(os.path.dirname(path), "jobs")
+        self.sections = {}
+        self.mtime = None
+        # Bumped on every write so cached readers (rcd daemons) know to reload
+        self.version = 0
+        self.mutex = threading.Lock()
+        with self._locked():
+            self._reload_if_changed()
+
+    @contextmanager
+    def _locked(self):
+        with self.mutex:
+            with open(self.lock_path, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self.sections = {}
+            self.mtime = None
+            return
+        if mtime != self.mtime:
+            with open(self.path, 'r') as f:
+                self.sections = parse_sections(f.read())
+            self.mtime = mtime
+
+    def _write(self):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".rclone.conf.")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write('\n'.join(self.sections.values()))
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+        self.mtime = os.stat(self.path).st_mtime_ns
+        self.version += 1
+
+    def get(self, name: str):
+        return self.sections.get(name)
+
+    def set(self, name: str, stanza: str):
+        """Add or replace one remote"""
+        stanza = _stanza(stanza.splitlines())
+        with self._locked():
+            self._reload_if_changed()
+            if self.sections.get(name) == stanza:
+                return
+            self.sections[name] = stanza
+            self._write()
+
+    def delete(self, name: str):
+        with self._locked():
+            self._reload_if_changed()
+            if self.sections.pop(name, None) is None:
+                return
+            self._write()
+
+    def write_job_config(self, job_id: int, names: list) -> str:
+        """A private rclone.conf holding only the remotes one job needs"""
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        path = os.path.join(self.jobs_dir, f"{job_id}.conf")
+        with self._locked():
+            self._reload_if_changed()
+            stanzas = [self.sections[name] for name in names if name in self.sections]
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(stanzas))
+        return path
+
+    def remove_job_config(self, job_id: int):
+        try:
+            os.remove(os.path.join(self.jobs_dir, f"{job_id}.conf"))
+        except FileNotFoundError:
+            pass
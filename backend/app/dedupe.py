@@ -0,0 +1,370 @@
+import gzip
+import hashlib
+import json
+import os
+import random
+import shutil
+from datetime import datetime
+from .prescan import scan
+
+DEDUPE_DIR = os.environ.get("DEDUPE_DIR", "/app/data/dedupe")
+# New chunks are staged locally and uploaded in batches of about this size
+DEDUPE_STAGE_BYTES = int(os.environ.get("DEDUPE_STAGE_MB", "512")) * 1024 * 1024
+CHUNK_MIN = 256 * 1024
+CHUNK_MAX = 4 * 1024 * 1024
+# A chunk ends where the anchor pattern shows up: on random data once every
+# 2**ANCHOR_BITS bytes past CHUNK_MIN, so about 768 KiB on average
+ANCHOR_BITS = 19
+READ_BLOCK = 16 * 1024 * 1024
+DIGEST_SIZE = 32
+MANIFEST_VERSION = 1
+
+# Fixed forever: changing these moves every chunk boundary (and so re-uploads everything)
+_rnd = random.Random(0x6465647570)
+
+
+def _bit_table() -> bytes:
+    order = list(range(256))
+    _rnd.shuffle(order)
+    return bytes(1 if order[b] < 128 else 0 for b in range(256))
+
+
+BIT_TABLE = _bit_table()
+PREV_BIT_TABLE = _bit_table()
+ANCHOR = bytes(_rnd.choice((0, 1)) for _ in range(ANCHOR_BITS))
+
+
+def _project(data: bytes) -> bytes:
+    """One 0/1 byte per input byte, mixing each byte with the one before it
+
+    Boundaries are searched for in this projection with bytes.find, which keeps
+    content-defined chunking at C speed; a per-byte rolling hash in Python
+    manages only a few MB/s.
+    """
+    current = int.from_bytes(data.translate(BIT_TABLE), "little")
+    previous = int.from_bytes(data.translate(PREV_BIT_TABLE), "little") << 8
+    return (current ^ previous).to_bytes(len(data) + 1, "little")[:len(data)]
+
+
+def cut_points(data: bytes, final: bool) -> list:
+    """End offsets of the chunks in data
+
+    Unless final, bytes after the last offset can't be cut yet and belong to
+    the next read. A buffer always starts at a chunk boundary, so the result is
+    the same however a file is read.
+    """
+    bits = _project(data)
+    cuts, start, n = [], 0, len(data)
+    while start < n:
+        if n - start <= CHUNK_MIN:
+            if final:
+                cuts.append(n)
+            break
+        found = bits.find(ANCHOR, start + CHUNK_MIN - ANCHOR_BITS, start + CHUNK_MAX)
+        if found >= 0:
+            end = found + ANCHOR_BITS
+        elif final or start + CHUNK_MAX <= n:
+            end = min(start + CHUNK_MAX, n)
+        else:
+            break
+        cuts.append(end)
+        start = end
+    return cuts
+
+
+def iter_chunks(f):
+    """Content-defined chunks of a binary file object"""
+    buf = b""
+    while True:
+        block = f.read(READ_BLOCK)
+        final = not block
+        buf = buf + block if buf else block
+        start = 0
+        for end in cut_points(buf, final):
+            yield buf[start:end]
+            start = end
+        buf = buf[start:]
+        if final:
+            return
+
+
+def chunk_path(digest: str) -> str:
+    """Where a chunk lives under the repository (and under staging dirs)"""
+    return f"chunks/{digest[:2]}/{digest}"
+
+
+def state_dir(config_id: int) -> str:
+    return f"{DEDUPE_DIR}/config_{config_id}"
+
+
+class ChunkIndex:
+    """Digests of the chunks known to be in a config's repository
+
+    Kept as an append-only file of raw 32-byte digests; a digest is added only
+    after its upload succeeded.
+    """
+
+    def __init__(self, config_id: int):
+        self.path = f"{state_dir(config_id)}/chunks.idx"
+        self.known = set()
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            self.known = {data[i:i + DIGEST_SIZE] for i in range(0, len(data) - DIGEST_SIZE + 1, DIGEST_SIZE)}
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def __contains__(self, digest: str) -> bool:
+        return bytes.fromhex(digest) in self.known
+
+    def add(self, digests):
+        raw = [bytes.fromhex(digest) for digest in digests]
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(b"".join(raw))
+        self.known.update(raw)
+
+    def replace(self, digests):
+        """Rewrite the index with exactly these digests (after a garbage collection)"""
+        raw = {bytes.fromhex(digest) for digest in digests}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(sorted(raw)))
+        os.replace(tmp, self.path)
+        self.known = raw
+
+
+def manifest_name(snapshot: str) -> str:
+    return f"snapshots/{snapshot}.jsonl.gz"
+
+
+def snapshot_of(name: str):
+    """Snapshot name of a manifest file name, or None if it isn't one"""
+    name = name.rsplit("/", 1)[-1]
+    return name[:-len(".jsonl.gz")] if name.endswith(".jsonl.gz") else None
+
+
+def write_manifest(path: str, header: dict, files: list):
+    """A header line, then one JSON line per file: path, size, mtime_ns, mode, [[digest, size], ...]"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as f:
+        f.write(json.dumps({"version": MANIFEST_VERSION, **header}) + "\n")
+        for entry in files:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+    os.replace(tmp, path)
+
+
+def read_manifest(path: str) -> tuple:
+    """(header, [file entries]) of a manifest"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version in {path}")
+        return header, [json.loads(line) for line in f]
+
+
+def local_snapshots(config_id: int) -> list:
+    """Snapshot names with a local manifest copy, oldest first"""
+    directory = f"{state_dir(config_id)}/snapshots"
+    if not os.path.isdir(directory):
+        return []
+    return sorted(filter(None, (snapshot_of(name) for name in os.listdir(directory))))
+
+
+def local_manifest(config_id: int, snapshot: str) -> str:
+    return f"{state_dir(config_id)}/{manifest_name(snapshot)}"
+
+
+def remove_state(config_id: int):
+    shutil.rmtree(state_dir(config_id), ignore_errors=True)
+
+
+class SnapshotBuilder:
+    """Chunks a source tree into new chunks plus a manifest
+
+    Blocking; runs in a worker thread. New chunks are written under staging
+    and flush() is called whenever about DEDUPE_STAGE_BYTES are waiting; it
+    must upload the staging directory and empty it. Files unchanged since the
+    previous snapshot (same size, mtime and inode) reuse its chunk list
+    without being read.
+    """
+
+    def __init__(self, config_id: int, source: str, index: ChunkIndex, flush):
+        self.config_id = config_id
+        self.source = source
+        self.index = index
+        self.flush = flush
+        self.staging = f"{state_dir(config_id)}/staging"
+        self.staged = {}  # digest -> size, waiting for upload
+        self.staged_bytes = 0
+        self.previous = {}
+        self.stats = {"files": 0, "bytes": 0, "reused_files": 0, "new_chunks": 0, "new_bytes": 0, "chunks": 0}
+
+        snapshots = local_snapshots(config_id)
+        if snapshots:
+            header, entries = read_manifest(local_manifest(config_id, snapshots[-1]))
+            if header.get("source") == source:
+                self.previous = {entry["path"]: entry for entry in entries}
+
+    def build(self, snapshot: str, remote: str) -> str:
+        """Chunk and upload everything, then stage the manifest; returns its local copy's path"""
+        shutil.rmtree(self.staging, ignore_errors=True)
+        files = []
+        for path, (size, mtime, inode) in sorted(scan(self.source).items()):
+            entry = self._file_entry(path, size, mtime, inode)
+            if entry is not None:
+                files.append(entry)
+        self._flush()
+
+        header = {
+            "snapshot": snapshot,
+            "source": self.source,
+            "remote": remote,
+            "created_at": datetime.utcnow().isoformat(),
+            "files": len(files),
+            "bytes": self.stats["bytes"]
+        }
+        staged_manifest = f"{self.staging}/{manifest_name(snapshot)}"
+        write_manifest(staged_manifest, header, files)
+        self.flush(self.staging)
+        local = local_manifest(self.config_id, snapshot)
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        os.replace(staged_manifest, local)
+        shutil.rmtree(self.staging, ignore_errors=True)
+        return local
+
+    def _file_entry(self, path: str, size: int, mtime: int, inode: int):
+        full = os.path.join(self.source, path)
+        previous = self.previous.get(path)
+        if (previous and previous["size"] == size and previous["mtime_ns"] == mtime
+                and previous.get("inode") == inode
+                and all(digest in self.index for digest, _ in previous["chunks"])):
+            chunks = previous["chunks"]
+            mode = previous["mode"]
+            self.stats["reused_files"] += 1
+        else:
+            try:
+                mode = os.stat(full).st_mode & 0o7777
+                chunks = []
+                with open(full, "rb") as f:
+                    for data in iter_chunks(f):
+                        chunks.append([self._store(data), len(data)])
+            except FileNotFoundError:
+                return None  # Deleted since the scan
+            size = sum(length for _, length in chunks)
+        self.stats["files"] += 1
+        self.stats["bytes"] += size
+        self.stats["chunks"] += len(chunks)
+        return {"path": path, "size": size, "mtime_ns": mtime, "inode": inode, "mode": mode, "chunks": chunks}
+
+    def _store(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in self.staged or digest in self.index:
+            return digest
+        path = f"{self.staging}/{chunk_path(digest)}"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        self.staged[digest] = len(data)
+        self.staged_bytes += len(data)
+        self.stats["new_chunks"] += 1
+        self.stats["new_bytes"] += len(data)
+        if self.staged_bytes >= DEDUPE_STAGE_BYTES:
+            self._flush()
+        return digest
+
+    def _flush(self):
+        if not self.staged:
+            return
+        self.flush(self.staging)
+        self.index.add(self.staged)
+        shutil.rmtree(self.staging, ignore_errors=True)
+        self.staged = {}
+        self.staged_bytes = 0
+
+
+def _target_path(target: str, path: str) -> str:
+    """Where a manifest path is restored; refuses paths that would land outside target"""
+    root = os.path.normpath(target)
+    full = os.path.normpath(os.path.join(root, path))
+    if os.path.isabs(path) or not full.startswith(root.rstrip(os.sep) + os.sep):
+        raise ValueError(f"Manifest path escapes the restore target: {path}")
+    return full
+
+
+def restore_snapshot(config_id: int, manifest_path: str, target: str, fetch, prefix: str = "") -> dict:
+    """Rebuild the files of a snapshot (those under prefix) in target
+
+    Blocking; runs in a worker thread. fetch(digests, directory) must download
+    those chunks to directory/chunks/xx/digest. Chunks are fetched in batches
+    of about DEDUPE_STAGE_BYTES and checked against their digest.
+    """
+    _, entries = read_manifest(manifest_path)
+    prefix = prefix.strip("/")
+    if prefix:
+        entries = [entry for entry in entries if entry["path"] == prefix or entry["path"].startswith(f"{prefix}/")]
+    cache = f"{state_dir(config_id)}/restore"
+    stats = {"files": 0, "bytes": 0}
+
+    # (entry, chunk index) in file order, cut into download batches
+    batches, batch, batch_bytes, seen = [], [], 0, set()
+    for entry in entries:
+        if not entry["chunks"]:
+            batch.append((entry, None))
+        for position, (digest, size) in enumerate(entry["chunks"]):
+            if digest not in seen:
+                if batch_bytes + size > DEDUPE_STAGE_BYTES and batch:
+                    batches.append(batch)
+                    batch, batch_bytes, seen = [], 0, set()
+                seen.add(digest)
+                batch_bytes += size
+            batch.append((entry, position))
+    if batch:
+        batches.append(batch)
+
+    def finish(entry):
+        path = _target_path(target, entry["path"])
+        if os.path.getsize(path) != entry["size"]:
+            raise ValueError(f"Restored size of {entry['path']} does not match the manifest")
+        os.chmod(path, entry["mode"])
+        os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+        stats["files"] += 1
+        stats["bytes"] += entry["size"]
+
+    try:
+        for batch in batches:
+            shutil.rmtree(cache, ignore_errors=True)
+            digests = sorted({entry["chunks"][position][0] for entry, position in batch if position is not None})
+            if digests:
+                fetch(digests, cache)
+            for entry, position in batch:
+                path = _target_path(target, entry["path"])
+                if position is None or position == 0:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    open(path, "wb").close()
+                if position is not None:
+                    digest = entry["chunks"][position][0]
+                    with open(f"{cache}/{chunk_path(digest)}", "rb") as f:
+                        data = f.read()
+                    if hashlib.sha256(data).hexdigest() != digest:
+                        raise ValueError(f"Chunk {digest} is corrupt")
+                    with open(path, "ab") as out:
+                        out.write(data)
+                if position is None or position == len(entry["chunks"]) - 1:
+                    finish(entry)
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
+    return stats
+
+
+def referenced_chunks(manifest_paths: list) -> set:
+    """Digests used by any of these manifests"""
+    used = set()
+    for path in manifest_paths:
+        _, entries = read_manifest(path)
+        for entry in entries:
+            used.update(digest for digest, _ in entry["chunks"])
+    return used
@@ -0,0 +1,111 @@
+import asyncio
+from collections import deque
+
+LONG_POLL_MAX_WAIT = 60
+# Control messages kept for an agent that isn't polling for them
+CONTROL_QUEUE_SIZE = 100
+
+
+class AgentConnection:
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.lock = asyncio.Lock()
+
+    async def send(self, message: dict):
+        async with self.lock:
+            await self.websocket.send_json(message)
+
+
+class AgentHub:
+    """Wakes agents as soon as work is queued for them
+
+    Agents either hold a WebSocket open (messages are pushed) or long-poll the
+    jobs endpoint (the waiting request is woken up). Control messages for
+    running jobs (cancel, pause, ...) are queued for polling agents and handed
+    out by the control long-poll.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.events = {}  # agent_id -> asyncio.Event for long-polls
+        self.connections = {}  # agent_id -> set of AgentConnection
+        self.controls = {}  # agent_id -> deque of control messages for polling agents
+        self.control_events = {}
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+
+    def _event(self, agent_id: int) -> asyncio.Event:
+        if agent_id not in self.events:
+            self.events[agent_id] = asyncio.Event()
+        return self.events[agent_id]
+
+    def notify(self, agent_id: int, message: dict = None):
+        """Tell an agent there is work (or another message) for it; safe from any thread"""
+        message = message or {"type": "jobs_available"}
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._notify(agent_id, message)
+        elif self.loop:
+            self.loop.call_soon_threadsafe(self._notify, agent_id, message)
+
+    def _notify(self, agent_id: int, message: dict):
+        if message["type"] == "jobs_available":
+            self._event(agent_id).set()
+        elif not self.is_connected(agent_id):
+            self.controls.setdefault(agent_id, deque(maxlen=CONTROL_QUEUE_SIZE)).append(message)
+            self._control_event(agent_id).set()
+        for conn in list(self.connections.get(agent_id, ())):
+            asyncio.create_task(self._send(agent_id, conn, message))
+
+    async def _send(self, agent_id: int, conn: AgentConnection, message: dict):
+        try:
+            await conn.send(message)
+        except Exception:
+            self.disconnect(agent_id, conn)
+
+    async def wait(self, agent_id: int, timeout: float) -> bool:
+        """Block a long-poll until notify() or timeout; True if woken"""
+        event = self._event(agent_id)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            event.clear()
+
+    def _control_event(self, agent_id: int) -> asyncio.Event:
+        if agent_id not in self.control_events:
+            self.control_events[agent_id] = asyncio.Event()
+        return self.control_events[agent_id]
+
+    async def wait_control(self, agent_id: int, timeout: float) -> list:
+        """Pending control messages, waiting up to timeout for one if there are none"""
+        if not self.controls.get(agent_id):
+            event = self._control_event(agent_id)
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                event.clear()
+        return list(self.controls.pop(agent_id, ()))
+
+    def connect(self, agent_id: int, websocket) -> AgentConnection:
+        conn = AgentConnection(websocket)
+        self.connections.setdefault(agent_id, set()).add(conn)
+        return conn
+
+    def disconnect(self, agent_id: int, conn: AgentConnection):
+        conns = self.connections.get(agent_id)
+        if conns:
+            conns.discard(conn)
+            if not conns:
+                del self.connections[agent_id]
+
+    def is_connected(self, agent_id: int) -> bool:
+        return agent_id in self.connections
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import signal
+from collections import deque
+
+# rclone can emit very long lines (e.g. file names in error messages)
+STREAM_LIMIT = 1024 * 1024
+STDERR_TAIL_LINES = 20
+# rclone gets this long to exit after SIGTERM before it is killed
+TERMINATE_TIMEOUT = 10
+
+
+class ProcessResult:
+    def __init__(self, returncode: int, stderr_tail: str):
+        self.returncode = returncode
+        self.stderr_tail = stderr_tail
+
+
+class ProcessEngine:
+    """Runs rclone processes on the event loop and tracks their handles"""
+
+    def __init__(self):
+        self.processes = {}
+
+    def is_running(self, job_id: int) -> bool:
+        return job_id in self.processes
+
+    async def run(self, job_id: int, cmd: list, log_file: str, on_line=None) -> ProcessResult:
+        """Start cmd, stream stdout/stderr into log_file and wait for exit
+
+        on_line is called with every output line and returns the text to log.
+        """
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=STREAM_LIMIT,
+            # Own process group, so signals reach anything rclone spawned too
+            start_new_session=True
+        )
+        self.processes[job_id] = proc
+        tail = deque(maxlen=STDERR_TAIL_LINES)
+
+        try:
+            with open(log_file, 'a') as log:
+                await asyncio.gather(
+                    self._pump(proc.stdout, log, on_line),
+                    self._pump(proc.stderr, log, on_line, tail)
+                )
+            returncode = await proc.wait()
+        finally:
+            self.processes.pop(job_id, None)
+
+        return ProcessResult(returncode, ''.join(tail))
+
+    def _signal(self, job_id: int, sig) -> bool:
+        proc = self.processes.get(job_id)
+        if proc is None or proc.returncode is not None:
+            return False
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def pause(self, job_id: int) -> bool:
+        """Freeze a running job (SIGSTOP); its connections idle until resume"""
+        return self._signal(job_id, signal.SIGSTOP)
+
+    def resume(self, job_id: int) -> bool:
+        return self._signal(job_id, signal.SIGCONT)
+
+    async def terminate(self, job_id: int) -> bool:
+        """Stop a job's rclone: SIGTERM, then SIGKILL if it hasn't exited in time"""
+        proc = self.processes.get(job_id)
+        if not self._signal(job_id, signal.SIGTERM):
+            return False
+        # A paused process can't act on SIGTERM until it is continued
+        self._signal(job_id, signal.SIGCONT)
+        try:
+            await asyncio.wait_for(proc.wait(), TERMINATE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._signal(job_id, signal.SIGKILL)
+        return True
+
+    async def terminate_all(self):
+        await asyncio.gather(*(self.terminate(job_id) for job_id in list(self.processes)))
+
+    async def _pump(self, stream, log, on_line, tail=None):
+        while True:
+            raw = await stream.readline()
+            if not raw:
+                break
+            line = raw.decode(errors='replace')
+            if on_line:
+                line = on_line(line)
+            log.write(line)
+            log.flush()
+            if tail is not None:
+                tail.append(line)
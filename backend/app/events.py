@@ -0,0 +1,70 @@
+import asyncio
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from .models import BackupJob
+
+
+class EventBus:
+    """In-process job status notifications
+
+    Status changes are collected per session and published once the session
+    commits, so listeners never see a status that was rolled back.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.listeners = {}  # job_id -> set of callbacks run on the event loop
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+
+    def subscribe(self, job_id: int, callback):
+        self.listeners.setdefault(job_id, set()).add(callback)
+
+    def unsubscribe(self, job_id: int, callback):
+        callbacks = self.listeners.get(job_id)
+        if callbacks:
+            callbacks.discard(callback)
+            if not callbacks:
+                del self.listeners[job_id]
+
+    def publish(self, job_id: int, status: str):
+        """Safe from any thread; callbacks always run on the event loop"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._publish(job_id, status)
+        elif self.loop:
+            self.loop.call_soon_threadsafe(self._publish, job_id, status)
+
+    def _publish(self, job_id: int, status: str):
+        for callback in list(self.listeners.get(job_id, ())):
+            callback(status)
+
+
+bus = EventBus()
+
+
+def record_status(session: Session, job_id: int, status: str):
+    """Queue a status change made outside the ORM (bulk UPDATE) for publishing on commit"""
+    session.info.setdefault("job_status", {})[job_id] = status
+
+
+@event.listens_for(BackupJob.status, "set")
+def _status_set(target, value, oldvalue, initiator):
+    session = object_session(target)
+    if session is not None and target.id is not None and value != oldvalue:
+        record_status(session, target.id, value)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_statuses(session):
+    for job_id, status in session.info.pop("job_status", {}).items():
+        bus.publish(job_id, status)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_statuses(session):
+    session.info.pop("job_status", None)
@@ -0,0 +1,118 @@
+import asyncio
+import heapq
+import itertools
+import os
+from datetime import datetime
+
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", "4"))
+MAX_JOBS_PER_REMOTE = int(os.environ.get("MAX_JOBS_PER_REMOTE", "2"))
+MAX_JOBS_PER_ENDPOINT = int(os.environ.get("MAX_JOBS_PER_ENDPOINT", "3"))
+
+# Lower runs first
+PRIORITY_MANUAL = 0
+PRIORITY_SCHEDULED = 10
+
+
+class QueuedJob:
+    def __init__(self, job_id: int, config_id: int, slot_keys: list, priority: int, run):
+        self.job_id = job_id
+        self.config_id = config_id
+        self.slot_keys = slot_keys  # e.g. [("remote", "wasabi"), ("endpoint", "s3.wasabisys.com")]
+        self.priority = priority
+        self.run = run  # coroutine function started when slots are free
+        self.enqueued_at = datetime.utcnow()
+        self.started_at = None
+
+
+class JobExecutor:
+    """Priority queue of local backup jobs with global and per-remote/endpoint slot limits"""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_JOBS,
+                 max_per_remote: int = MAX_JOBS_PER_REMOTE,
+                 max_per_endpoint: int = MAX_JOBS_PER_ENDPOINT):
+        self.max_concurrent = max_concurrent
+        self.limits = {"remote": max_per_remote, "endpoint": max_per_endpoint}
+        self.queue = []  # heap of (priority, seq, QueuedJob)
+        self.running = {}  # job_id -> QueuedJob
+        self.slots = {}  # slot key -> jobs holding it
+        self.tasks = {}
+        self._seq = itertools.count()
+
+    def submit(self, job_id: int, config_id: int, slot_keys: list, run, priority: int = PRIORITY_MANUAL):
+        item = QueuedJob(job_id, config_id, slot_keys, priority, run)
+        heapq.heappush(self.queue, (priority, next(self._seq), item))
+        self._dispatch()
+        return item
+
+    def is_queued(self, job_id: int) -> bool:
+        return any(item.job_id == job_id for _, _, item in self.queue)
+
+    def cancel(self, job_id: int) -> bool:
+        """Drop a job that is still waiting for a slot; False if it isn't queued"""
+        remaining = [entry for entry in self.queue if entry[2].job_id != job_id]
+        if len(remaining) == len(self.queue):
+            return False
+        self.queue = remaining
+        heapq.heapify(self.queue)
+        return True
+
+    def _has_capacity(self, item: QueuedJob) -> bool:
+        for key in item.slot_keys:
+            if self.slots.get(key, 0) >= self.limits[key[0]]:
+                return False
+        return True
+
+    def _dispatch(self):
+        """Start queued jobs in priority order while slots are free"""
+        blocked = []
+        while self.queue and len(self.running) < self.max_concurrent:
+            entry = heapq.heappop(self.queue)
+            item = entry[2]
+            if self._has_capacity(item):
+                self._start(item)
+            else:
+                # Its remote is saturated; let lower priority jobs for other remotes through
+                blocked.append(entry)
+        for entry in blocked:
+            heapq.heappush(self.queue, entry)
+
+    def _start(self, item: QueuedJob):
+        item.started_at = datetime.utcnow()
+        self.running[item.job_id] = item
+        for key in item.slot_keys:
+            self.slots[key] = self.slots.get(key, 0) + 1
+        self.tasks[item.job_id] = asyncio.create_task(self._run(item))
+
+    async def _run(self, item: QueuedJob):
+        try:
+            await item.run()
+        finally:
+            self.running.pop(item.job_id, None)
+            self.tasks.pop(item.job_id, None)
+            for key in item.slot_keys:
+                self.slots[key] -= 1
+                if not self.slots[key]:
+                    del self.slots[key]
+            self._dispatch()
+
+    def stats(self) -> dict:
+        now = datetime.utcnow()
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": len(self.running),
+            "queued": len(self.queue),
+            "utilization": len(self.running) / self.max_concurrent if self.max_concurrent else 0,
+            "slots": [
+                {"kind": kind, "name": name, "used": used, "limit": self.limits[kind]}
+                for (kind, name), used in sorted(self.slots.items())
+            ],
+            "queue": [
+                {
+                    "job_id": item.job_id,
+                    "config_id": item.config_id,
+                    "priority": item.priority,
+                    "waiting_seconds": (now - item.enqueued_at).total_seconds()
+                }
+                for _, _, item in sorted(self.queue)
+            ]
+        }
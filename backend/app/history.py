@@ -0,0 +1,84 @@
+import base64
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import Session
+from .models import BackupJob, JobDailySummary
+from .logstore import remove_log
+
+# Finished job rows older than this are rolled up into JobDailySummary
+JOB_HISTORY_DAYS = int(os.environ.get("JOB_HISTORY_DAYS", "30"))
+COMPACT_BATCH_SIZE = 5000
+FINISHED_STATUSES = ["success", "failed", "cancelled", "skipped"]
+
+
+def encode_cursor(job: BackupJob) -> str:
+    raw = f"{job.started_at.isoformat()}|{job.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """(started_at, id) of the last row on the previous page"""
+    started_at, job_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(started_at), int(job_id)
+
+
+def after_cursor(cursor: str):
+    """Keyset condition for rows after the cursor in (started_at desc, id desc) order"""
+    started_at, job_id = decode_cursor(cursor)
+    return or_(
+        BackupJob.started_at < started_at,
+        and_(BackupJob.started_at == started_at, BackupJob.id < job_id)
+    )
+
+
+def compact_job_history(db: Session, older_than_days: int = JOB_HISTORY_DAYS) -> int:
+    """Fold finished jobs older than the cutoff into daily summaries and delete them"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    compacted = 0
+
+    while True:
+        jobs = db.query(BackupJob).filter(
+            BackupJob.started_at < cutoff,
+            BackupJob.status.in_(FINISHED_STATUSES)
+        ).order_by(BackupJob.id).limit(COMPACT_BATCH_SIZE).all()
+        if not jobs:
+            break
+
+        rollups = {}
+        for job in jobs:
+            key = (job.config_id, job.started_at.date())
+            rollup = rollups.setdefault(key, {"runs": 0, "successes": 0, "failures": 0, "bytes": 0, "duration": 0.0})
+            rollup["runs"] += 1
+            if job.status == "success":
+                rollup["successes"] += 1
+            elif job.status == "failed":
+                rollup["failures"] += 1
+            rollup["bytes"] += job.bytes_transferred or 0
+            if job.completed_at:
+                rollup["duration"] += (job.completed_at - job.started_at).total_seconds()
+
+        for (config_id, day), rollup in rollups.items():
+            summary = db.query(JobDailySummary).filter(
+                JobDailySummary.config_id == config_id,
+                JobDailySummary.day == day
+            ).first()
+            if not summary:
+                summary = JobDailySummary(config_id=config_id, day=day, runs=0, successes=0,
+                                          failures=0, bytes_transferred=0, total_duration_seconds=0)
+                db.add(summary)
+            summary.runs += rollup["runs"]
+            summary.successes += rollup["successes"]
+            summary.failures += rollup["failures"]
+            summary.bytes_transferred += rollup["bytes"]
+            summary.total_duration_seconds += rollup["duration"]
+
+        for job in jobs:
+            if job.log_file:
+                remove_log(job.log_file)
+            db.delete(job)
+
+        db.commit()
+        compacted += len(jobs)
+
+    return compacted
@@ -0,0 +1,85 @@
+import os
+import secrets
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import BackupJob
+from .events import record_status
+
+# Agents renew well within this window while a job runs
+LEASE_SECONDS = int(os.environ.get("AGENT_LEASE_SECONDS", "300"))
+
+
+def claimable(now: datetime):
+    """Jobs that are waiting, or whose holder stopped renewing its lease"""
+    return or_(
+        BackupJob.status == "pending",
+        and_(
+            BackupJob.status.in_(["running", "paused"]),
+            or_(BackupJob.lease_expires_at.is_(None), BackupJob.lease_expires_at < now)
+        )
+    )
+
+
+async def claim_job(db: AsyncSession, job_id: int, agent_id: int):
+    """Atomically take the lease on a job; returns the lease token or None if someone else won"""
+    now = datetime.utcnow()
+    token = secrets.token_urlsafe(16)
+    result = await db.execute(
+        update(BackupJob)
+        .where(BackupJob.id == job_id, BackupJob.agent_id == agent_id, claimable(now))
+        .values(
+            status="running",
+            started_at=now,
+            lease_token=token,
+            lease_expires_at=now + timedelta(seconds=LEASE_SECONDS),
+            attempts=func.coalesce(BackupJob.attempts, 0) + 1
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return None
+    record_status(db.sync_session, job_id, "running")
+    # Caller commits, so one poll can claim several jobs in a single transaction
+    return token
+
+
+async def renew_lease(db: AsyncSession, job_id: int, agent_id: int, token: str):
+    """Extend a held lease; returns the new expiry or None if the lease was lost"""
+    expires = datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)
+    result = await db.execute(
+        update(BackupJob)
+        .where(
+            BackupJob.id == job_id,
+            BackupJob.agent_id == agent_id,
+            BackupJob.status.in_(["running", "paused"]),
+            BackupJob.lease_token == token
+        )
+        .values(lease_expires_at=expires)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return expires if result.rowcount == 1 else None
+
+
+async def complete_lease(db: AsyncSession, job_id: int, agent_id: int, token: str, values: dict) -> bool:
+    """Finish a job and release its lease in one conditional UPDATE
+
+    Matching on the token in the statement itself means a cancel or re-lease
+    committed after the caller read the job can't be overwritten. Returns
+    False if the lease was lost; the caller commits.
+    """
+    result = await db.execute(
+        update(BackupJob)
+        .where(
+            BackupJob.id == job_id,
+            BackupJob.agent_id == agent_id,
+            BackupJob.lease_token == token
+        )
+        .values(**values, lease_token=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+    record_status(db.sync_session, job_id, values["status"])
+    return True
@@ -0,0 +1,123 @@
+import os
+import re
+from .logstore import open_log
+
+LOG_CHUNK_SIZE = 64 * 1024
+# Most a single JSON log response carries; bigger windows are streamed as text
+LOG_JSON_MAX_BYTES = 1024 * 1024
+LOG_DEFAULT_TAIL = 1000
+
+LEVELS = ["DEBUG", "INFO", "NOTICE", "WARNING", "ERROR", "CRITICAL"]
+LEVEL_RE = re.compile(r"\b(DEBUG|INFO|NOTICE|WARNING|ERROR|CRITICAL)\b")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str, size: int):
+    """(start, end exclusive) for a single 'bytes=' range"""
+    unit, _, spec = header.partition('=')
+    if unit.strip() != "bytes" or ',' in spec:
+        raise RangeNotSatisfiable(header)
+    first, _, last = spec.strip().partition('-')
+    try:
+        if first == "":
+            # Suffix range: the last N bytes
+            start, end = max(size - int(last), 0), size
+        else:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+    except ValueError:
+        raise RangeNotSatisfiable(header)
+    if start >= size or start >= end:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+def tail_offset(path: str, lines: int) -> int:
+    """Byte offset where the last N lines start, reading backwards from the end"""
+    with open_log(path) as f:
+        pos = f.seek(0, os.SEEK_END)
+        # A trailing newline ends the last line rather than starting an empty one
+        newlines = -1
+        while pos > 0:
+            step = min(LOG_CHUNK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            block = f.read(step)
+            idx = len(block)
+            while True:
+                idx = block.rfind(b'\n', 0, idx)
+                if idx < 0:
+                    break
+                newlines += 1
+                if newlines == lines:
+                    return pos + idx + 1
+        return 0
+
+
+def iter_bytes(path: str, start: int, end: int):
+    """File contents in [start, end) in bounded chunks"""
+    with open_log(path) as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(LOG_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def line_filter(grep: str = None, level: str = None):
+    """Predicate for log lines: substring match and/or minimum severity"""
+    pattern = grep.encode() if grep else None
+    min_level = LEVELS.index(level.upper()) if level else None
+
+    def matches(line: bytes) -> bool:
+        if pattern is not None and pattern not in line:
+            return False
+        if min_level is not None:
+            found = LEVEL_RE.search(line.decode(errors='replace'))
+            if not found or LEVELS.index(found.group(1)) < min_level:
+                return False
+        return True
+    return matches
+
+
+def iter_lines(path: str, start: int, end: int, matches):
+    """Whole lines in [start, end) that pass the filter"""
+    pending = b""
+    for chunk in iter_bytes(path, start, end):
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if matches(line):
+                yield line + b'\n'
+    if pending and matches(pending):
+        yield pending
+
+
+def read_window(path: str, start: int, end: int, matches=None, max_bytes: int = LOG_JSON_MAX_BYTES):
+    """Up to max_bytes of (optionally filtered) log from start; returns (text, next offset)"""
+    out = []
+    taken = 0
+    offset = start
+    pending = b""
+    for chunk in iter_bytes(path, start, end):
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            # Always take at least one line, so a reader paging by next offset moves forward
+            if taken and taken + len(line) + 1 > max_bytes:
+                return b"".join(out).decode(errors='replace'), offset
+            offset += len(line) + 1
+            if matches is None or matches(line):
+                out.append(line + b'\n')
+                taken += len(line) + 1
+    if pending and (not taken or taken + len(pending) <= max_bytes):
+        offset += len(pending)
+        if matches is None or matches(pending):
+            out.append(pending)
+    return b"".join(out).decode(errors='replace'), offset
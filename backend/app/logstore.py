@@ -0,0 +1,201 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import threading
+
+LOG_DIR = os.environ.get("LOG_DIR", "/app/data/logs")
+# Uncompressed bytes per segment; a read decompresses at most one segment
+LOG_SEGMENT_SIZE = 1024 * 1024
+LOG_MAX_CHUNK = 4 * 1024 * 1024
+LOG_MAX_JOB_BYTES = int(os.environ.get("LOG_MAX_JOB_MB", "1024")) * 1024 * 1024
+LOG_TRUNCATED_MARKER = b"\n[log truncated: job log size limit reached]\n"
+# Oldest logs are deleted once everything under LOG_DIR exceeds this
+LOG_RETENTION_BYTES = int(os.environ.get("LOG_RETENTION_MB", "10240")) * 1024 * 1024
+
+_append_lock = threading.Lock()
+
+
+class LogOffsetError(Exception):
+    """Upload starts past what has been stored; the agent must resume from size"""
+
+    def __init__(self, size: int):
+        super().__init__(f"Expected offset <= {size}")
+        self.size = size
+
+
+def agent_log_path(job_id: int) -> str:
+    return f"{LOG_DIR}/job_{job_id}.segments"
+
+
+def is_segmented(path: str) -> bool:
+    return path.endswith(".segments")
+
+
+class SegmentedLog:
+    """A log shipped by an agent: gzip segments plus an index.json
+
+    Each upload is appended to the current segment as its own gzip member. The
+    index records every segment's uncompressed offset and length and its
+    compressed size, so a crash between the two writes is rolled back on the
+    next append.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_file = os.path.join(path, "index.json")
+        self.segments = []
+        self.reload()
+
+    def reload(self):
+        try:
+            with open(self.index_file, 'r') as f:
+                self.segments = json.load(f)["segments"]
+        except FileNotFoundError:
+            self.segments = []
+
+    @property
+    def size(self) -> int:
+        if not self.segments:
+            return 0
+        last = self.segments[-1]
+        return last["offset"] + last["length"]
+
+    def append(self, offset: int, data: bytes) -> int:
+        """Store data uploaded at offset, skipping any part already stored; returns the new size"""
+        with _append_lock:
+            self.reload()
+            size = self.size
+            if offset > size:
+                raise LogOffsetError(size)
+            data = data[size - offset:]
+            if not data:
+                return size
+
+            os.makedirs(self.path, exist_ok=True)
+            if not self.segments or self.segments[-1]["length"] >= LOG_SEGMENT_SIZE:
+                self.segments.append({"file": f"{len(self.segments):06d}.gz", "offset": size, "length": 0, "csize": 0})
+            segment = self.segments[-1]
+
+            member = gzip.compress(data, compresslevel=6)
+            with open(os.path.join(self.path, segment["file"]), 'ab') as f:
+                f.truncate(segment["csize"])
+                f.write(member)
+            segment["length"] += len(data)
+            segment["csize"] += len(member)
+
+            tmp = f"{self.index_file}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump({"segments": self.segments}, f)
+            os.replace(tmp, self.index_file)
+            return self.size
+
+    def segment_at(self, pos: int):
+        if pos >= self.size:
+            # Agent may have shipped more since we loaded the index
+            self.reload()
+        for segment in self.segments:
+            if segment["offset"] <= pos < segment["offset"] + segment["length"]:
+                return segment
+        return None
+
+    def read_segment(self, segment) -> bytes:
+        with open(os.path.join(self.path, segment["file"]), 'rb') as f:
+            data = gzip.decompress(f.read(segment["csize"]))
+        return data[:segment["length"]]
+
+
+class SegmentedReader(io.RawIOBase):
+    """Seekable, read-only file object over a SegmentedLog"""
+
+    def __init__(self, log: SegmentedLog):
+        self.log = log
+        self.pos = 0
+        self.cached = (None, b"")
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self.pos
+        elif whence == io.SEEK_END:
+            self.log.reload()
+            pos += self.log.size
+        self.pos = max(pos, 0)
+        return self.pos
+
+    def readinto(self, buffer):
+        segment = self.log.segment_at(self.pos)
+        if segment is None:
+            return 0
+        key = (segment["file"], segment["length"])
+        if self.cached[0] != key:
+            self.cached = (key, self.log.read_segment(segment))
+        data = self.cached[1]
+        start = self.pos - segment["offset"]
+        n = min(len(buffer), len(data) - start)
+        buffer[:n] = data[start:start + n]
+        self.pos += n
+        return n
+
+
+def open_log(path: str):
+    """Binary, seekable reader for a plain or segmented log"""
+    if is_segmented(path):
+        # Buffered, so read(n) spans segment boundaries instead of returning short
+        return io.BufferedReader(SegmentedReader(SegmentedLog(path)))
+    return open(path, 'rb')
+
+
+def log_size(path: str) -> int:
+    if is_segmented(path):
+        return SegmentedLog(path).size
+    return os.path.getsize(path)
+
+
+def append_line(path: str, line: str):
+    """Add a server-side note (e.g. the retention summary) to a job log"""
+    if is_segmented(path):
+        log = SegmentedLog(path)
+        log.append(log.size, line.encode())
+    else:
+        with open(path, 'a') as f:
+            f.write(line)
+
+
+def remove_log(path: str):
+    if is_segmented(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _disk_usage(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    return os.path.getsize(path)
+
+
+def enforce_log_retention(max_bytes: int = LOG_RETENTION_BYTES) -> int:
+    """Delete the least recently written logs until LOG_DIR fits in max_bytes; returns bytes freed"""
+    if not os.path.isdir(LOG_DIR):
+        return 0
+    logs = []
+    for entry in os.scandir(LOG_DIR):
+        logs.append((entry.stat().st_mtime, entry.path, _disk_usage(entry.path)))
+    total = sum(size for _, _, size in logs)
+    freed = 0
+    for _, path, size in sorted(logs):
+        if total - freed <= max_bytes:
+            break
+        remove_log(path)
+        freed += size
+    return freed
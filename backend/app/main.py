@@ -1,24 +1,57 @@
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers
+from fastapi.responses import StreamingResponse
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 import asyncio
+import io
+import logging
 import os
 import secrets
-from datetime import datetime, timedelta
+import time
+import zipapp
+import zlib
+from datetime import date, datetime, timedelta
 from .models import Agent
 from .schemas import AgentRegister, AgentResponse, AgentTokenResponse
-from fastapi import Request
-from fastapi import FastAPI, Depends, HTTPException, WebSocket, WebSocketDisconnect, Body
-from typing import List, Dict, Any
+from fastapi import Request, Response, Query
+from fastapi import FastAPI, Depends, HTTPException, WebSocket, WebSocketDisconnect, Body, BackgroundTasks
+from typing import List, Dict, Any, Optional
 
-from .database import engine, get_db, init_db
-from .models import Base, BackupConfig, BackupJob
+from .database import engine, async_engine, get_db, get_async_db, init_db, AsyncSessionLocal
+from .models import Base, BackupConfig, BackupJob, JobDailySummary
 from .schemas import *
 from .auth import get_current_user, create_access_token, verify_password, get_password_hash
 from .rclone import RcloneManager
+from .rcd import RcdError
 from .scheduler import BackupScheduler
+from .dispatch import LONG_POLL_MAX_WAIT
+from .prescan import remove_manifest
+from .remote_index import load_index, remove_index
+from .dedupe import remove_state
+from .leases import claimable, claim_job, renew_lease, complete_lease, LEASE_SECONDS
+from .history import after_cursor, encode_cursor, FINISHED_STATUSES
+from .events import bus
+from .backends import BACKENDS, get_backend
+from .bandwidth import validate_schedule
+from .planner import PlannedRun, peak_concurrency
+from .tuning import tuning_for, history_query
+from .progress import JobProgress
+from .metrics import (HTTP_REQUEST_LATENCY, AGENT_POLL_LATENCY, JOB_QUEUE_WAIT,
+                      instrument_engine, observe_finished_job, observe_failure)
+from .logstore import (SegmentedLog, LogOffsetError, LOG_MAX_CHUNK, LOG_MAX_JOB_BYTES,
+                       LOG_TRUNCATED_MARKER, is_segmented, log_size)
+from .tailer import LogTailHub, TAIL_BACKLOG_LINES
+from .logs import (LOG_JSON_MAX_BYTES, LOG_DEFAULT_TAIL, RangeNotSatisfiable, parse_range,
+                   tail_offset, iter_bytes, iter_lines, line_filter, read_window)
 from .models import RemoteProfile
 from .schemas import RemoteProfileCreate, RemoteProfileResponse
 
+logger = logging.getLogger(__name__)
+
 
 def validate_origin(origin: str) -> bool:
     """
@@ -39,12 +72,83 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+
+class RangeAwareGZipMiddleware:
+    """GZip for everything but Range requests
+
+    A 206 body is the exact bytes its Content-Range names in the file itself,
+    so those requests skip compression entirely.
+    """
+
+    def __init__(self, app, **options):
+        self.app = app
+        self.gzip = GZipMiddleware(app, **options)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "range" in Headers(scope=scope):
+            await self.app(scope, receive, send)
+            return
+        await self.gzip(scope, receive, send)
+
+
+app.add_middleware(RangeAwareGZipMiddleware, minimum_size=1024, compresslevel=6)
+
+# Optional bearer token for scrapers; /metrics is open when unset
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not the raw path, to keep series bounded
+    route = request.scope.get("route")
+    HTTP_REQUEST_LATENCY.labels(
+        request.method,
+        route.path if route else "unmatched",
+        response.status_code
+    ).observe(time.perf_counter() - started)
+    return response
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
 # Globals
 rclone_manager = RcloneManager()
 scheduler = BackupScheduler(rclone_manager)
+log_tails = LogTailHub()
 # Remote Profile endpoints
+def _validate_credentials(remote_type: str, creds: dict):
+    try:
+        get_backend(remote_type).validate(creds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _validate_remote(remote_type: str, remote_name: str, creds: dict):
+    """Everything rendering the rclone.conf section would refuse, before the config row is stored"""
+    _validate_credentials(remote_type, creds)
+    try:
+        get_backend(remote_type).render(remote_name, creds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _validate_bwlimit(bwlimit: Optional[str]):
+    try:
+        validate_schedule(bwlimit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _validate_snapshot_mode(config: BackupConfigCreate):
+    if config.snapshot_mode == "dedupe" and config.agent_id:
+        raise HTTPException(status_code=400, detail="Deduplicated snapshots are for server-side configs only")
+
+@app.get("/api/backends")
+def list_backends(current_user: str = Depends(get_current_user)):
+    """Supported remote types with their credential fields and performance defaults"""
+    return [backend.schema() for backend in BACKENDS.values()]
+
 @app.post("/api/profiles", response_model=RemoteProfileResponse)
 def create_profile(
     profile: RemoteProfileCreate,
@@ -52,6 +156,7 @@ def create_profile(
     current_user: str = Depends(get_current_user)
 ):
     """Save a remote credential profile"""
+    _validate_credentials(profile.remote_type, profile.credentials)
     encrypted_creds = rclone_manager.encrypt_credentials(profile.credentials)
     
     db_profile = RemoteProfile(
@@ -150,12 +255,12 @@ def register_agent(agent: AgentRegister, install_token: str, db: Session = Depen
     return new_agent
 
 @app.get("/api/agents", response_model=List[AgentResponse])
-def list_agents(
-    db: Session = Depends(get_db),
+async def list_agents(
+    db: AsyncSession = Depends(get_async_db),
     current_user: str = Depends(get_current_user)
 ):
     """List all registered agents"""
-    agents = db.query(Agent).all()
+    agents = (await db.execute(select(Agent))).scalars().all()
     
     # Update status based on last_seen (>5 minutes = offline)
     for agent in agents:
@@ -166,25 +271,44 @@ def list_agents(
             else:
                 agent.status = "online"
     
-    db.commit()
+    await db.commit()
     return agents
 
 @app.post("/api/agents/{agent_id}/heartbeat")
-def agent_heartbeat(agent_id: int, agent_token: str, db: Session = Depends(get_db)):
+async def agent_heartbeat(agent_id: int, agent_token: str, db: AsyncSession = Depends(get_async_db)):
     """Agent heartbeat to update status"""
-    agent = db.query(Agent).filter(
-        Agent.id == agent_id,
-        Agent.agent_token == agent_token
-    ).first()
+    agent = await _authenticate_agent(agent_id, agent_token, db)
+    _touch_agent(agent)
+    await db.commit()
     
+    return {"status": "ok"}
+
+@app.put("/api/agents/{agent_id}/bandwidth", response_model=AgentResponse)
+def update_agent_bandwidth(
+    agent_id: int,
+    update: AgentBandwidthUpdate,
+    db: Session = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    """Set the bandwidth timetable all of an agent's jobs share"""
+    agent = db.query(Agent).filter(Agent.id == agent_id).first()
     if not agent:
-        raise HTTPException(status_code=401, detail="Invalid agent credentials")
-    
-    agent.last_seen = datetime.utcnow()
-    agent.status = "online"
+        raise HTTPException(status_code=404, detail="Agent not found")
+    _validate_bwlimit(update.bwlimit)
+    agent.bwlimit = update.bwlimit or None
     db.commit()
+    db.refresh(agent)
     
-    return {"status": "ok"}
+    # Running jobs pick the new limit up at the next rebalance
+    for flow in rclone_manager.bandwidth.flows.values():
+        if flow.group == f"agent:{agent_id}":
+            flow.group_schedule = agent.bwlimit
+    return agent
+
+@app.get("/api/bandwidth")
+def bandwidth_status(current_user: str = Depends(get_current_user)):
+    """Global budget and what each running job is currently allowed"""
+    return rclone_manager.bandwidth.status()
 
 @app.delete("/api/agents/{agent_id}")
 def delete_agent(
@@ -211,7 +335,7 @@ def delete_agent(
 
 @app.get("/api/agents/install.sh")
 def get_install_script():
-    """Return complete agent installation script with worker"""
+    """Return the agent installation script"""
     from fastapi.responses import PlainTextResponse
     
     script = '''#!/bin/bash
@@ -219,9 +343,10 @@ set -e
 
 TOKEN="$1"
 SERVER_URL="${2:-http://localhost:8000}"
+MAX_JOBS="${3:-2}"
 
 if [ -z "$TOKEN" ]; then
-    echo "Usage: $0 <install-token> [server-url]"
+    echo "Usage: $0 <install-token> [server-url] [max-concurrent-jobs]"
     exit 1
 fi
 
@@ -235,12 +360,13 @@ IP_ADDRESS=$(hostname -I | awk '{print $1}' || echo "127.0.0.1")
 # Install dependencies
 if command -v apt-get &> /dev/null; then
     apt-get update
-    apt-get install -y rclone curl jq
+    apt-get install -y rclone python3 python3-httpx
 elif command -v yum &> /dev/null; then
     yum install -y epel-release
-    yum install -y rclone curl jq
+    yum install -y rclone python3 python3-pip
+    pip3 install httpx
 else
-    echo "Unsupported package manager. Install rclone, curl, jq manually."
+    echo "Unsupported package manager. Install rclone, python3 and httpx manually."
     exit 1
 fi
 
@@ -248,101 +374,38 @@ fi
 mkdir -p /opt/rclone-agent/logs
 cd /opt/rclone-agent
 
-# Register agent
+# Register agent and save its config
 echo "Registering agent with server..."
-RESPONSE=$(curl -s -X POST "$SERVER_URL/api/agents/register?install_token=$TOKEN" \\
-    -H "Content-Type: application/json" \\
-    -d "{\\"hostname\\":\\"$HOSTNAME\\",\\"ip_address\\":\\"$IP_ADDRESS\\",\\"platform\\":\\"$PLATFORM\\",\\"version\\":\\"1.0.0\\"}")
+python3 - "$SERVER_URL" "$TOKEN" "$HOSTNAME" "$IP_ADDRESS" "$PLATFORM" "$MAX_JOBS" <<'PY'
+import json, sys
+import httpx
+server_url, token, hostname, ip_address, platform, max_jobs = sys.argv[1:]
+reply = httpx.post(f"{server_url}/api/agents/register", params={"install_token": token}, json={
+    "hostname": hostname, "ip_address": ip_address, "platform": platform, "version": "2.0.0"
+})
+if reply.status_code != 200:
+    sys.exit(f"Failed to register agent: {reply.text}")
+agent = reply.json()
+with open("/opt/rclone-agent/config.json", "w") as f:
+    json.dump({
+        "agent_id": agent["id"],
+        "agent_token": agent["agent_token"],
+        "server_url": server_url,
+        "max_jobs": int(max_jobs)
+    }, f, indent=4)
+PY
+AGENT_ID=$(python3 -c 'import json; print(json.load(open("/opt/rclone-agent/config.json"))["agent_id"])')
 
-AGENT_ID=$(echo $RESPONSE | jq -r '.id')
-AGENT_TOKEN=$(echo $RESPONSE | jq -r '.agent_token')
-
-if [ "$AGENT_ID" = "null" ] || [ -z "$AGENT_ID" ] || [ "$AGENT_TOKEN" = "null" ]; then
-    echo "Failed to register agent:"
-    echo $RESPONSE
-    exit 1
-fi
-
-# Save config
-cat > /opt/rclone-agent/config.json <<EOF
-{
-    "agent_id": $AGENT_ID,
-    "agent_token": "$AGENT_TOKEN",
-    "server_url": "$SERVER_URL"
-}
-EOF
-
-# Create agent worker script
-cat > /opt/rclone-agent/agent-worker.sh <<'WORKER'
-#!/bin/bash
-set -e
-
-CONFIG_FILE="/opt/rclone-agent/config.json"
-AGENT_ID=$(jq -r '.agent_id' $CONFIG_FILE)
-AGENT_TOKEN=$(jq -r '.agent_token' $CONFIG_FILE)
-SERVER_URL=$(jq -r '.server_url' $CONFIG_FILE)
-
-echo "Rclone Agent Worker Started (Agent ID: $AGENT_ID)"
-mkdir -p /opt/rclone-agent/logs
-
-while true; do
-    # Heartbeat
-    curl -s -X POST "$SERVER_URL/api/agents/$AGENT_ID/heartbeat?agent_token=$AGENT_TOKEN" > /dev/null 2>&1 || true
-    
-    # Get pending jobs
-    JOBS=$(curl -s -X GET "$SERVER_URL/api/agents/$AGENT_ID/jobs?agent_token=$AGENT_TOKEN" 2>/dev/null || echo '[]')
-    
-    # Process each job
-    echo "$JOBS" | jq -c '.[]' 2>/dev/null | while read -r job; do
-        JOB_ID=$(echo "$job" | jq -r '.id')
-        SOURCE=$(echo "$job" | jq -r '.source_path')
-        REMOTE=$(echo "$job" | jq -r '.remote')
-        BACKUP_DIR=$(echo "$job" | jq -r '.backup_dir // empty')
-        RCLONE_CONFIG=$(echo "$job" | jq -r '.rclone_config')
-        
-        echo "[$(date '+%Y-%m-%d %H:%M:%S')] Processing job $JOB_ID: $SOURCE -> $REMOTE"
-        
-        CONFIG_PATH="/tmp/rclone-$JOB_ID.conf"
-        echo "$RCLONE_CONFIG" > "$CONFIG_PATH"
-        
-        LOG_FILE="/opt/rclone-agent/logs/job_$JOB_ID.log"
-        RCLONE_CMD="rclone sync \\"$SOURCE\\" \\"$REMOTE\\" --config \\"$CONFIG_PATH\\" --log-file \\"$LOG_FILE\\" --log-level INFO --stats 30s --transfers 8"
-        
-        if [ -n "$BACKUP_DIR" ]; then
-            RCLONE_CMD="$RCLONE_CMD --backup-dir \\"$BACKUP_DIR\\""
-        fi
-        
-        if eval $RCLONE_CMD >> "$LOG_FILE" 2>&1; then
-            STATUS="success"
-            ERROR_MSG=""
-        else
-            STATUS="failed"
-            ERROR_MSG="Rclone command failed"
-        fi
-        
-        BYTES=$(grep "Transferred:" "$LOG_FILE" 2>/dev/null | tail -1 | grep -oP '\\d+(?= )' | head -1 || echo "0")
-        
-        # Build JSON properly with jq
-        REPORT_JSON=$(jq -n \\
-            --arg status "$STATUS" \\
-            --arg error "$ERROR_MSG" \\
-            --arg bytes "${BYTES:-0}" \\
-            '{status: $status, error: $error, bytes_transferred: ($bytes | tonumber)}')
-        
-        # Report completion
-        curl -s -X POST "$SERVER_URL/api/agents/$AGENT_ID/jobs/$JOB_ID/complete?agent_token=$AGENT_TOKEN" \\
-            -H "Content-Type: application/json" \\
-            -d "$REPORT_JSON" > /dev/null 2>&1
-        
-        echo "[$(date '+%Y-%m-%d %H:%M:%S')] Job $JOB_ID completed: $STATUS"
-        rm -f "$CONFIG_PATH"
-    done
-    
-    sleep 30
-done
-WORKER
-
-chmod +x /opt/rclone-agent/agent-worker.sh
+# Install the agent (a Python zipapp served by the backend)
+echo "Downloading agent..."
+python3 - "$SERVER_URL/api/agents/agent.pyz" /opt/rclone-agent/rclone-agent.pyz <<'PY'
+import sys
+import httpx
+reply = httpx.get(sys.argv[1])
+reply.raise_for_status()
+with open(sys.argv[2], "wb") as f:
+    f.write(reply.content)
+PY
 
 # Create systemd service
 cat > /etc/systemd/system/rclone-agent.service <<EOF
@@ -352,7 +415,9 @@ After=network.target
 
 [Service]
 Type=simple
-ExecStart=/opt/rclone-agent/agent-worker.sh
+ExecStart=/usr/bin/python3 /opt/rclone-agent/rclone-agent.pyz --config /opt/rclone-agent/config.json
+# Running jobs are stopped and reported on SIGTERM; give rclone time to exit
+TimeoutStopSec=90
 Restart=always
 RestartSec=10
 StandardOutput=journal
@@ -377,6 +442,23 @@ echo "View logs: sudo journalctl -u rclone-agent -f"
     
     return PlainTextResponse(content=script, media_type="text/plain")
 
+AGENT_SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agent")
+_agent_zipapp = None
+
+@app.get("/api/agents/agent.pyz")
+def get_agent_zipapp():
+    """The agent package as a zipapp, run with `python3 rclone-agent.pyz`"""
+    global _agent_zipapp
+    if _agent_zipapp is None:
+        buf = io.BytesIO()
+        zipapp.create_archive(
+            AGENT_SOURCE_DIR, buf,
+            main="rclone_agent.__main__:main",
+            filter=lambda path: "__pycache__" not in path.parts and path.suffix != ".pyc"
+        )
+        _agent_zipapp = buf.getvalue()
+    return Response(content=_agent_zipapp, media_type="application/zip")
+
 @app.get("/api/agents/{agent_id}/paths")
 def list_agent_paths(
     agent_id: int,
@@ -404,11 +486,17 @@ def list_agent_paths(
 @app.on_event("startup")
 async def startup():
     init_db()
+    db = next(get_db())
+    rclone_manager.fail_interrupted_jobs(db)
+    db.close()
+    bus.start()
+    await rclone_manager.start()
     scheduler.start()
 
 @app.on_event("shutdown")
 async def shutdown():
     scheduler.stop()
+    await rclone_manager.stop()
 
 # Auth endpoints
 @app.post("/api/auth/register", response_model=Token)
@@ -452,11 +540,15 @@ def create_config(
         
         encrypted_creds = profile.encrypted_credentials
         remote_type = profile.remote_type
+        _validate_remote(remote_type, config.remote_name, rclone_manager.decrypt_credentials(encrypted_creds))
     else:
-        if not config.credentials:
+        if config.credentials is None:
             raise HTTPException(status_code=400, detail="Credentials or profile required")
+        _validate_remote(config.remote_type, config.remote_name, config.credentials)
         encrypted_creds = rclone_manager.encrypt_credentials(config.credentials)
         remote_type = config.remote_type
+    _validate_bwlimit(config.bwlimit)
+    _validate_snapshot_mode(config)
     
     db_config = BackupConfig(
         name=config.name,
@@ -468,9 +560,22 @@ def create_config(
         encrypted_credentials=encrypted_creds,
         is_incremental=config.is_incremental,
         schedule_cron=config.schedule_cron,
+        schedule_window=config.schedule_window,
         enabled=config.enabled,
         keep_daily_days=config.keep_daily_days,
-        keep_weekly=config.keep_weekly
+        keep_weekly=config.keep_weekly,
+        keep_weeks=config.keep_weeks,
+        keep_monthly=config.keep_monthly,
+        transfers=config.transfers,
+        checkers=config.checkers,
+        buffer_size=config.buffer_size,
+        multi_thread_streams=config.multi_thread_streams,
+        bwlimit=config.bwlimit,
+        fast_list=config.fast_list,
+        max_backlog=config.max_backlog,
+        auto_tune=config.auto_tune,
+        prescan=config.prescan,
+        snapshot_mode=config.snapshot_mode
     )
     
     db.add(db_config)
@@ -481,62 +586,92 @@ def create_config(
     
     if config.enabled:
         scheduler.add_job(db_config)
+        scheduler.replan()
     
     return db_config
 
 @app.get("/api/configs", response_model=List[BackupConfigResponse])
-def list_configs(
-    db: Session = Depends(get_db),
+async def list_configs(
+    db: AsyncSession = Depends(get_async_db),
     current_user: str = Depends(get_current_user)
 ):
-    return db.query(BackupConfig).all()
+    result = await db.execute(select(BackupConfig).options(selectinload(BackupConfig.agent)))
+    return result.scalars().all()
 
-@app.get("/api/agents/{agent_id}/jobs")
-def get_agent_jobs(
-    agent_id: int,
-    agent_token: str,
-    db: Session = Depends(get_db)
-):
-    """Get pending backup jobs for an agent"""
-    from datetime import timedelta
-    
-    agent = db.query(Agent).filter(
+async def _authenticate_agent(agent_id: int, agent_token: str, db: AsyncSession) -> Agent:
+    agent = (await db.execute(select(Agent).where(
         Agent.id == agent_id,
         Agent.agent_token == agent_token
-    ).first()
+    ))).scalars().first()
     
     if not agent:
         raise HTTPException(status_code=401, detail="Invalid agent credentials")
+    return agent
+
+def _touch_agent(agent: Agent):
+    """Any request from an agent doubles as its heartbeat"""
+    agent.last_seen = datetime.utcnow()
+    agent.status = "online"
+
+@app.get("/api/agents/{agent_id}/jobs")
+async def get_agent_jobs(
+    agent_id: int,
+    agent_token: str,
+    wait: int = 0,
+    limit: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get pending backup jobs for an agent
     
-    # Find pending jobs OR running jobs that started >2 minutes ago (might have failed)
-    cutoff = datetime.utcnow() - timedelta(minutes=2)
+    With wait > 0 this is a long-poll: if nothing is pending the request is held
+    until a job is queued for the agent or `wait` seconds pass. limit caps how
+    many jobs are leased (0 = all), for agents with a fixed number of free slots.
+    """
+    agent = await _authenticate_agent(agent_id, agent_token, db)
+    _touch_agent(agent)
+    jobs_data = await _claim_agent_jobs(agent_id, db, limit)
     
-    pending_jobs = db.query(BackupJob).filter(
-        BackupJob.agent_id == agent_id,
-        (
-            (BackupJob.status == "pending") |
-            ((BackupJob.status == "running") & (BackupJob.started_at < cutoff))
-        )
-    ).all()
+    if not jobs_data and wait > 0:
+        await db.close()  # Don't hold a connection while parked
+        if await rclone_manager.agents.wait(agent_id, min(wait, LONG_POLL_MAX_WAIT)):
+            jobs_data = await _claim_agent_jobs(agent_id, db, limit)
     
+    return jobs_data
+
+async def _claim_agent_jobs(agent_id: int, db: AsyncSession, limit: int = 0) -> list:
+    """Lease claimable jobs to an agent (oldest first, at most limit if set) and build their payloads"""
+    started = time.perf_counter()
+    # Pending jobs, or running jobs whose lease expired (the agent died mid-run),
+    # with their configs in the same round trip
+    query = (
+        select(BackupJob)
+        .options(joinedload(BackupJob.config))
+        .where(BackupJob.agent_id == agent_id, claimable(datetime.utcnow()))
+        .order_by(BackupJob.id)
+    )
+    if limit:
+        query = query.limit(limit)
+    pending_jobs = (await db.execute(query)).scalars().all()
+    
+    agent = await db.get(Agent, agent_id)
+    # Rendered remote config and tuning per config id; several jobs can share one config
+    rendered = {}
+    tunings = {}
     jobs_data = []
     for job in pending_jobs:
-        config = db.query(BackupConfig).filter(BackupConfig.id == job.config_id).first()
+        config = job.config
         if config:
-            # Decrypt credentials
-            creds = rclone_manager.decrypt_credentials(config.encrypted_credentials)
+            if config.id not in rendered:
+                try:
+                    rendered[config.id] = rclone_manager.render_remote(config)
+                except ValueError as e:
+                    logger.warning("Skipping job %s for agent %s: %s", job.id, agent_id, e)
+                    rendered[config.id] = None
+                history = (await db.execute(history_query(config.id))).scalars().all() if config.auto_tune else None
+                tunings[config.id] = tuning_for(config, history)
             
-            # Generate rclone config
-            if config.remote_type == "s3":
-                rclone_conf = f"""[{config.remote_name}]
-type = s3
-provider = Wasabi
-access_key_id = {creds['access_key']}
-secret_access_key = {creds['secret_key']}
-region = {creds.get('region', 'us-east-1')}
-endpoint = {creds.get('endpoint', 's3.wasabisys.com')}
-"""
-            else:
+            rclone_conf = rendered[config.id]
+            if rclone_conf is None:
                 continue
             
             # Build backup-dir
@@ -544,77 +679,295 @@ endpoint = {creds.get('endpoint', 's3.wasabisys.com')}
             if config.is_incremental:
                 # Use a completely separate backup prefix to avoid any overlap
                 # Format: remote:BACKUPS/config-id/date
-                safe_job_name = config.name.replace(' ', '-').replace('/', '-').lower()
                 date_str = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
                 
                 # Put backups at remote root level with BACKUPS prefix
                 # This guarantees no overlap with any data path
-                backup_dir = f"{config.remote_name}:BACKUPS/{config.id}-{safe_job_name}/{date_str}"
+                backup_dir = f"{rclone_manager.backup_root(config)}/{date_str}"
+            
+            # Conditional update, so concurrent polls can't both get the job
+            lease_token = await claim_job(db, job.id, agent_id)
+            if not lease_token:
+                continue
+            if job.status == "pending":
+                JOB_QUEUE_WAIT.labels("agent").observe((datetime.utcnow() - job.started_at).total_seconds())
+            tuning = tunings[config.id]
+            job.transfers = tuning.transfers
+            job.checkers = tuning.checkers
+            rclone_flags = tuning.flags()
+            if not tuning.bwlimit and agent.bwlimit:
+                rclone_flags += ["--bwlimit", agent.bwlimit]
+            rclone_manager.track_agent_job(job.id, agent, tuning.bwlimit)
             
             jobs_data.append({
                 "id": job.id,
                 "source_path": config.source_path,
                 "remote": f"{config.remote_name}:{config.remote_path}",
                 "backup_dir": backup_dir,
-                "rclone_config": rclone_conf
+                "rclone_config": rclone_conf,
+                "rclone_flags": rclone_flags,
+                "lease_token": lease_token,
+                "lease_seconds": LEASE_SECONDS
             })
-            
-            # Update status to running (only if it was pending)
-            if job.status == "pending":
-                job.status = "running"
     
-    db.commit()
+    # One commit for all claims in this poll
+    await db.commit()
     
-    print(f"Returning {len(jobs_data)} jobs to agent {agent_id}")
+    if jobs_data:
+        logger.debug("Returning %d jobs to agent %s", len(jobs_data), agent_id)
     
+    AGENT_POLL_LATENCY.observe(time.perf_counter() - started)
     return jobs_data
 
+@app.websocket("/ws/agents/{agent_id}")
+async def agent_channel(websocket: WebSocket, agent_id: int, agent_token: str):
+    """Push channel for agents: job notifications down, heartbeats and job requests up
+    
+    Server -> agent: {"type": "jobs_available"}, {"type": "jobs", "jobs": [...]},
+                     {"type": "bwlimit", "job_id": ..., "rate": "2048k"},
+                     {"type": "cancel" | "pause" | "resume", "job_id": ...},
+                     {"type": "transfers", "job_id": ..., "transfers": 16}
+    Agent -> server: {"type": "heartbeat"}, {"type": "get_jobs"}
+    """
+    async with AsyncSessionLocal() as db:
+        try:
+            agent = await _authenticate_agent(agent_id, agent_token, db)
+        except HTTPException:
+            await websocket.close(code=1008)
+            return
+        _touch_agent(agent)
+        await db.commit()
+    
+    await websocket.accept()
+    conn = rclone_manager.agents.connect(agent_id, websocket)
+    try:
+        # Jobs queued while the agent was away
+        await conn.send({"type": "jobs", "jobs": await _agent_channel_jobs(agent_id)})
+        
+        while True:
+            message = await websocket.receive_json()
+            if message.get("type") == "heartbeat":
+                async with AsyncSessionLocal() as db:
+                    _touch_agent(await db.get(Agent, agent_id))
+                    await db.commit()
+                await conn.send({"type": "heartbeat_ack"})
+            elif message.get("type") == "get_jobs":
+                await conn.send({"type": "jobs", "jobs": await _agent_channel_jobs(agent_id)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        rclone_manager.agents.disconnect(agent_id, conn)
+
+@app.get("/api/agents/{agent_id}/control")
+async def agent_control(
+    agent_id: int,
+    agent_token: str,
+    wait: int = 0,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Control messages for an agent's running jobs (same as the WebSocket pushes)
+    
+    Agents without a WebSocket long-poll this while they have jobs running.
+    """
+    agent = await _authenticate_agent(agent_id, agent_token, db)
+    _touch_agent(agent)
+    await db.commit()
+    await db.close()  # Don't hold a connection while parked
+    return await rclone_manager.agents.wait_control(agent_id, min(wait, LONG_POLL_MAX_WAIT))
+
+async def _agent_channel_jobs(agent_id: int) -> list:
+    async with AsyncSessionLocal() as db:
+        return await _claim_agent_jobs(agent_id, db)
+
 from typing import Dict, Any
 
-@app.post("/api/agents/{agent_id}/jobs/{job_id}/complete")
-def complete_agent_job(
+@app.post("/api/agents/{agent_id}/jobs/{job_id}/lease")
+async def renew_agent_job_lease(
     agent_id: int,
     job_id: int,
     agent_token: str,
-    payload: Dict[str, Any] = Body(...),  # Accept any JSON body
-    db: Session = Depends(get_db)
+    lease_token: str,
+    speed: Optional[float] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Agent reports job completion"""
-    agent = db.query(Agent).filter(
-        Agent.id == agent_id,
-        Agent.agent_token == agent_token
-    ).first()
+    """Long-running agent jobs call this periodically to keep their lease
     
-    if not agent:
-        raise HTTPException(status_code=401, detail="Invalid agent credentials")
+    speed is the job's current rate in bytes/s; the reply carries the job's
+    bandwidth allocation ("bwlimit") when the server is managing it.
+    """
+    agent = await _authenticate_agent(agent_id, agent_token, db)
+    _touch_agent(agent)
+    await db.commit()
+    
+    expires = await renew_lease(db, job_id, agent_id, lease_token)
+    if not expires:
+        raise HTTPException(status_code=409, detail="Lease lost; stop the job")
+    if speed is not None:
+        rclone_manager.bandwidth.report(job_id, speed)
+    return {
+        "lease_expires_at": expires,
+        "lease_seconds": LEASE_SECONDS,
+        "bwlimit": rclone_manager.bandwidth.allocated(job_id)
+    }
+
+@app.post("/api/agents/{agent_id}/jobs/{job_id}/progress")
+async def report_agent_job_progress(
+    agent_id: int,
+    job_id: int,
+    agent_token: str,
+    lease_token: str,
+    stats: Dict[str, Any] = Body(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Running agent jobs post rclone's stats here; it also renews the lease
+    
+    The reply is the same as a lease renewal, including the job's bandwidth allocation.
+    """
+    agent = await _authenticate_agent(agent_id, agent_token, db)
+    _touch_agent(agent)
+    expires = await renew_lease(db, job_id, agent_id, lease_token)
+    if not expires:
+        raise HTTPException(status_code=409, detail="Lease lost; stop the job")
+    
+    job = await db.get(BackupJob, job_id)
+    if stats:
+        progress = JobProgress()
+        progress.update(stats)
+        progress.apply(job)
+        await db.commit()
+        rclone_manager.bandwidth.report(job_id, job.transfer_speed)
+    return {
+        "lease_expires_at": expires,
+        "lease_seconds": LEASE_SECONDS,
+        "bwlimit": rclone_manager.bandwidth.allocated(job_id)
+    }
+
+async def _agent_job_log(agent_id: int, job_id: int, agent_token: str, db: AsyncSession):
+    await _authenticate_agent(agent_id, agent_token, db)
+    job = await db.get(BackupJob, job_id)
+    if not job or job.agent_id != agent_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job.log_file or not is_segmented(job.log_file):
+        raise HTTPException(status_code=400, detail="Job does not take shipped logs")
+    return SegmentedLog(job.log_file)
+
+@app.get("/api/agents/{agent_id}/jobs/{job_id}/logs")
+async def agent_log_offset(
+    agent_id: int,
+    job_id: int,
+    agent_token: str,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """How much of the log the server has; agents resume uploading from here"""
+    log = await _agent_job_log(agent_id, job_id, agent_token, db)
+    return {"offset": log.size}
+
+@app.post("/api/agents/{agent_id}/jobs/{job_id}/logs")
+async def upload_agent_log(
+    agent_id: int,
+    job_id: int,
+    agent_token: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Append a chunk of an agent's job log, starting at byte offset
+
+    Re-sent chunks are deduplicated by offset, so an agent can retry blindly.
+    The body may be gzip-compressed (Content-Encoding: gzip).
+    """
+    log = await _agent_job_log(agent_id, job_id, agent_token, db)
+    
+    too_big = HTTPException(status_code=413, detail=f"Chunks are limited to {LOG_MAX_CHUNK} bytes")
+    if int(request.headers.get("content-length") or 0) > LOG_MAX_CHUNK:
+        raise too_big
+    # Chunked uploads carry no length; count while reading instead of buffering it all first
+    body = bytearray()
+    async for part in request.stream():
+        body += part
+        if len(body) > LOG_MAX_CHUNK:
+            raise too_big
+    data = bytes(body)
+    if request.headers.get("content-encoding") == "gzip":
+        data = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data, LOG_MAX_CHUNK + 1)
+    if len(data) > LOG_MAX_CHUNK:
+        raise too_big
+    
+    limited = offset + len(data) > LOG_MAX_JOB_BYTES
+    if limited:
+        if offset > LOG_MAX_JOB_BYTES:
+            raise HTTPException(status_code=413, detail={"message": "Job log size limit reached", "offset": log.size})
+        # Keep what fits and mark the cut; the marker puts the log past the limit, so it is written once
+        data = data[:LOG_MAX_JOB_BYTES - offset] + LOG_TRUNCATED_MARKER
     
-    job = db.query(BackupJob).filter(BackupJob.id == job_id).first()
+    try:
+        size = await asyncio.to_thread(log.append, offset, data)
+    except LogOffsetError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.size})
+    if limited:
+        # Final: agents stop shipping this job's log
+        raise HTTPException(status_code=413, detail={"message": "Job log size limit reached", "offset": size})
+    return {"offset": size}
+
+@app.post("/api/agents/{agent_id}/jobs/{job_id}/complete")
+async def complete_agent_job(
+    agent_id: int,
+    job_id: int,
+    agent_token: str,
+    background_tasks: BackgroundTasks,
+    lease_token: str,
+    payload: Dict[str, Any] = Body(...),  # Accept any JSON body
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Agent reports job completion; only the holder of the job's current lease may"""
+    agent = await _authenticate_agent(agent_id, agent_token, db)
+    _touch_agent(agent)
+    
+    job = (await db.execute(select(BackupJob).where(
+        BackupJob.id == job_id,
+        BackupJob.agent_id == agent_id
+    ))).scalars().first()
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    print(f"Job {job_id} completion received: {payload}")
+    status = payload.get('status', 'failed')
+    if status not in FINISHED_STATUSES:
+        raise HTTPException(status_code=422, detail=f"Not a final job status: {status!r}")
+    values = {"status": status, "completed_at": datetime.utcnow()}
     
-    # Update job
-    job.status = payload.get('status', 'failed')
-    job.completed_at = datetime.utcnow()
+    # Agents that report structured stats get the same progress fields as local jobs
+    if isinstance(payload.get('stats'), dict) and payload['stats']:
+        progress = JobProgress()
+        progress.update(payload['stats'])
+        values.update(progress.fields())
     
-    bytes_val = payload.get('bytes_transferred', 0)
-    try:
-        job.bytes_transferred = int(bytes_val) if bytes_val else 0
-    except:
-        job.bytes_transferred = 0
+    # Older agents report only a byte count; don't let a missing one wipe the stats above
+    if 'bytes_transferred' in payload:
+        try:
+            values["bytes_transferred"] = int(payload['bytes_transferred'] or 0)
+        except (TypeError, ValueError):
+            values["bytes_transferred"] = 0
     
     if payload.get('error'):
-        job.error_message = str(payload.get('error'))
+        values["error_message"] = str(payload.get('error'))
+    
+    # Cancelled and re-leased jobs no longer carry this token; the check and the write are one statement
+    if not await complete_lease(db, job_id, agent_id, lease_token, values):
+        raise HTTPException(status_code=409, detail="Lease lost; job was reassigned")
     
     # Update config last_run
-    config = db.query(BackupConfig).filter(BackupConfig.id == job.config_id).first()
+    config = await db.get(BackupConfig, job.config_id)
     if config:
         config.last_run = datetime.utcnow()
+        if status == "success" and config.is_incremental:
+            background_tasks.add_task(rclone_manager.prune_after_job, config.id, job.log_file)
     
-    db.commit()
+    await db.commit()
+    await db.refresh(job)
+    rclone_manager.bandwidth.remove(job_id)
+    observe_finished_job(job, config, agent.hostname, reason="agent_reported")
     
-    print(f"✓ Job {job_id} marked as {job.status}, {job.bytes_transferred} bytes")
+    logger.debug("Job %s marked as %s, %s bytes", job_id, job.status, job.bytes_transferred)
     
     return {"status": "ok", "message": f"Job {job_id} completed"}
 @app.post("/api/jobs/reset-stuck")
@@ -630,8 +983,12 @@ def reset_stuck_jobs(
     stuck = db.query(BackupJob).filter(
         BackupJob.status.in_(["pending", "running"]),
         BackupJob.started_at < cutoff,
-        BackupJob.completed_at.is_(None)
+        BackupJob.completed_at.is_(None),
+        # Agents still renewing their lease are not stuck
+        or_(BackupJob.lease_expires_at.is_(None), BackupJob.lease_expires_at < datetime.utcnow())
     ).all()
+    # Neither are local jobs whose rclone process is alive
+    stuck = [job for job in stuck if not rclone_manager.engine.is_running(job.id)]
     
     count = len(stuck)
     
@@ -639,33 +996,96 @@ def reset_stuck_jobs(
         job.status = "failed"
         job.error_message = "Job stuck/timed out - reset by admin"
         job.completed_at = datetime.utcnow()
+        observe_failure("agent" if job.agent_id else "local", "stuck")
     
     db.commit()
     
     return {"detail": f"Reset {count} stuck jobs (pending/running > 5 min)"}
 @app.delete("/api/jobs/{job_id}")
-def cancel_job(
+async def cancel_job(
     job_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: str = Depends(get_current_user)
 ):
-    """Cancel/delete a stuck job"""
-    job = db.query(BackupJob).filter(BackupJob.id == job_id).first()
+    """Cancel a queued or running job, stopping its rclone; finished jobs are deleted"""
+    job = await db.get(BackupJob, job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    if job.status in ["pending", "running"]:
+    if job.status in ["pending", "queued", "running", "paused"]:
         job.status = "cancelled"
         job.completed_at = datetime.utcnow()
         job.error_message = "Cancelled by user"
-        db.commit()
+        # The agent loses its lease, so its renewals and completion report are refused
+        job.lease_token = None
+        job.lease_expires_at = None
+        await db.commit()
+        await rclone_manager.cancel_job(job)
     else:
         # Delete completed jobs
-        db.delete(job)
-        db.commit()
+        await db.delete(job)
+        await db.commit()
     
     return {"detail": "Job cancelled"}
 
+async def _running_job(job_id: int, db: AsyncSession, status: str = "running") -> BackupJob:
+    job = await db.get(BackupJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != status:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}, not {status}")
+    return job
+
+@app.post("/api/jobs/{job_id}/pause")
+async def pause_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_user)
+):
+    """Freeze a running job (SIGSTOP) without losing its progress"""
+    job = await _running_job(job_id, db)
+    try:
+        rclone_manager.pause_job(job)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    job.status = "paused"
+    await db.commit()
+    return {"detail": "Job paused"}
+
+@app.post("/api/jobs/{job_id}/resume")
+async def resume_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_user)
+):
+    job = await _running_job(job_id, db, status="paused")
+    try:
+        rclone_manager.resume_job(job)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    job.status = "running"
+    await db.commit()
+    return {"detail": "Job resumed"}
+
+@app.put("/api/jobs/{job_id}/limits")
+async def update_job_limits(
+    job_id: int,
+    limits: JobLimitsUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_user)
+):
+    """Change the bandwidth limit or transfer count of a running job"""
+    _validate_bwlimit(limits.bwlimit)
+    job = await _running_job(job_id, db)
+    try:
+        await rclone_manager.set_job_limits(job, limits.bwlimit, limits.transfers)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RcdError as e:
+        raise HTTPException(status_code=502, detail=f"rclone refused the change: {e}")
+    await db.commit()
+    return {"detail": "Limits updated", "bwlimit": limits.bwlimit, "transfers": job.transfers}
+
 @app.put("/api/configs/{config_id}", response_model=BackupConfigResponse)
 def update_config(
     config_id: int,
@@ -676,6 +1096,29 @@ def update_config(
     db_config = db.query(BackupConfig).filter(BackupConfig.id == config_id).first()
     if not db_config:
         raise HTTPException(status_code=404, detail="Config not found")
+    _validate_bwlimit(config.bwlimit)
+    _validate_snapshot_mode(config)
+    
+    # Resolve and check the credentials first: nothing is changed unless the remote renders
+    encrypted_creds, remote_type = db_config.encrypted_credentials, db_config.remote_type
+    if config.remote_profile_id:
+        # Using profile
+        profile = db.query(RemoteProfile).filter(RemoteProfile.id == config.remote_profile_id).first()
+        if profile:
+            encrypted_creds, remote_type = profile.encrypted_credentials, profile.remote_type
+        creds = rclone_manager.decrypt_credentials(encrypted_creds)
+    elif config.credentials is not None:
+        remote_type = config.remote_type or db_config.remote_type
+        creds = dict(config.credentials)
+        if remote_type == db_config.remote_type:
+            # The edit form never shows stored secrets; fields left blank keep their value
+            stored = rclone_manager.config_credentials(db_config)
+            creds = {**stored, **{key: value for key, value in creds.items() if value not in ("", None)}}
+        encrypted_creds = rclone_manager.encrypt_credentials(creds)
+    else:
+        creds = rclone_manager.config_credentials(db_config)
+    _validate_remote(remote_type, config.remote_name, creds)
+    old_remote_name = db_config.remote_name
     
     # Update basic fields
     db_config.name = config.name
@@ -685,33 +1128,39 @@ def update_config(
     db_config.remote_path = config.remote_path
     db_config.is_incremental = config.is_incremental
     db_config.schedule_cron = config.schedule_cron
+    db_config.schedule_window = config.schedule_window
     db_config.enabled = config.enabled
     db_config.keep_daily_days = config.keep_daily_days
     db_config.keep_weekly = config.keep_weekly
-    
-    # Update credentials only if provided
-    if config.remote_profile_id:
-        # Using profile
-        profile = db.query(RemoteProfile).filter(RemoteProfile.id == config.remote_profile_id).first()
-        if profile:
-            db_config.encrypted_credentials = profile.encrypted_credentials
-            db_config.remote_type = profile.remote_type
-    elif config.credentials and (config.credentials.get('access_key') or config.credentials.get('secret_key')):
-        # New credentials provided - update them
-        db_config.encrypted_credentials = rclone_manager.encrypt_credentials(config.credentials)
-        db_config.remote_type = config.remote_type
-    # else: keep existing encrypted_credentials (user left fields blank)
+    db_config.keep_weeks = config.keep_weeks
+    db_config.keep_monthly = config.keep_monthly
+    db_config.transfers = config.transfers
+    db_config.checkers = config.checkers
+    db_config.buffer_size = config.buffer_size
+    db_config.multi_thread_streams = config.multi_thread_streams
+    db_config.bwlimit = config.bwlimit
+    db_config.fast_list = config.fast_list
+    db_config.max_backlog = config.max_backlog
+    db_config.auto_tune = config.auto_tune
+    db_config.prescan = config.prescan
+    db_config.snapshot_mode = config.snapshot_mode
+    db_config.encrypted_credentials = encrypted_creds
+    db_config.remote_type = remote_type
     
     db.commit()
     db.refresh(db_config)
+    rclone_manager.invalidate_config(config_id)
     
-    # Update rclone remote
+    # Update rclone remote; a renamed remote must not leave its old section and credentials behind
+    if old_remote_name != db_config.remote_name:
+        rclone_manager.delete_remote(old_remote_name)
     rclone_manager.create_remote(db_config)
     
     # Reschedule
     scheduler.remove_job(config_id)
     if db_config.enabled:
         scheduler.add_job(db_config)
+    scheduler.replan()
     
     return db_config
 
@@ -729,6 +1178,11 @@ def delete_config(
     rclone_manager.delete_remote(db_config.remote_name)
     db.delete(db_config)
     db.commit()
+    rclone_manager.invalidate_config(config_id)
+    remove_manifest(config_id)
+    remove_index(config_id)
+    remove_state(config_id)
+    scheduler.replan()
     
     return {"detail": "Deleted"}
 
@@ -746,51 +1200,316 @@ async def run_backup(
     job = await rclone_manager.run_backup(db_config, db)
     return {"job_id": job.id, "status": job.status}
 
-@app.get("/api/jobs", response_model=List[BackupJobResponse])
-def list_jobs(
+@app.get("/metrics")
+def metrics(request: Request):
+    """Prometheus scrape endpoint"""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/api/schedule/plan")
+def schedule_plan(
+    hours: int = Query(24, ge=1, le=168),
+    db: Session = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    """Planned timeline of scheduled runs, with and without window placement"""
+    runs = scheduler.preview(db, hours)
+    unsmoothed = [PlannedRun(run.config, run.fire_time, 0, run.duration, run.expected_bytes) for run in runs]
+    return {
+        "runs": [run.to_dict() for run in runs],
+        "peak_concurrency": peak_concurrency(runs),
+        "peak_concurrency_without_windows": peak_concurrency(unsmoothed)
+    }
+
+@app.get("/api/executor")
+def executor_status(current_user: str = Depends(get_current_user)):
+    """Local job queue depth and slot utilization"""
+    return rclone_manager.executor.stats()
+
+@app.post("/api/configs/{config_id}/prune")
+async def prune_backups(
+    config_id: int,
+    dry_run: bool = False,
     db: Session = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
-    return db.query(BackupJob).order_by(BackupJob.started_at.desc()).limit(50).all()
+    """Apply retention to a config's snapshots (dry_run only reports what would go)"""
+    db_config = db.query(BackupConfig).filter(BackupConfig.id == config_id).first()
+    if not db_config:
+        raise HTTPException(status_code=404, detail="Config not found")
+    if not db_config.is_incremental and db_config.snapshot_mode != "dedupe":
+        raise HTTPException(status_code=400, detail="Config is not incremental")
+    
+    return await rclone_manager.prune_backups(db_config, dry_run=dry_run)
+
+def _index_summary(index) -> dict:
+    return {
+        "remote": index.remote,
+        "files": len(index.files),
+        "bytes": sum(size for size, _ in index.files.values() if size > 0),
+        "snapshots": sorted(index.snapshots, reverse=True),
+        "reconciled_at": index.reconciled_at,
+        "updated_at": index.updated_at,
+        "usable": index.usable()
+    }
+
+@app.post("/api/configs/{config_id}/reconcile")
+async def reconcile_remote_index(
+    config_id: int,
+    db: Session = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    """List the remote now and rebuild the config's remote index from it"""
+    db_config = db.query(BackupConfig).filter(BackupConfig.id == config_id).first()
+    if not db_config:
+        raise HTTPException(status_code=404, detail="Config not found")
+    if db_config.agent_id or db_config.snapshot_mode == "dedupe":
+        raise HTTPException(status_code=400, detail="Remote indexes are kept for server-side sync configs only")
+    try:
+        index = await rclone_manager.reconcile_index(db_config)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Listing the remote failed: {e}")
+    return _index_summary(index)
+
+@app.get("/api/configs/{config_id}/browse")
+async def browse_remote(
+    config_id: int,
+    path: str = "",
+    db: Session = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    """One directory of the backed-up files, answered from the remote index (no remote calls)"""
+    db_config = db.query(BackupConfig).filter(BackupConfig.id == config_id).first()
+    if not db_config:
+        raise HTTPException(status_code=404, detail="Config not found")
+    index = await asyncio.to_thread(load_index, config_id)
+    if index is None:
+        raise HTTPException(status_code=404, detail="No remote index yet; reconcile the config first")
+    dirs, files = index.listdir(path)
+    return {
+        **_index_summary(index),
+        "path": path.strip("/"),
+        "dirs": dirs,
+        "entries": [
+            {"name": name, "size": size, "modified": datetime.utcfromtimestamp(mtime / 1e9)}
+            for name, size, mtime in files
+        ]
+    }
+
+@app.get("/api/configs/{config_id}/snapshots")
+async def list_snapshots(
+    config_id: int,
+    db: Session = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    """Snapshots in a deduplicated config's repository, newest first"""
+    db_config = db.query(BackupConfig).filter(BackupConfig.id == config_id).first()
+    if not db_config:
+        raise HTTPException(status_code=404, detail="Config not found")
+    if db_config.snapshot_mode != "dedupe":
+        raise HTTPException(status_code=400, detail="Config does not use deduplicated snapshots")
+    try:
+        names = await rclone_manager.dedupe_snapshots(db_config)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Listing the remote failed: {e}")
+    return {"snapshots": sorted(names, reverse=True)}
+
+@app.post("/api/configs/{config_id}/restore")
+async def restore_snapshot(
+    config_id: int,
+    request: RestoreRequest,
+    db: Session = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    """Rebuild a deduplicated snapshot (or part of it) into a directory on the server"""
+    db_config = db.query(BackupConfig).filter(BackupConfig.id == config_id).first()
+    if not db_config:
+        raise HTTPException(status_code=404, detail="Config not found")
+    if db_config.snapshot_mode != "dedupe":
+        raise HTTPException(status_code=400, detail="Config does not use deduplicated snapshots")
+    if not os.path.isabs(request.target_path):
+        raise HTTPException(status_code=400, detail="target_path must be absolute")
+    if os.path.exists(request.target_path) and (not os.path.isdir(request.target_path) or os.listdir(request.target_path)):
+        raise HTTPException(status_code=409, detail="target_path must be an empty directory")
+    try:
+        stats = await rclone_manager.restore_dedupe(db_config, request.snapshot, request.target_path, request.path or "")
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        # A corrupt chunk or a manifest that doesn't fit the target
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Restore failed: {e}")
+    return {"snapshot": request.snapshot, "target_path": request.target_path, **stats}
+
+@app.get("/api/jobs", response_model=List[BackupJobResponse])
+async def list_jobs(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    config_id: Optional[int] = None,
+    agent_id: Optional[int] = None,
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_user)
+):
+    """Newest jobs first; pass the X-Next-Cursor response header back as `cursor` for the next page"""
+    query = select(BackupJob).options(selectinload(BackupJob.config), selectinload(BackupJob.agent))
+    if config_id is not None:
+        query = query.where(BackupJob.config_id == config_id)
+    if agent_id is not None:
+        query = query.where(BackupJob.agent_id == agent_id)
+    if status:
+        query = query.where(BackupJob.status == status)
+    if since:
+        query = query.where(BackupJob.started_at >= since)
+    if until:
+        query = query.where(BackupJob.started_at < until)
+    if cursor:
+        try:
+            query = query.where(after_cursor(cursor))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    query = query.order_by(BackupJob.started_at.desc(), BackupJob.id.desc()).limit(limit)
+    jobs = (await db.execute(query)).scalars().all()
+    
+    if len(jobs) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(jobs[-1])
+    return jobs
+
+@app.get("/api/jobs/summary", response_model=List[JobDailySummaryResponse])
+async def job_summaries(
+    config_id: Optional[int] = None,
+    since: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_user)
+):
+    """Daily per-config rollups of compacted job history"""
+    query = select(JobDailySummary)
+    if config_id is not None:
+        query = query.where(JobDailySummary.config_id == config_id)
+    if since:
+        query = query.where(JobDailySummary.day >= since)
+    query = query.order_by(JobDailySummary.day.desc(), JobDailySummary.config_id)
+    return (await db.execute(query)).scalars().all()
+
+@app.get("/api/jobs/{job_id}/progress", response_model=JobProgressResponse)
+async def get_job_progress(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_user)
+):
+    """Latest throughput, ETA and file counts reported by rclone"""
+    job = await db.get(BackupJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.get("/api/jobs/{job_id}/logs")
 async def get_logs(
     job_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    offset: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+    tail: Optional[int] = Query(None, ge=1),
+    grep: Optional[str] = None,
+    level: Optional[str] = Query(None, pattern="(?i)^(debug|info|notice|warning|error|critical)$"),
+    format: str = Query("json", pattern="^(json|text)$"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: str = Depends(get_current_user)
 ):
-    job = db.query(BackupJob).filter(BackupJob.id == job_id).first()
+    """A bounded window of a job log
+
+    offset/limit select bytes, tail the last N lines (the default for large
+    logs), and grep/level filter lines. format=text streams the window instead
+    of wrapping it in JSON, and a Range header gets the exact bytes back as 206.
+    """
+    job = await db.get(BackupJob, job_id)
     if not job or not job.log_file:
         raise HTTPException(status_code=404, detail="Log not found")
     
     if not os.path.exists(job.log_file):
         return {"logs": "Log file not found"}
     
-    with open(job.log_file, 'r') as f:
-        return {"logs": f.read()}
+    path = job.log_file
+    size = log_size(path)
+    
+    range_header = request.headers.get("range")
+    if range_header:
+        try:
+            start, end = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            raise HTTPException(status_code=416, detail="Range not satisfiable",
+                                headers={"Content-Range": f"bytes */{size}"})
+        return StreamingResponse(
+            iter_bytes(path, start, end),
+            status_code=206,
+            media_type="text/plain",
+            headers={
+                "Content-Range": f"bytes {start}-{end - 1}/{size}",
+                "Content-Length": str(end - start),
+                "Accept-Ranges": "bytes"
+            }
+        )
+    
+    if offset is not None:
+        start = min(offset, size)
+    elif tail is not None:
+        start = await asyncio.to_thread(tail_offset, path, tail)
+    elif size > LOG_JSON_MAX_BYTES and not (grep or level):
+        # Filters search the whole log; unfiltered large logs default to their tail
+        start = await asyncio.to_thread(tail_offset, path, LOG_DEFAULT_TAIL)
+    else:
+        start = 0
+    end = size if limit is None else min(size, start + limit)
+    matches = line_filter(grep, level) if grep or level else None
+    
+    if format == "text":
+        body = iter_lines(path, start, end, matches) if matches else iter_bytes(path, start, end)
+        return StreamingResponse(body, media_type="text/plain", headers={"Accept-Ranges": "bytes"})
+    
+    text, next_offset = await asyncio.to_thread(read_window, path, start, end, matches)
+    return {"logs": text, "offset": start, "next_offset": next_offset, "size": size}
 
 # WebSocket for live logs
 @app.websocket("/ws/logs/{job_id}")
 async def websocket_logs(websocket: WebSocket, job_id: int):
     await websocket.accept()
-    db = next(get_db())
-    job = db.query(BackupJob).filter(BackupJob.id == job_id).first()
+    async with AsyncSessionLocal() as db:
+        job = await db.get(BackupJob, job_id)
     
     if not job:
         await websocket.close(code=1008)
         return
+    if not job.log_file:
+        await websocket.close()
+        return
     
     try:
-        # Tail log file
-        if job.log_file and os.path.exists(job.log_file):
-            with open(job.log_file, 'r') as f:
-                f.seek(0, 2)  # End
-                while job.status == "running":
-                    line = f.readline()
-                    if line:
-                        await websocket.send_text(line)
-                    else:
-                        await asyncio.sleep(0.5)
-                        db.refresh(job)
+        if job.status in FINISHED_STATUSES:
+            # Nothing more will be written; just send the end of the log
+            if os.path.exists(job.log_file):
+                start = await asyncio.to_thread(tail_offset, job.log_file, TAIL_BACKLOG_LINES)
+                text, _ = await asyncio.to_thread(read_window, job.log_file, start, log_size(job.log_file))
+                if text:
+                    await websocket.send_text(text)
+            await websocket.close()
+            return
+        
+        # Shared tailer: a backlog frame first, then batches of new lines until the job ends
+        subscriber = log_tails.subscribe(job_id, job.log_file)
+        try:
+            while True:
+                frame = await subscriber.get()
+                if frame is None:
+                    break
+                await websocket.send_text(frame)
+        finally:
+            log_tails.unsubscribe(job_id, subscriber)
+        await websocket.close()
     except WebSocketDisconnect:
         pass
\ No newline at end of file
@@ -0,0 +1,77 @@
+import time
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+
+# Backups run from seconds to many hours
+DURATION_BUCKETS = (10, 30, 60, 300, 900, 1800, 3600, 7200, 14400, 28800, 86400)
+THROUGHPUT_BUCKETS = tuple(2 ** n * 1024 * 1024 for n in range(-4, 11))  # 64 KiB/s .. 1 GiB/s
+
+JOB_DURATION = Histogram(
+    "rclone_job_duration_seconds", "Wall time of finished backup jobs",
+    ["location", "status"], buckets=DURATION_BUCKETS
+)
+JOB_THROUGHPUT = Histogram(
+    "rclone_job_throughput_bytes_per_second", "Average transfer rate of finished jobs",
+    ["config", "remote", "agent"], buckets=THROUGHPUT_BUCKETS
+)
+JOB_QUEUE_WAIT = Histogram(
+    "rclone_job_queue_wait_seconds", "Time from job creation until it starts running",
+    ["location"], buckets=(0.1, 1, 5, 15, 60, 300, 900, 3600, 14400)
+)
+JOB_FAILURES = Counter(
+    "rclone_job_failures_total", "Failed jobs by reason",
+    ["location", "reason"]
+)
+AGENT_POLL_LATENCY = Histogram(
+    "rclone_agent_poll_seconds", "Time to claim and render jobs for an agent poll (excludes long-poll wait)",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+DB_QUERY_TIME = Histogram(
+    "rclone_db_query_seconds", "Database statement execution time",
+    ["operation"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+)
+SCHEDULER_LAG = Histogram(
+    "rclone_scheduler_lag_seconds", "Delay between a cron fire time and the job actually being started",
+    buckets=(0.01, 0.1, 0.5, 1, 5, 15, 60, 300, 3600)
+)
+HTTP_REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "API request latency",
+    ["method", "route", "status"]
+)
+
+
+def observe_finished_job(job, config, agent_hostname: str = None, reason: str = None):
+    """Duration, throughput and failure metrics for a job that just completed"""
+    location = "agent" if job.agent_id else "local"
+    if job.status == "failed":
+        JOB_FAILURES.labels(location, reason or "unknown").inc()
+    if job.started_at and job.completed_at:
+        duration = (job.completed_at - job.started_at).total_seconds()
+        JOB_DURATION.labels(location, job.status).observe(duration)
+        if job.status == "success" and duration > 0 and job.bytes_transferred:
+            JOB_THROUGHPUT.labels(
+                config.name if config else "",
+                config.remote_name if config else "",
+                agent_hostname or "local"
+            ).observe(job.bytes_transferred / duration)
+
+
+def observe_failure(location: str, reason: str):
+    JOB_FAILURES.labels(location, reason).inc()
+
+
+def instrument_engine(sync_engine):
+    """Time every statement on an engine (pass async_engine.sync_engine for async ones)"""
+
+    # A connection runs one statement at a time, so a single start slot is enough
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_start"] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_start", None)
+        if started is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_TIME.labels(operation).observe(time.perf_counter() - started)
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Boolean, Date, DateTime, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
 from datetime import datetime
 
 Base = declarative_base()
@@ -30,6 +31,8 @@ class Agent(Base):
     version = Column(String, default="1.0.0")
     status = Column(String, default="offline")  # online, offline
     agent_token = Column(String, unique=True, nullable=False)
+    # rclone --bwlimit timetable shared by all of this agent's jobs
+    bwlimit = Column(String, nullable=True)
     last_seen = Column(DateTime, default=datetime.utcnow)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -45,15 +48,46 @@ class BackupConfig(Base):
     encrypted_credentials = Column(Text, nullable=False)
     is_incremental = Column(Boolean, default=True)
     schedule_cron = Column(String, default="0 2 * * *")
+    # Minutes after each cron time the run may start in; 0 = exactly on the cron time
+    schedule_window = Column(Integer, default=0)
     enabled = Column(Boolean, default=True)
     keep_daily_days = Column(Integer, default=3)
     keep_weekly = Column(Boolean, default=True)
+    keep_weeks = Column(Integer, default=4)  # weekly snapshots kept when keep_weekly is on
+    keep_monthly = Column(Integer, default=0)
+    # Transfer tuning; NULL means the default from tuning.py
+    transfers = Column(Integer, nullable=True)
+    checkers = Column(Integer, nullable=True)
+    buffer_size = Column(String, nullable=True)  # e.g. "16M"
+    multi_thread_streams = Column(Integer, nullable=True)
+    bwlimit = Column(String, nullable=True)  # rclone --bwlimit syntax
+    fast_list = Column(Boolean, default=False)
+    max_backlog = Column(Integer, nullable=True)
+    auto_tune = Column(Boolean, default=False)
+    # Diff the source against a manifest first; skip no-op runs (server-side configs only)
+    prescan = Column(Boolean, default=False)
+    # "sync" mirrors the source; "dedupe" stores chunked snapshots (server-side configs only)
+    snapshot_mode = Column(String, default="sync")
     last_run = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    agent = relationship("Agent")
+    
+    @property
+    def agent_hostname(self):
+        return self.agent.hostname if self.agent else None
 
 class BackupJob(Base):
     __tablename__ = "backup_jobs"
+    __table_args__ = (
+        # Agent polls and stuck-job resets filter on these
+        Index("ix_backup_jobs_agent_status", "agent_id", "status"),
+        Index("ix_backup_jobs_status_started", "status", "started_at"),
+        # History listing and per-config filtering sort by start time
+        Index("ix_backup_jobs_started_id", "started_at", "id"),
+        Index("ix_backup_jobs_config_started", "config_id", "started_at"),
+    )
     id = Column(Integer, primary_key=True)
     config_id = Column(Integer, ForeignKey('backup_configs.id'), nullable=False)
     agent_id = Column(Integer, ForeignKey('agents.id'), nullable=True)
@@ -62,4 +96,46 @@ class BackupJob(Base):
     completed_at = Column(DateTime, nullable=True)
     log_file = Column(String, nullable=True)
     error_message = Column(Text, nullable=True)
-    bytes_transferred = Column(Integer, default=0)
\ No newline at end of file
+    bytes_transferred = Column(BigInteger, default=0)
+    # Live progress from rclone's stats stream
+    bytes_total = Column(BigInteger, nullable=True)
+    transfer_speed = Column(Float, nullable=True)  # bytes/sec
+    eta_seconds = Column(Integer, nullable=True)
+    files_checked = Column(Integer, nullable=True)
+    files_transferred = Column(Integer, nullable=True)
+    error_count = Column(Integer, nullable=True)
+    progress_updated_at = Column(DateTime, nullable=True)
+    # Agent job leases; the holder must renew before expiry or the job is handed out again
+    lease_token = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+    # Tuning the run used, so auto-tune can compare throughput across settings
+    transfers = Column(Integer, nullable=True)
+    checkers = Column(Integer, nullable=True)
+    
+    # Many-to-one only: load with selectinload/joinedload, never lazily per row
+    config = relationship("BackupConfig")
+    agent = relationship("Agent")
+    
+    @property
+    def config_name(self):
+        return self.config.name if self.config else None
+    
+    @property
+    def agent_hostname(self):
+        return self.agent.hostname if self.agent else None
+
+class JobDailySummary(Base):
+    """Per-config daily rollup of job rows removed by history compaction"""
+    __tablename__ = "job_daily_summaries"
+    __table_args__ = (
+        UniqueConstraint("config_id", "day", name="uq_job_daily_summaries_config_day"),
+    )
+    id = Column(Integer, primary_key=True)
+    config_id = Column(Integer, ForeignKey('backup_configs.id'), nullable=False)
+    day = Column(Date, nullable=False)
+    runs = Column(Integer, default=0)
+    successes = Column(Integer, default=0)
+    failures = Column(Integer, default=0)
+    bytes_transferred = Column(BigInteger, default=0)
+    total_duration_seconds = Column(Float, default=0)
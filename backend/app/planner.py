@@ -0,0 +1,220 @@
+import hashlib
+from datetime import datetime, timedelta
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy.orm import Session
+from .models import BackupJob, JobDailySummary
+
+PLAN_HORIZON_HOURS = 24
+# Placement resolution; offsets inside a window are tried at most this many times
+PLAN_STEP_SECONDS = 60
+PLAN_MAX_CANDIDATES = 120
+PLAN_HISTORY_DAYS = 30
+# Assumed for configs that have never completed a run
+DEFAULT_DURATION_SECONDS = 600
+
+
+def cron_trigger(expr: str, timezone=None) -> CronTrigger:
+    """CronTrigger for a 5-field expression (e.g. "0 2 * * *")"""
+    parts = expr.split()
+    return CronTrigger(
+        minute=parts[0],
+        hour=parts[1],
+        day=parts[2],
+        month=parts[3],
+        day_of_week=parts[4],
+        timezone=timezone
+    )
+
+
+class OffsetTrigger(BaseTrigger):
+    """Fires a fixed delay after each fire time of another trigger"""
+
+    __slots__ = ("trigger", "offset")
+
+    def __init__(self, trigger: BaseTrigger, offset: timedelta):
+        self.trigger = trigger
+        self.offset = offset
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        previous = previous_fire_time - self.offset if previous_fire_time else None
+        next_time = self.trigger.get_next_fire_time(previous, now - self.offset)
+        return next_time + self.offset if next_time else None
+
+    def __str__(self):
+        return f"{self.trigger} +{int(self.offset.total_seconds())}s"
+
+
+def jitter_offset(config_id: int, window_seconds: int) -> int:
+    """Stable pseudo-random offset in [0, window) for a config, the same on every restart"""
+    if window_seconds <= 0:
+        return 0
+    digest = hashlib.sha256(f"backup_{config_id}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") % window_seconds
+
+
+def config_history(db: Session, config_ids: list) -> dict:
+    """config_id -> (average duration in seconds, average bytes) of recent successful runs
+
+    Falls back to the daily summaries for configs whose job rows were compacted.
+    """
+    since = datetime.utcnow() - timedelta(days=PLAN_HISTORY_DAYS)
+    totals = {}
+    rows = db.query(
+        BackupJob.config_id, BackupJob.started_at, BackupJob.completed_at, BackupJob.bytes_transferred
+    ).filter(
+        BackupJob.config_id.in_(config_ids),
+        BackupJob.status == "success",
+        BackupJob.started_at >= since,
+        BackupJob.completed_at.isnot(None)
+    ).all()
+    for config_id, started, completed, moved in rows:
+        runs, seconds, total_bytes = totals.get(config_id, (0, 0.0, 0))
+        totals[config_id] = (runs + 1, seconds + (completed - started).total_seconds(), total_bytes + (moved or 0))
+
+    missing = [config_id for config_id in config_ids if config_id not in totals]
+    if missing:
+        summaries = db.query(JobDailySummary).filter(
+            JobDailySummary.config_id.in_(missing),
+            JobDailySummary.successes > 0
+        ).all()
+        for summary in summaries:
+            runs, seconds, total_bytes = totals.get(summary.config_id, (0, 0.0, 0))
+            totals[summary.config_id] = (
+                runs + summary.runs,
+                seconds + (summary.total_duration_seconds or 0),
+                total_bytes + (summary.bytes_transferred or 0)
+            )
+
+    return {
+        config_id: (seconds / runs, total_bytes / runs)
+        for config_id, (runs, seconds, total_bytes) in totals.items() if runs
+    }
+
+
+class PlannedRun:
+    def __init__(self, config, fire_time: datetime, offset: int, duration: float, expected_bytes: float):
+        self.config = config
+        self.fire_time = fire_time
+        self.offset = offset
+        self.duration = duration
+        self.expected_bytes = expected_bytes
+
+    @property
+    def start(self) -> datetime:
+        return self.fire_time + timedelta(seconds=self.offset)
+
+    @property
+    def end(self) -> datetime:
+        return self.start + timedelta(seconds=self.duration)
+
+    def to_dict(self) -> dict:
+        window = (self.config.schedule_window or 0) * 60
+        return {
+            "config_id": self.config.id,
+            "config_name": self.config.name,
+            "fire_time": self.fire_time,
+            "window_end": self.fire_time + timedelta(seconds=window),
+            "offset_seconds": self.offset,
+            "start": self.start,
+            "expected_end": self.end,
+            "expected_bytes": int(self.expected_bytes)
+        }
+
+
+class LoadProfile:
+    """Expected load per PLAN_STEP_SECONDS bucket across the plan horizon"""
+
+    def __init__(self, origin: datetime):
+        self.origin = origin
+        self.buckets = {}
+
+    def _span(self, start: datetime, duration: float) -> range:
+        first = int((start - self.origin).total_seconds() // PLAN_STEP_SECONDS)
+        return range(first, first + max(int(duration // PLAN_STEP_SECONDS), 1))
+
+    def add(self, start: datetime, duration: float, load: float):
+        for bucket in self._span(start, duration):
+            self.buckets[bucket] = self.buckets.get(bucket, 0.0) + load
+
+    def cost(self, start: datetime, duration: float, load: float) -> tuple:
+        """(peak, total) load while a run of this size would be going"""
+        existing = [self.buckets.get(bucket, 0.0) for bucket in self._span(start, duration)]
+        return max(existing) + load, sum(existing)
+
+
+def plan(configs: list, history: dict, now: datetime, horizon_hours: int = PLAN_HORIZON_HOURS) -> tuple:
+    """Place windowed configs inside their windows so runs overlap as little as possible
+
+    Each config's load is one job slot plus its historical share of bytes, held
+    for its historical duration. Configs without a window are fixed; the others
+    are placed biggest first at the offset that keeps the peak (then the total)
+    overlap lowest, ties going to the config's stable jitter offset. Returns
+    ({config_id: offset seconds}, [PlannedRun]).
+    """
+    horizon = now + timedelta(hours=horizon_hours)
+    rates = [moved / max(duration, 1) for duration, moved in history.values()]
+    mean_rate = sum(rates) / len(rates) if rates else 0
+
+    entries = []
+    for config in configs:
+        duration, expected_bytes = history.get(config.id, (DEFAULT_DURATION_SECONDS, 0))
+        load = 1.0 + (expected_bytes / max(duration, 1) / mean_rate if mean_rate else 0)
+        trigger = cron_trigger(config.schedule_cron, now.tzinfo)
+        fire_times = []
+        fire_time = trigger.get_next_fire_time(None, now)
+        while fire_time and fire_time < horizon:
+            fire_times.append(fire_time)
+            fire_time = trigger.get_next_fire_time(fire_time, fire_time + timedelta(seconds=1))
+        entries.append((config, fire_times, duration, expected_bytes, load))
+
+    profile = LoadProfile(now)
+    offsets = {}
+    runs = []
+
+    def place(config, fire_times, duration, expected_bytes, load, offset):
+        offsets[config.id] = offset
+        for fire_time in fire_times:
+            run = PlannedRun(config, fire_time, offset, duration, expected_bytes)
+            profile.add(run.start, duration, load)
+            runs.append(run)
+
+    windowed = []
+    for entry in entries:
+        if entry[0].schedule_window:
+            windowed.append(entry)
+        else:
+            place(*entry, 0)
+
+    windowed.sort(key=lambda entry: entry[4] * entry[2], reverse=True)
+    for config, fire_times, duration, expected_bytes, load in windowed:
+        window = config.schedule_window * 60
+        preferred = jitter_offset(config.id, window)
+        step = max(PLAN_STEP_SECONDS, window // PLAN_MAX_CANDIDATES)
+        best = None
+        for offset in sorted(set(range(0, window, step)) | {preferred}):
+            peak, total = 0.0, 0.0
+            for fire_time in fire_times:
+                run_peak, run_total = profile.cost(fire_time + timedelta(seconds=offset), duration, load)
+                peak = max(peak, run_peak)
+                total += run_total
+            score = (round(peak, 6), round(total, 6), abs(offset - preferred))
+            if best is None or score < best[0]:
+                best = (score, offset)
+        place(config, fire_times, duration, expected_bytes, load, best[1])
+
+    runs.sort(key=lambda run: run.start)
+    return offsets, runs
+
+
+def peak_concurrency(runs: list) -> int:
+    """Most runs expected to be going at once"""
+    events = []
+    for run in runs:
+        events.append((run.start, 1))
+        events.append((run.end, -1))
+    peak = current = 0
+    for _, delta in sorted(events):
+        current += delta
+        peak = max(peak, current)
+    return peak
@@ -0,0 +1,225 @@
+import gzip
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+PRESCAN_DIR = os.environ.get("PRESCAN_DIR", "/app/data/prescan")
+PRESCAN_WORKERS = int(os.environ.get("PRESCAN_WORKERS", "8"))
+# Past this many changed files a plain sync is cheaper than checking each one
+PRESCAN_MAX_FILES = int(os.environ.get("PRESCAN_MAX_FILES", "5000"))
+# The manifest only sees the source; a full sync this often also catches
+# files that were changed or deleted on the remote side
+PRESCAN_FULL_SYNC_DAYS = int(os.environ.get("PRESCAN_FULL_SYNC_DAYS", "7"))
+MANIFEST_VERSION = 1
+# Remote mtimes are compared with this much slack (not every backend keeps ns)
+MODIFY_WINDOW_NS = 10 ** 9
+
+ESCAPES = {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
+UNESCAPES = {"\\": "\\", "t": "\t", "n": "\n", "r": "\r"}
+
+
+def escape_name(path: str) -> str:
+    if not any(c in path for c in ESCAPES):
+        return path
+    return "".join(ESCAPES.get(c, c) for c in path)
+
+
+def unescape_name(text: str) -> str:
+    if "\\" not in text:
+        return text
+    out = []
+    chars = iter(text)
+    for c in chars:
+        out.append(UNESCAPES.get(next(chars, ""), "") if c == "\\" else c)
+    return "".join(out)
+
+
+def scan(root: str, workers: int = PRESCAN_WORKERS) -> dict:
+    """{path relative to root: (size, mtime_ns, inode)} of every regular file under root
+
+    Directories are listed in parallel with os.scandir. Symlinks are skipped,
+    as rclone does by default. Raises OSError if any directory can't be read.
+    """
+    def list_dir(rel: str):
+        files, subdirs = [], []
+        with os.scandir(os.path.join(root, rel) if rel else root) as entries:
+            for entry in entries:
+                path = f"{rel}/{entry.name}" if rel else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(path)
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    files.append((path, (st.st_size, st.st_mtime_ns, entry.inode())))
+        return files, subdirs
+
+    found = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(list_dir, "")}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                found.update(files)
+                pending |= {pool.submit(list_dir, path) for path in subdirs}
+    return found
+
+
+def _differs(old, new, modify_window_ns: int = 0) -> bool:
+    if old is None:
+        return True
+    if old[0] != new[0] or abs(old[1] - new[1]) > modify_window_ns:
+        return True
+    # Inodes are optional (0 where the filesystem has none); a new one means the file was replaced
+    return len(old) > 2 and bool(old[2] and new[2] and old[2] != new[2])
+
+
+def diff(old: dict, new: dict, modify_window_ns: int = 0) -> tuple:
+    """(new or modified paths, deleted paths), both sorted
+
+    old entries may be (size, mtime_ns) only, as in the remote index; mtimes
+    within modify_window_ns count as equal.
+    """
+    changed = sorted(path for path, meta in new.items() if _differs(old.get(path), meta, modify_window_ns))
+    deleted = sorted(path for path in old if path not in new)
+    return changed, deleted
+
+
+class Manifest:
+    """What a config's source looked like at its last successful sync"""
+
+    def __init__(self, source: str, remote: str, files: dict, full_sync_at: datetime):
+        self.source = source
+        self.remote = remote
+        self.files = files
+        self.full_sync_at = full_sync_at
+
+
+def manifest_path(config_id: int) -> str:
+    return f"{PRESCAN_DIR}/config_{config_id}.tsv.gz"
+
+
+def load_manifest(config_id: int):
+    """The stored manifest, or None if there is none (or it can't be read)"""
+    path = manifest_path(config_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8", errors="surrogateescape", newline="\n") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != MANIFEST_VERSION:
+                return None
+            files = {}
+            for line in f:
+                name, size, mtime, inode = line.rstrip("\n").split("\t")
+                files[unescape_name(name)] = (int(size), int(mtime), int(inode))
+    except (OSError, EOFError, ValueError) as e:
+        logger.warning("Ignoring unreadable manifest %s: %s", path, e)
+        return None
+    return Manifest(header["source"], header["remote"], files, datetime.fromisoformat(header["full_sync_at"]))
+
+
+def save_manifest(config_id: int, manifest: Manifest):
+    """Write through a temp file so a crash never leaves a truncated manifest"""
+    os.makedirs(PRESCAN_DIR, exist_ok=True)
+    path = manifest_path(config_id)
+    tmp = f"{path}.tmp"
+    header = {
+        "version": MANIFEST_VERSION,
+        "source": manifest.source,
+        "remote": manifest.remote,
+        "full_sync_at": manifest.full_sync_at.isoformat()
+    }
+    with gzip.open(tmp, "wt", encoding="utf-8", errors="surrogateescape", newline="\n", compresslevel=6) as f:
+        f.write(json.dumps(header) + "\n")
+        for name in sorted(manifest.files):
+            size, mtime, inode = manifest.files[name]
+            f.write(f"{escape_name(name)}\t{size}\t{mtime}\t{inode}\n")
+    os.replace(tmp, path)
+
+
+def remove_manifest(config_id: int):
+    path = manifest_path(config_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def files_from_path(job_id: int) -> str:
+    return f"{PRESCAN_DIR}/job_{job_id}.files"
+
+
+class PrescanResult:
+    """What a job has to do after the pre-scan
+
+    action is "skip" (nothing changed), "files_from" (sync only files_from)
+    or "full" (a normal sync); reason says why, for the job log.
+    """
+
+    def __init__(self, action: str, reason: str, scanned: dict = None, previous: Manifest = None,
+                 files_from: str = None, changed: list = None):
+        self.action = action
+        self.reason = reason
+        self.scanned = scanned
+        self.previous = previous
+        self.files_from = files_from
+        self.changed = changed
+
+    def manifest(self, source: str, remote: str, now: datetime) -> Manifest:
+        """Manifest to store once the sync succeeded"""
+        if self.action == "full":
+            full_sync_at = now
+        else:
+            # Without a manifest (the remote index was the baseline) the next
+            # manifest-only run does a full sync first
+            full_sync_at = self.previous.full_sync_at if self.previous else datetime.min
+        return Manifest(source, remote, self.scanned, full_sync_at)
+
+
+def prescan(config_id: int, job_id: int, source: str, remote: str, now: datetime = None,
+            index=None) -> PrescanResult:
+    """Compare source against what the remote holds and decide how much to sync
+
+    The baseline is the remote index when one is given (it is reconciled with
+    the remote itself), otherwise the manifest of the last successful sync.
+    Blocking; run it in a thread. Deletions always mean a full sync, since
+    --files-from never deletes anything on the remote.
+    """
+    now = now or datetime.utcnow()
+    if not os.path.isdir(source):
+        return PrescanResult("full", "source is not a local directory")
+    try:
+        scanned = scan(source)
+    except OSError as e:
+        return PrescanResult("full", f"source scan failed: {e}")
+
+    previous = load_manifest(config_id)
+    if previous is not None and (previous.source != source or previous.remote != remote):
+        previous = None
+    if index is not None:
+        changed, deleted = diff(index.files, scanned, MODIFY_WINDOW_NS)
+        summary = f"{len(scanned)} files, {len(changed)} new or modified, {len(deleted)} deleted (remote index)"
+    elif previous is None:
+        return PrescanResult("full", "no manifest yet", scanned)
+    elif now - previous.full_sync_at > timedelta(days=PRESCAN_FULL_SYNC_DAYS):
+        return PrescanResult("full", f"last full sync over {PRESCAN_FULL_SYNC_DAYS} days ago", scanned)
+    else:
+        changed, deleted = diff(previous.files, scanned)
+        summary = f"{len(scanned)} files, {len(changed)} new or modified, {len(deleted)} deleted"
+    if deleted:
+        return PrescanResult("full", summary, scanned)
+    if not changed:
+        return PrescanResult("skip", summary, scanned, previous, changed=changed)
+    if len(changed) > PRESCAN_MAX_FILES:
+        return PrescanResult("full", summary, scanned)
+    if any("\n" in path or "\r" in path for path in changed):
+        # --files-from is line based
+        return PrescanResult("full", f"{summary}; some names contain line breaks", scanned)
+
+    os.makedirs(PRESCAN_DIR, exist_ok=True)
+    path = files_from_path(job_id)
+    with open(path, "w", encoding="utf-8", errors="surrogateescape", newline="\n") as f:
+        f.writelines(f"{name}\n" for name in changed)
+    return PrescanResult("files_from", summary, scanned, previous, files_from=path, changed=changed)
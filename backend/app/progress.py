@@ -0,0 +1,65 @@
+import json
+from datetime import datetime
+# The agent package (bundled into its zipapp) owns the log format, so both sides render lines alike
+from agent.rclone_agent.logformat import STATS_INTERVAL, format_log_entry
+
+
+def format_stats(stats: dict) -> str:
+    """One-line summary of an rclone stats dict for the job log"""
+    eta = stats.get('eta')
+    return (
+        f"Transferred: {stats.get('bytes', 0)} / {stats.get('totalBytes', 0)} bytes, "
+        f"{stats.get('speed') or 0:.0f} B/s, ETA {eta if eta is not None else '-'}s, "
+        f"Checks: {stats.get('checks', 0)}, Transfers: {stats.get('transfers', 0)}, "
+        f"Errors: {stats.get('errors', 0)}"
+    )
+
+
+class JobProgress:
+    """Latest rclone stats for a running job, fed line by line from its JSON log"""
+
+    def __init__(self, on_entry=None):
+        self.stats = None
+        self.updated_at = None
+        # Called with every parsed log entry (e.g. to track transferred files)
+        self.on_entry = on_entry
+
+    def feed(self, line: str):
+        """Consume one stdout/stderr line; returns the text to write to the job log"""
+        if not line.startswith('{'):
+            return line
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return line
+        if isinstance(entry.get('stats'), dict):
+            self.update(entry['stats'])
+        elif self.on_entry:
+            self.on_entry(entry)
+        return format_log_entry(entry)
+
+    def update(self, stats: dict):
+        """Take a stats dict as returned by rclone (JSON log or rc core/stats)"""
+        self.stats = stats
+        self.updated_at = datetime.utcnow()
+
+    def fields(self) -> dict:
+        """BackupJob column values for the latest stats (empty before the first stats)"""
+        if not self.stats:
+            return {}
+        stats = self.stats
+        return {
+            "bytes_transferred": int(stats.get('bytes') or 0),
+            "bytes_total": int(stats.get('totalBytes') or 0),
+            "transfer_speed": float(stats.get('speed') or 0),
+            "eta_seconds": int(stats['eta']) if stats.get('eta') is not None else None,
+            "files_checked": int(stats.get('checks') or 0),
+            "files_transferred": int(stats.get('transfers') or 0),
+            "error_count": int(stats.get('errors') or 0),
+            "progress_updated_at": self.updated_at
+        }
+
+    def apply(self, job):
+        """Copy the latest stats onto a BackupJob row"""
+        for name, value in self.fields().items():
+            setattr(job, name, value)
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import httpx
+
+# 0 keeps the classic fork-per-command mode
+RCD_POOL_SIZE = int(os.environ.get("RCLONE_RCD_POOL_SIZE", "0"))
+RCD_SOCKET_DIR = "/app/data/rcd"
+RCD_START_TIMEOUT = 15
+JOB_POLL_INTERVAL = 2
+
+
+class RcdError(Exception):
+    pass
+
+
+def job_rc_socket(job_id: int) -> str:
+    """rc socket of a local `rclone sync` process, for changing its limits while it runs"""
+    return f"{RCD_SOCKET_DIR}/job-{job_id}.sock"
+
+
+async def rc_call(socket: str, method: str, params: dict = None) -> dict:
+    """One-off rc call to an rclone listening on a unix socket"""
+    try:
+        async with httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=socket), base_url="http://rc") as client:
+            resp = await client.post(f"/{method}", json=params or {})
+    except httpx.TransportError as e:
+        raise RcdError(f"rclone rc at {socket} unreachable: {e}")
+    data = resp.json()
+    if resp.status_code != 200:
+        raise RcdError(data.get('error', resp.text))
+    return data
+
+
+class RcdDaemon:
+    """One long-lived `rclone rcd` listening on a unix socket"""
+
+    def __init__(self, index: int, config_file: str):
+        self.index = index
+        self.config_file = config_file
+        self.socket = f"{RCD_SOCKET_DIR}/rcd-{index}.sock"
+        self.log_file = f"{RCD_SOCKET_DIR}/rcd-{index}.log"
+        self.process = None
+        self.client = None
+        self.active_jobs = 0
+        self.restart_lock = asyncio.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        if os.path.exists(self.socket):
+            os.remove(self.socket)
+
+        with open(self.log_file, 'a') as log:
+            self.process = await asyncio.create_subprocess_exec(
+                "rclone", "rcd",
+                "--rc-addr", f"unix://{self.socket}",
+                "--rc-no-auth",
+                "--config", self.config_file,
+                "--log-level", "INFO",
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=log
+            )
+        self.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=self.socket),
+            base_url="http://rcd",
+            timeout=None
+        )
+
+        deadline = asyncio.get_running_loop().time() + RCD_START_TIMEOUT
+        while True:
+            try:
+                await self.call("rc/noop")
+                return
+            except (httpx.TransportError, RcdError):
+                if not self.alive or asyncio.get_running_loop().time() > deadline:
+                    await self.stop()
+                    raise RcdError(f"rclone rcd {self.index} failed to start, see {self.log_file}")
+                await asyncio.sleep(0.2)
+
+    async def stop(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+        if self.alive:
+            self.process.terminate()
+            await self.process.wait()
+
+    async def call(self, method: str, params: dict = None) -> dict:
+        resp = await self.client.post(f"/{method}", json=params or {})
+        data = resp.json()
+        if resp.status_code != 200:
+            raise RcdError(data.get('error', resp.text))
+        return data
+
+
+class RcdPool:
+    """Pool of rcd daemons; commands reuse their cached backends and connections"""
+
+    def __init__(self, size: int, config_file: str):
+        self.daemons = [RcdDaemon(i, config_file) for i in range(size)]
+
+    async def start(self):
+        os.makedirs(RCD_SOCKET_DIR, exist_ok=True)
+        await asyncio.gather(*(d.start() for d in self.daemons))
+
+    async def stop(self):
+        await asyncio.gather(*(d.stop() for d in self.daemons))
+
+    async def _acquire(self) -> RcdDaemon:
+        """Least loaded daemon, restarting it first if it died"""
+        daemon = min(self.daemons, key=lambda d: d.active_jobs)
+        async with daemon.restart_lock:
+            if not daemon.alive:
+                await daemon.stop()
+                await daemon.start()
+        return daemon
+
+    async def call(self, method: str, params: dict = None) -> dict:
+        daemon = await self._acquire()
+        return await daemon.call(method, params)
+
+    async def clear_cache(self):
+        """Drop cached backends so updated remote credentials take effect"""
+        for daemon in self.daemons:
+            if daemon.alive:
+                await daemon.call("fscache/clear")
+
+    async def run_job(self, method: str, params: dict, on_stats=None, on_start=None) -> dict:
+        """Run an rc command as an async job and wait for it, reporting stats while it runs
+
+        on_start is called with the daemon and rc job id once the job is running.
+        """
+        daemon = await self._acquire()
+        daemon.active_jobs += 1
+        try:
+            started = await daemon.call(method, {**params, "_async": True})
+            job_id = started["jobid"]
+            if on_start:
+                on_start(daemon, job_id)
+            # Poll quickly at first so small jobs return fast, then back off
+            delay = 0.1
+            while True:
+                status = await daemon.call("job/status", {"jobid": job_id})
+                if on_stats:
+                    on_stats(await daemon.call("core/stats", {"group": f"job/{job_id}"}))
+                if status.get("finished"):
+                    if not status.get("success"):
+                        raise RcdError(status.get("error") or f"rc job {job_id} failed")
+                    return status.get("output") or {}
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, JOB_POLL_INTERVAL)
+        finally:
+            daemon.active_jobs -= 1
@@ -1,10 +1,49 @@
-import subprocess
+import asyncio
 import json
+import logging
 import os
+import tempfile
 from datetime import datetime
 from cryptography.fernet import Fernet
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from .models import BackupJob, BackupConfig
+from .database import SessionLocal
+from .engine import ProcessEngine
+from .executor import JobExecutor, PRIORITY_MANUAL
+from .progress import JobProgress, STATS_INTERVAL, format_stats
+from .rcd import RcdPool, RcdError, RCD_POOL_SIZE, RCD_SOCKET_DIR, job_rc_socket, rc_call
+from .retention import RetentionEngine
+from .dispatch import AgentHub
+from .cache import SecretCache
+from .backends import get_backend
+from .tuning import Tuning, tuning_for, history_query
+from .metrics import JOB_QUEUE_WAIT, observe_finished_job, observe_failure
+from .logstore import LOG_DIR, agent_log_path, append_line
+from .config_store import ConfigStore, PER_JOB_CONFIG
+from .bandwidth import BandwidthAllocator
+from .leases import LEASE_SECONDS
+from .prescan import prescan, save_manifest
+from .remote_index import RemoteIndex, RunChanges, load_index, save_index, index_entry
+from .dedupe import (ChunkIndex, SnapshotBuilder, chunk_path, local_manifest, manifest_name,
+                     referenced_chunks, restore_snapshot, snapshot_of, state_dir)
+
+logger = logging.getLogger(__name__)
+
+# Running local jobs write their progress to the database at most this often
+PROGRESS_FLUSH_SECONDS = 5
+
+
+def _store_progress(job_id: int, fields: dict):
+    db = SessionLocal()
+    try:
+        db.execute(update(BackupJob).where(BackupJob.id == job_id).values(**fields))
+        db.commit()
+    except Exception as e:
+        logger.warning("Failed to store progress of job %s: %s", job_id, e)
+    finally:
+        db.close()
+
 
 class RcloneManager:
     def __init__(self):
@@ -22,6 +61,40 @@ class RcloneManager:
         self.cipher = Fernet(self.key)
         self.config_dir = "/app/data/rclone"
         os.makedirs(self.config_dir, exist_ok=True)
+        
+        self.config_file = f"{self.config_dir}/rclone.conf"
+        self.config_store = ConfigStore(self.config_file)
+        
+        self.engine = ProcessEngine()
+        self.executor = JobExecutor()
+        self.rcd_pool = RcdPool(RCD_POOL_SIZE, self.config_file) if RCD_POOL_SIZE else None
+        self.retention = RetentionEngine(self)
+        self.agents = AgentHub()
+        self.secrets = SecretCache()
+        self.bandwidth = BandwidthAllocator()
+        # job_id -> (daemon, rc job id) of jobs running on the rcd pool
+        self.rcd_jobs = {}
+        # job_id -> (status, message) for local jobs being stopped on purpose
+        self.stopping = {}
+        # config_store.version the rcd pool last reloaded at
+        self._rcd_config_version = 0
+        # config_id -> lock around load/modify/save of its remote index
+        self.index_locks = {}
+    
+    async def start(self):
+        self.agents.start()
+        self.bandwidth.start()
+        if self.rcd_pool:
+            await self.rcd_pool.start()
+    
+    async def stop(self):
+        await self.bandwidth.stop()
+        # Don't leave rclone processes uploading after the server is gone
+        for job_id in list(self.engine.processes) + list(self.rcd_jobs):
+            self.stopping[job_id] = ("failed", "Interrupted by server shutdown")
+        await self.engine.terminate_all()
+        if self.rcd_pool:
+            await self.rcd_pool.stop()
     
     def encrypt_credentials(self, creds: dict) -> str:
         return self.cipher.encrypt(json.dumps(creds).encode()).decode()
@@ -29,72 +102,46 @@ class RcloneManager:
     def decrypt_credentials(self, encrypted: str) -> dict:
         return json.loads(self.cipher.decrypt(encrypted.encode()).decode())
     
-    def create_remote(self, config: BackupConfig):
-        creds = self.decrypt_credentials(config.encrypted_credentials)
+    def credentials_for(self, kind: str, obj) -> dict:
+        """Decrypted credentials of a row (kind names it in the cache), cached until the row changes"""
+        key = (kind, obj.id, obj.updated_at)
+        creds = self.secrets.get(key)
+        if creds is None:
+            plaintext = self.cipher.decrypt(obj.encrypted_credentials.encode())
+            creds = json.loads(plaintext)
+            self.secrets.put(key, plaintext, creds)
+        # Copy, so an eviction wiping the cached dict can't pull it out from under a caller
+        return dict(creds)
+    
+    def config_credentials(self, config: BackupConfig) -> dict:
+        return self.credentials_for("config", config)
+    
+    def render_remote(self, config: BackupConfig) -> str:
+        """rclone.conf stanza for a config's remote"""
+        key = ("remote", config.id, config.updated_at)
+        conf = self.secrets.get(key)
+        if conf is not None:
+            return conf
         
-        if config.remote_type == "s3":
-            conf = f"""[{config.remote_name}]
-type = s3
-provider = Wasabi
-access_key_id = {creds['access_key']}
-secret_access_key = {creds['secret_key']}
-region = {creds.get('region', 'us-east-1')}
-endpoint = {creds.get('endpoint', 's3.wasabisys.com')}
-"""
-        elif config.remote_type == "gdrive":
-            conf = f"""[{config.remote_name}]
-type = drive
-client_id = {creds['client_id']}
-client_secret = {creds['client_secret']}
-token = {creds['token']}
-"""
-        else:
-            raise ValueError(f"Unsupported remote type: {config.remote_type}")
-        
-        config_file = f"{self.config_dir}/rclone.conf"
-        
-        if os.path.exists(config_file):
-            with open(config_file, 'r') as f:
-                existing = f.read()
-            lines = []
-            skip = False
-            for line in existing.split('\n'):
-                if line.strip() == f"[{config.remote_name}]":
-                    skip = True
-                elif line.startswith('['):
-                    skip = False
-                if not skip:
-                    lines.append(line)
-            existing = '\n'.join(lines)
-        else:
-            existing = ""
+        creds = self.config_credentials(config)
+        conf = get_backend(config.remote_type).render(config.remote_name, creds)
         
-        with open(config_file, 'w') as f:
-            f.write(existing + '\n' + conf)
+        self.secrets.put(key, conf.encode(), conf)
+        return conf
+    
+    def invalidate_config(self, config_id: int):
+        """Wipe cached secrets for a config that was edited or deleted"""
+        self.secrets.invalidate("config", config_id)
+        self.secrets.invalidate("remote", config_id)
+    
+    def create_remote(self, config: BackupConfig):
+        self.config_store.set(config.remote_name, self.render_remote(config))
     
     def delete_remote(self, remote_name: str):
-        config_file = f"{self.config_dir}/rclone.conf"
-        if not os.path.exists(config_file):
-            return
-        
-        with open(config_file, 'r') as f:
-            lines = f.readlines()
-        
-        new_lines = []
-        skip = False
-        for line in lines:
-            if line.strip() == f"[{remote_name}]":
-                skip = True
-            elif line.startswith('['):
-                skip = False
-            if not skip:
-                new_lines.append(line)
-        
-        with open(config_file, 'w') as f:
-            f.writelines(new_lines)
+        self.config_store.delete(remote_name)
     
-    async def run_backup(self, config: BackupConfig, db: Session) -> BackupJob:
-        """Execute backup job (local or via agent)"""
+    async def run_backup(self, config: BackupConfig, db: Session, priority: int = PRIORITY_MANUAL) -> BackupJob:
+        """Create a backup job; local jobs run in the background, agent jobs wait for pickup"""
         from .models import Agent
         
         # Get agent if specified
@@ -109,120 +156,698 @@ token = {creds['token']}
         job = BackupJob(
             config_id=config.id,
             agent_id=config.agent_id,
-            status="pending" if agent else "running",  # Pending if using agent, running if local
+            status="pending" if agent else "queued",  # Pending if using agent, queued for a local slot otherwise
             started_at=datetime.utcnow()
         )
         db.add(job)
         db.commit()
         db.refresh(job)
         
-        log_file = f"/app/data/logs/job_{job.id}.log"
-        os.makedirs("/app/data/logs", exist_ok=True)
-        job.log_file = log_file
+        os.makedirs(LOG_DIR, exist_ok=True)
+        # Agents ship their log to a segmented store as the job runs
+        job.log_file = agent_log_path(job.id) if agent else f"{LOG_DIR}/job_{job.id}.log"
         db.commit()
         
-        # If using agent, job stays pending - agent will pick it up
+        # If using agent, job stays pending - wake the agent so it picks it up now
         if agent:
+            self.agents.notify(agent.id)
             return job
         
-        # Otherwise execute locally (existing code)
+        # Otherwise queue it for a local slot; the caller gets the job id right away
+        job_id = job.id
+        self.executor.submit(
+            job_id,
+            config.id,
+            self.slot_keys(config),
+            lambda: self._run_local(job_id),
+            priority=priority
+        )
+        
+        return job
+    
+    def backup_root(self, config: BackupConfig) -> str:
+        """Remote prefix holding the --backup-dir snapshots of an incremental config"""
+        safe_job_name = config.name.replace(' ', '-').replace('/', '-').lower()
+        return f"{config.remote_name}:BACKUPS/{config.id}-{safe_job_name}"
+    
+    async def prune_backups(self, config: BackupConfig, dry_run: bool = False) -> dict:
+        return await self.retention.prune(config, dry_run=dry_run)
+    
+    async def prune_after_job(self, config_id: int, log_file: str):
+        """Apply retention after a successful run; failures are logged, not fatal"""
+        db = SessionLocal()
+        try:
+            config = await asyncio.to_thread(lambda: db.query(BackupConfig).filter(BackupConfig.id == config_id).first())
+            report = await self.prune_backups(config)
+            summary = f"Retention: kept {len(report['keep'])}, deleted {len(report['deleted'])}"
+            if "chunks_deleted" in report:
+                summary += f" ({report['chunks_deleted']} unused chunks)"
+            if report["errors"]:
+                summary += f", {len(report['errors'])} failed: {report['errors']}"
+        except Exception as e:
+            summary = f"Retention failed: {e}"
+        finally:
+            db.close()
+        append_line(log_file, f"{datetime.utcnow().isoformat()} INFO  : {summary}\n")
+    
+    def slot_keys(self, config: BackupConfig) -> list:
+        """Executor slots a job on this config occupies"""
+        keys = [("remote", config.remote_name)]
+        if config.remote_type == "s3":
+            creds = self.config_credentials(config)
+            keys.append(("endpoint", creds.get('endpoint') or get_backend("s3").defaults["endpoint"]))
+        return keys
+    
+    def track_agent_job(self, job_id: int, agent, bwlimit: str = None):
+        """Give a leased agent job a share of the bandwidth budget
+
+        The agent picks up its allocation from lease renewals, or immediately
+        if it holds a WebSocket open. Jobs whose lease lapses drop out.
+        """
+        agent_id = agent.id
+        
+        async def push(rate):
+            self.agents.notify(agent_id, {"type": "bwlimit", "job_id": job_id, "rate": rate})
+        
+        self.bandwidth.add(
+            job_id, ("agent_job", job_id), push,
+            schedule=bwlimit,
+            group=f"agent:{agent_id}",
+            group_schedule=agent.bwlimit,
+            ttl=LEASE_SECONDS
+        )
+    
+    async def cancel_job(self, job: BackupJob):
+        """Stop a job that was just marked cancelled, wherever it runs
+        
+        Queued local jobs leave the executor queue, running ones get their
+        rclone terminated (or their rc job stopped) and agents are told to stop.
+        """
+        self.bandwidth.remove(job.id)
+        if job.agent_id:
+            self.agents.notify(job.agent_id, {"type": "cancel", "job_id": job.id})
+            return
+        if self.executor.cancel(job.id):
+            return
+        if job.id in self.rcd_jobs:
+            self.stopping[job.id] = ("cancelled", "Cancelled by user")
+            daemon, rc_job_id = self.rcd_jobs[job.id]
+            await daemon.call("job/stop", {"jobid": rc_job_id})
+        elif self.engine.is_running(job.id):
+            self.stopping[job.id] = ("cancelled", "Cancelled by user")
+            await self.engine.terminate(job.id)
+    
+    def pause_job(self, job: BackupJob):
+        """Freeze a running job; raises ValueError where that isn't possible"""
+        if job.agent_id:
+            self.agents.notify(job.agent_id, {"type": "pause", "job_id": job.id})
+        elif job.id in self.rcd_jobs:
+            raise ValueError("Jobs on the rcd pool can't be paused")
+        elif not self.engine.pause(job.id):
+            raise ValueError("Job has no running rclone process")
+    
+    def resume_job(self, job: BackupJob):
+        if job.agent_id:
+            self.agents.notify(job.agent_id, {"type": "resume", "job_id": job.id})
+        elif not self.engine.resume(job.id):
+            raise ValueError("Job has no running rclone process")
+    
+    async def set_job_limits(self, job: BackupJob, bwlimit: str = None, transfers: int = None):
+        """Change a running job's bandwidth limit and/or transfer count"""
+        if transfers is not None:
+            if job.agent_id:
+                self.agents.notify(job.agent_id, {"type": "transfers", "job_id": job.id, "transfers": transfers})
+            elif job.id in self.rcd_jobs:
+                # Options on a daemon are shared by every job it runs
+                raise ValueError("Transfers of jobs on the rcd pool are fixed when they start")
+            elif self.engine.is_running(job.id):
+                await rc_call(job_rc_socket(job.id), "options/set", {"main": {"Transfers": transfers}})
+            else:
+                raise ValueError("Job has no running rclone process")
+            job.transfers = transfers
+        if bwlimit is not None and not self.bandwidth.override(job.id, bwlimit):
+            raise ValueError("Job is not under bandwidth control")
+    
+    def fail_interrupted_jobs(self, db: Session):
+        """Local jobs queued or running when the server stopped will never finish"""
+        interrupted = db.query(BackupJob).filter(
+            BackupJob.agent_id.is_(None),
+            BackupJob.status.in_(["queued", "running", "paused"])
+        ).all()
+        for job in interrupted:
+            job.status = "failed"
+            job.error_message = "Interrupted by server restart"
+            job.completed_at = datetime.utcnow()
+            observe_failure("local", "interrupted")
+        db.commit()
+    
+    async def _run_local(self, job_id: int):
+        """Run a local backup job on the event loop with its own DB session
+
+        The session's queries and commits run in worker threads, one at a time;
+        rows stay loaded after a commit so reading them never hits the database
+        from the loop.
+        """
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            job, config = await asyncio.to_thread(self._start_local, db, job_id)
+            if job:
+                await self._execute_local(job, config, db)
+        finally:
+            db.close()
+    
+    def _start_local(self, db: Session, job_id: int):
+        """(job, config) marked running, or (None, None) if it was cancelled while waiting for a slot"""
+        job = db.query(BackupJob).filter(BackupJob.id == job_id).first()
+        config = db.query(BackupConfig).filter(BackupConfig.id == job.config_id).first()
+        if job.status != "queued":
+            return None, None
+        JOB_QUEUE_WAIT.labels("local").observe((datetime.utcnow() - job.started_at).total_seconds())
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        db.commit()
+        return job, config
+    
+    async def _execute_local(self, job: BackupJob, config: BackupConfig, db: Session):
         try:
             remote = f"{config.remote_name}:{config.remote_path}"
             date_str = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+            dedupe = config.snapshot_mode == "dedupe"
+            
+            scan = None
+            if config.prescan and not dedupe:
+                index = await self.usable_index(config)
+                scan = await asyncio.to_thread(prescan, config.id, job.id, config.source_path, remote, index=index)
+                append_line(job.log_file, f"{datetime.utcnow().isoformat()} INFO  : Pre-scan: {scan.reason}\n")
+                if scan.action == "skip":
+                    job.status = "skipped"
+                    job.completed_at = datetime.utcnow()
+                    config.last_run = datetime.utcnow()
+                    await asyncio.to_thread(db.commit)
+                    observe_finished_job(job, config, reason="prescan")
+                    return
+            files_from = scan.files_from if scan else None
             
-            cmd = [
-                "rclone", "sync",
-                config.source_path,
-                remote,
-                "--config", f"{self.config_dir}/rclone.conf",
-                "--log-file", log_file,
-                "--log-level", "INFO",
-                "--stats", "30s",
-                "--transfers", "8",
-                "--checkers", "16"
-            ]
+            backup_dir = None
+            if config.is_incremental and not dedupe:
+                backup_dir = f"{self.backup_root(config)}/{date_str}"
             
-            if config.is_incremental:
-                safe_job_name = config.name.replace(' ', '-').replace('/', '-').lower()
-                backup_dir = f"{config.remote_name}:BACKUPS/{config.id}-{safe_job_name}/{date_str}"
-                cmd.extend(["--backup-dir", backup_dir])
+            history = None
+            if config.auto_tune:
+                history = await asyncio.to_thread(lambda: db.execute(history_query(config.id)).scalars().all())
+            tuning = tuning_for(config, history)
+            job.transfers = tuning.transfers
+            job.checkers = tuning.checkers
+            await asyncio.to_thread(db.commit)
             
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            changes = RunChanges()
+            progress = JobProgress(on_entry=changes.feed)
             
-            bytes_transferred = 0
-            if os.path.exists(log_file):
-                with open(log_file, 'r') as f:
-                    for line in f:
-                        if "Transferred:" in line:
-                            try:
-                                parts = line.split()
-                                if "Bytes" in line or "bytes" in line:
-                                    bytes_transferred = int(parts[1].replace(',', ''))
-                            except:
-                                pass
+            # Progress is written from a worker thread at most every PROGRESS_FLUSH_SECONDS,
+            # so stats lines never wait on a database commit
+            flushing = None
+            flushed_at = None
             
-            if result.returncode == 0:
+            def on_progress():
+                nonlocal flushing, flushed_at
+                if not progress.updated_at or progress.updated_at == job.progress_updated_at:
+                    return
+                progress.apply(job)
+                self.bandwidth.report(job.id, job.transfer_speed)
+                if flushing and not flushing.done():
+                    return
+                if flushed_at and (progress.updated_at - flushed_at).total_seconds() < PROGRESS_FLUSH_SECONDS:
+                    return
+                flushed_at = progress.updated_at
+                flushing = asyncio.ensure_future(asyncio.to_thread(_store_progress, job.id, progress.fields()))
+            
+            if dedupe:
+                error = await self._snapshot_dedupe(job, config, date_str, tuning, progress, on_progress)
+            else:
+                try:
+                    if self.rcd_pool:
+                        error = await self._sync_rcd(job, config.source_path, remote, backup_dir, tuning, progress, on_progress, files_from)
+                    else:
+                        error = await self._sync_process(job, config.source_path, remote, backup_dir, tuning, progress, on_progress, files_from)
+                finally:
+                    if files_from and os.path.exists(files_from):
+                        os.remove(files_from)
+                
+                try:
+                    succeeded = error is None and job.id not in self.stopping
+                    await self._update_index(config, remote, scan, changes, date_str if backup_dir else None, succeeded)
+                except Exception as e:
+                    # The run itself is fine; the next reconcile repairs the index
+                    append_line(job.log_file, f"{datetime.utcnow().isoformat()} ERROR : Updating the remote index failed: {e}\n")
+            
+            if flushing:
+                # A late write would put older stats over the final ones
+                await asyncio.gather(flushing, return_exceptions=True)
+            progress.apply(job)
+            
+            if job.id in self.stopping:
+                job.status, job.error_message = self.stopping.pop(job.id)
+            elif error is None:
                 job.status = "success"
-                job.bytes_transferred = bytes_transferred
+                if scan and scan.scanned is not None:
+                    await asyncio.to_thread(save_manifest, config.id, scan.manifest(config.source_path, remote, datetime.utcnow()))
                 
-                if config.is_incremental and config.keep_weekly:
-                    await self._prune_backups(config)
+                if config.is_incremental or dedupe:
+                    await self.prune_after_job(config.id, job.log_file)
             else:
                 job.status = "failed"
-                job.error_message = result.stderr
+                job.error_message = error
             
             job.completed_at = datetime.utcnow()
             config.last_run = datetime.utcnow()
-            db.commit()
+            await asyncio.to_thread(db.commit)
+            observe_finished_job(job, config, reason="rcd" if self.rcd_pool else "rclone_exit")
             
         except Exception as e:
-            job.status = "failed"
-            job.error_message = str(e)
+            job.status, job.error_message = self.stopping.pop(job.id, ("failed", str(e)))
             job.completed_at = datetime.utcnow()
-            db.commit()
-        
-        return job
+            await asyncio.to_thread(db.commit)
+            observe_finished_job(job, config, reason="exception")
     
-    async def _execute_on_agent(self, agent, cmd, log_file):
-        """Execute command on remote agent"""
-        # For now, execute locally (full agent support in next phase)
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        return result
+    def _index_lock(self, config_id: int) -> asyncio.Lock:
+        if config_id not in self.index_locks:
+            self.index_locks[config_id] = asyncio.Lock()
+        return self.index_locks[config_id]
     
-    async def _prune_backups(self, config: BackupConfig):
-        """Prune old backups"""
-        safe_job_name = config.name.replace(' ', '-').replace('/', '-').lower()
-        remote = f"{config.remote_name}:BACKUPS/{config.id}-{safe_job_name}"
+    async def usable_index(self, config: BackupConfig):
+        """The config's remote index if it can stand in for listing the remote, else None"""
+        if config.agent_id:
+            return None  # Agent runs don't report per-file results; their index would drift
+        if config.snapshot_mode == "dedupe":
+            return None  # A chunk repository doesn't mirror the source
+        index = await asyncio.to_thread(load_index, config.id)
+        remote = f"{config.remote_name}:{config.remote_path}"
+        if index is None or not index.matches(remote, self.backup_root(config)) or not index.usable():
+            return None
+        return index
+    
+    async def _update_index(self, config, remote, scan, changes, snapshot, succeeded):
+        """Fold what a local run did to the destination into the config's remote index"""
+        root = self.backup_root(config)
+        async with self._index_lock(config.id):
+            index = await asyncio.to_thread(load_index, config.id)
+            if index is None or not index.matches(remote, root):
+                index = RemoteIndex(remote, root)
+            scanned = scan.scanned if scan else None
+            changes.apply(index, config.source_path, scanned)
+            if succeeded and scanned is not None:
+                # The destination now mirrors the source as scanned (a file changed since
+                # keeps its older entry, so it is picked up again next time)
+                if scan.action == "full":
+                    index.files = {path: meta[:2] for path, meta in scanned.items()}
+                else:
+                    index.files.update((path, scanned[path][:2]) for path in scan.changed)
+            elif self.rcd_pool:
+                # rc jobs log no per-file results; only a reconcile can tell what they did
+                index.reconciled_at = None
+            if snapshot:
+                if self.rcd_pool:
+                    index.snapshots = set(await self._list_dirs_if_any(root))
+                elif changes.backed_up:
+                    index.snapshots.add(snapshot)
+            await asyncio.to_thread(save_index, config.id, index)
+    
+    async def reconcile_index(self, config: BackupConfig) -> RemoteIndex:
+        """Rebuild a config's remote index from a full listing of the remote"""
+        remote = f"{config.remote_name}:{config.remote_path}"
+        root = self.backup_root(config)
+        async with self._index_lock(config.id):
+            started = datetime.utcnow()
+            files = await self._list_files(remote, config.fast_list)
+            snapshots = set(await self._list_dirs_if_any(root)) if config.is_incremental else set()
+            index = RemoteIndex(remote, root, files, snapshots, reconciled_at=started)
+            await asyncio.to_thread(save_index, config.id, index)
+        return index
+    
+    async def snapshot_names(self, config: BackupConfig) -> tuple:
+        """(snapshot directory names, "index" or "remote" for where they came from)"""
+        index = await self.usable_index(config)
+        if index is not None:
+            return sorted(index.snapshots), "index"
+        return await self.list_dirs(self.backup_root(config)), "remote"
+    
+    async def forget_snapshots(self, config: BackupConfig, names: list):
+        """Drop pruned snapshots from the remote index"""
+        if config.agent_id or not names:
+            return
+        async with self._index_lock(config.id):
+            index = await asyncio.to_thread(load_index, config.id)
+            if index is None:
+                return
+            index.snapshots.difference_update(names)
+            await asyncio.to_thread(save_index, config.id, index)
     
-    # ... rest stays the same
+    async def _sync_process(self, job, source, remote, backup_dir, tuning: Tuning, progress, on_progress, files_from=None):
+        """Fork an rclone sync; returns an error message or None"""
+        config_file = self.config_file
+        if PER_JOB_CONFIG:
+            config_file = self.config_store.write_job_config(job.id, [remote.split(':', 1)[0]])
+        # rc on a private socket lets the bandwidth allocator resize the job while it runs
+        os.makedirs(RCD_SOCKET_DIR, exist_ok=True)
+        rc_socket = job_rc_socket(job.id)
+        cmd = [
+            "rclone", "sync",
+            source,
+            remote,
+            "--config", config_file,
+            "--log-level", "INFO",
+            "--use-json-log",
+            "--stats", STATS_INTERVAL,
+            "--rc", "--rc-addr", f"unix://{rc_socket}", "--rc-no-auth",
+            *tuning.flags()
+        ]
+        if backup_dir:
+            cmd.extend(["--backup-dir", backup_dir])
+        if files_from:
+            # Only the pre-scanned changes; checking them one by one beats listing the remote
+            cmd.extend(["--files-from-raw", files_from, "--no-traverse"])
         
-        if len(path_parts) > 1:
-            backup_parent = '/'.join(path_parts) + '-backups'
-        else:
-            backup_parent = f"{bucket}/backups"
+        def on_line(line):
+            text = progress.feed(line)
+            on_progress()
+            return text
+        
+        async def set_bwlimit(rate):
+            if not os.path.exists(rc_socket):
+                return False
+            await rc_call(rc_socket, "core/bwlimit", {"rate": rate})
+        
+        self.bandwidth.add(job.id, ("job", job.id), set_bwlimit, schedule=tuning.bwlimit)
+        try:
+            result = await self.engine.run(job.id, cmd, job.log_file, on_line=on_line)
+        finally:
+            self.bandwidth.remove(job.id)
+            if os.path.exists(rc_socket):
+                os.remove(rc_socket)
+            if PER_JOB_CONFIG:
+                self.config_store.remove_job_config(job.id)
+        if result.returncode != 0:
+            return result.stderr_tail
+        return None
+    
+    async def _sync_rcd(self, job, source, remote, backup_dir, tuning: Tuning, progress, on_progress, files_from=None):
+        """Run sync/sync on the rcd pool; returns an error message or None
+
+        core/bwlimit is daemon-wide, so the allocator limits each daemon to the
+        sum of its jobs' shares (the config's bwlimit included).
+        """
+        await self._refresh_rcd_config()
+        options = tuning.rcd_options()
+        if backup_dir:
+            options["BackupDir"] = backup_dir
+        params = {"srcFs": source, "dstFs": remote, "_config": options}
+        if files_from:
+            options["NoTraverse"] = True
+            params["_filter"] = {"FilesFromRaw": [files_from]}
+        
+        logged_at = None
+        
+        with open(job.log_file, 'a') as log:
+            def on_stats(stats):
+                nonlocal logged_at
+                progress.update(stats)
+                on_progress()
+                # Stats are polled every couple of seconds; log them at the usual stats interval
+                if logged_at is None or (progress.updated_at - logged_at).total_seconds() >= 10:
+                    logged_at = progress.updated_at
+                    log.write(f"{logged_at.isoformat()} INFO  : {format_stats(stats)}\n")
+                    log.flush()
+            
+            def on_start(daemon, rc_job_id):
+                self.rcd_jobs[job.id] = (daemon, rc_job_id)
+                self.bandwidth.add(
+                    job.id, ("rcd", daemon.index),
+                    lambda rate: daemon.call("core/bwlimit", {"rate": rate}),
+                    schedule=tuning.bwlimit
+                )
+            
+            try:
+                await self.rcd_pool.run_job(
+                    "sync/sync",
+                    params,
+                    on_stats=on_stats,
+                    on_start=on_start
+                )
+            except RcdError as e:
+                log.write(f"{datetime.utcnow().isoformat()} ERROR : {e}\n")
+                return str(e)
+            finally:
+                self.bandwidth.remove(job.id)
+                self.rcd_jobs.pop(job.id, None)
+        return None
+    
+    async def _snapshot_dedupe(self, job, config, snapshot, tuning: Tuning, progress, on_progress):
+        """Chunk the source and upload only new chunks plus a manifest; returns an error message or None"""
+        repo = f"{config.remote_name}:{config.remote_path}"
+        loop = asyncio.get_running_loop()
         
-        remote = f"{config.remote_name}:{backup_parent}"
+        def flush(staging):
+            # Called from the builder's thread; waits for the upload on the event loop
+            asyncio.run_coroutine_threadsafe(
+                self._copy_dir(job, staging, repo, tuning, progress, on_progress), loop
+            ).result()
+        
+        # Holds off a prune's garbage collection, which would see the new chunks as unreferenced
+        async with self._index_lock(config.id):
+            index = ChunkIndex(config.id)
+            if not index.exists():
+                # New or lost index: learn what the repository holds rather than upload it again
+                index.add(await self._list_chunks(repo))
+            builder = SnapshotBuilder(config.id, config.source_path, index, flush)
+            try:
+                await asyncio.to_thread(builder.build, snapshot, repo)
+            except Exception as e:
+                append_line(job.log_file, f"{datetime.utcnow().isoformat()} ERROR : Snapshot failed: {e}\n")
+                return str(e)
+        
+        stats = builder.stats
+        progress.update({
+            "bytes": stats["new_bytes"],
+            "totalBytes": stats["bytes"],
+            "checks": stats["files"],
+            "transfers": stats["new_chunks"],
+            "errors": 0
+        })
+        append_line(job.log_file, (
+            f"{datetime.utcnow().isoformat()} INFO  : Snapshot {snapshot}: {stats['files']} files, "
+            f"{stats['bytes']} bytes in {stats['chunks']} chunks; {stats['reused_files']} files unchanged, "
+            f"{stats['new_chunks']} new chunks ({stats['new_bytes']} bytes) uploaded\n"
+        ))
+        return None
+    
+    async def _copy_dir(self, job, local_dir, repo, tuning: Tuning, progress, on_progress):
+        """Upload a staging directory into a repository; everything in it is new"""
+        if self.rcd_pool:
+            await self._refresh_rcd_config()
+            
+            def on_start(daemon, rc_job_id):
+                self.rcd_jobs[job.id] = (daemon, rc_job_id)
+            
+            try:
+                await self.rcd_pool.run_job(
+                    "sync/copy",
+                    {"srcFs": local_dir, "dstFs": repo, "_config": {**tuning.rcd_options(), "NoTraverse": True}},
+                    on_stats=lambda stats: (progress.update(stats), on_progress()),
+                    on_start=on_start
+                )
+            finally:
+                self.rcd_jobs.pop(job.id, None)
+            return
         
         cmd = [
-            "rclone", "lsf", remote,
-            "--config", f"{self.config_dir}/rclone.conf",
-            "--dirs-only"
+            "rclone", "copy",
+            local_dir,
+            repo,
+            "--config", self.config_file,
+            "--no-traverse",
+            "--log-level", "INFO",
+            "--use-json-log",
+            "--stats", STATS_INTERVAL,
+            *tuning.flags()
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        def on_line(line):
+            text = progress.feed(line)
+            on_progress()
+            return text
+        
+        result = await self.engine.run(job.id, cmd, job.log_file, on_line=on_line)
         if result.returncode != 0:
-            return
+            raise Exception(result.stderr_tail or f"rclone exited with code {result.returncode}")
+    
+    async def _list_chunks(self, repo: str) -> list:
+        """Digests of the chunks in a dedupe repository"""
+        files = await self._list_files(f"{repo}/chunks")
+        return [path.rsplit("/", 1)[-1] for path in files]
+    
+    async def _transfer_listed(self, src: str, dst: str, paths: list, work_dir: str, command: str = "copy"):
+        """rclone copy (or delete) of exactly these paths under src, without listing anything"""
+        os.makedirs(work_dir, exist_ok=True)
+        fd, list_file = tempfile.mkstemp(suffix=".files", dir=work_dir)
+        with os.fdopen(fd, "w") as f:
+            f.writelines(f"{path}\n" for path in paths)
+        try:
+            if self.rcd_pool:
+                await self._refresh_rcd_config()
+                params = {"_config": {"NoTraverse": True}, "_filter": {"FilesFromRaw": [list_file]}}
+                if command == "delete":
+                    await self.rcd_pool.run_job("operations/delete", {"fs": src, **params})
+                else:
+                    await self.rcd_pool.run_job("sync/copy", {"srcFs": src, "dstFs": dst, **params})
+                return
+            if command == "delete":
+                await self._rclone("delete", src, "--files-from-raw", list_file)
+            else:
+                await self._rclone("copy", src, dst, "--files-from-raw", list_file, "--no-traverse")
+        finally:
+            os.remove(list_file)
+    
+    async def dedupe_snapshots(self, config: BackupConfig) -> list:
+        """Snapshot names in a dedupe repository"""
+        repo = f"{config.remote_name}:{config.remote_path}"
+        files = await self._list_files(f"{repo}/snapshots")
+        return sorted(filter(None, (snapshot_of(name) for name in files)))
+    
+    async def fetch_manifest(self, config: BackupConfig, snapshot: str) -> str:
+        """Local path of a snapshot's manifest, downloading it if there is no local copy"""
+        path = local_manifest(config.id, snapshot)
+        if not os.path.exists(path):
+            repo = f"{config.remote_name}:{config.remote_path}"
+            await self._transfer_listed(repo, state_dir(config.id), [manifest_name(snapshot)], state_dir(config.id))
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Snapshot not found: {snapshot}")
+        return path
+    
+    async def restore_dedupe(self, config: BackupConfig, snapshot: str, target: str, prefix: str = "") -> dict:
+        """Rebuild a dedupe snapshot (or the part under prefix) into a local directory"""
+        repo = f"{config.remote_name}:{config.remote_path}"
+        manifest = await self.fetch_manifest(config, snapshot)
+        loop = asyncio.get_running_loop()
         
-        dirs = [d.strip('/') for d in result.stdout.strip().split('\n') if d]
-        dirs.sort(reverse=True)
+        def fetch(digests, directory):
+            asyncio.run_coroutine_threadsafe(
+                self._transfer_listed(repo, directory, [chunk_path(digest) for digest in digests], state_dir(config.id)),
+                loop
+            ).result()
         
-        keep_count = config.keep_daily_days + (1 if config.keep_weekly else 0)
-        to_delete = dirs[keep_count:]
+        return await asyncio.to_thread(restore_snapshot, config.id, manifest, target, fetch, prefix)
+    
+    async def collect_garbage(self, config: BackupConfig, plan) -> tuple:
+        """Apply plan(snapshot names) -> (keep, delete) to a dedupe repository
+
+        Drops the deleted snapshots' manifests, then the chunks no kept manifest
+        uses; returns (keep, deleted, chunks deleted). Snapshots are listed under
+        the same lock a running snapshot holds from its first chunk upload until
+        its manifest is written, so a snapshot's chunks are never collected.
+        """
+        repo = f"{config.remote_name}:{config.remote_path}"
+        async with self._index_lock(config.id):
+            keep, deleted = plan(await self.dedupe_snapshots(config))
+            if deleted:
+                await self._transfer_listed(repo, None, [manifest_name(name) for name in deleted], state_dir(config.id), "delete")
+                for name in deleted:
+                    if os.path.exists(local_manifest(config.id, name)):
+                        os.remove(local_manifest(config.id, name))
+            manifests = [await self.fetch_manifest(config, name) for name in keep]
+            used = await asyncio.to_thread(referenced_chunks, manifests)
+            stored = set(await self._list_chunks(repo))
+            garbage = sorted(stored - used)
+            if garbage:
+                await self._transfer_listed(repo, None, [chunk_path(digest) for digest in garbage], state_dir(config.id), "delete")
+            # The listing is the truth; this also repairs a drifted local index
+            await asyncio.to_thread(ChunkIndex(config.id).replace, stored - set(garbage))
+        return keep, deleted, len(garbage)
+    
+    async def _refresh_rcd_config(self):
+        """rcd daemons cache backends; drop them once after remotes were edited"""
+        if self._rcd_config_version != self.config_store.version:
+            self._rcd_config_version = self.config_store.version
+            await self.rcd_pool.clear_cache()
+    
+    async def _rclone(self, *args):
+        """Run a short rclone command without blocking the event loop"""
+        proc = await asyncio.create_subprocess_exec(
+            "rclone", *args, "--config", self.config_file,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            raise Exception(stderr.decode(errors='replace').strip())
+        return stdout.decode()
+    
+    async def list_dirs(self, remote: str) -> list:
+        """Directory names directly under remote (e.g. 'wasabi:BACKUPS/1-docs')"""
+        if self.rcd_pool:
+            await self._refresh_rcd_config()
+            result = await self.rcd_pool.call("operations/list", {
+                "fs": remote,
+                "remote": "",
+                "opt": {"dirsOnly": True}
+            })
+            return [item["Name"] for item in result.get("list", [])]
+        output = await self._rclone("lsf", remote, "--dirs-only")
+        return [d.strip('/') for d in output.split('\n') if d]
+    
+    async def _list_dirs_if_any(self, remote: str) -> list:
+        try:
+            return await self.list_dirs(remote)
+        except Exception as e:
+            if "directory not found" in str(e):
+                return []  # Nothing backed up yet
+            raise
+    
+    async def _list_files(self, remote: str, fast_list: bool = False) -> dict:
+        """{path: (size, mtime_ns)} of every file under remote, recursively"""
+        if self.rcd_pool:
+            await self._refresh_rcd_config()
+            try:
+                result = await self.rcd_pool.call("operations/list", {
+                    "fs": remote,
+                    "remote": "",
+                    "opt": {"recurse": True, "filesOnly": True},
+                    "_config": {"UseListR": fast_list}
+                })
+            except RcdError as e:
+                if "directory not found" in str(e):
+                    return {}
+                raise
+            return dict(index_entry(item) for item in result.get("list", []))
         
-        for old_dir in to_delete:
-            del_cmd = [
-                "rclone", "purge",
-                f"{remote}/{old_dir}",
-                "--config", f"{self.config_dir}/rclone.conf"
-            ]
-            subprocess.run(del_cmd)
\ No newline at end of file
+        # lsjson prints one item per line; parse as it streams rather than holding it all
+        cmd = ["rclone", "lsjson", "-R", "--files-only", "--no-mimetype", remote, "--config", self.config_file]
+        if fast_list:
+            cmd.append("--fast-list")
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=1024 * 1024
+        )
+        files = {}
+        stderr_task = asyncio.create_task(proc.stderr.read())
+        async for raw in proc.stdout:
+            line = raw.decode(errors='surrogateescape').strip().rstrip(',')
+            if line.startswith('{'):
+                path, meta = index_entry(json.loads(line))
+                files[path] = meta
+        stderr = (await stderr_task).decode(errors='replace').strip()
+        if await proc.wait() != 0:
+            if "directory not found" in stderr:
+                return {}
+            raise Exception(stderr)
+        return files
+    
+    async def purge(self, remote: str):
+        """Delete a remote directory and everything in it"""
+        if self.rcd_pool:
+            await self._refresh_rcd_config()
+            fs, _, path = remote.partition(':')
+            await self.rcd_pool.run_job("operations/purge", {"fs": f"{fs}:", "remote": path})
+            return
+        await self._rclone("purge", remote)
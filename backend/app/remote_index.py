@@ -0,0 +1,182 @@
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from .prescan import escape_name, unescape_name
+
+logger = logging.getLogger(__name__)
+
+REMOTE_INDEX_DIR = os.environ.get("REMOTE_INDEX_DIR", "/app/data/remote_index")
+# Past this age an index isn't trusted until a reconcile lists the remote again
+REMOTE_INDEX_MAX_AGE_HOURS = int(os.environ.get("REMOTE_INDEX_MAX_AGE_HOURS", "168"))
+# Indexes are reconciled once they are this old (a little before they expire)
+REMOTE_INDEX_RECONCILE_HOURS = int(os.environ.get("REMOTE_INDEX_RECONCILE_HOURS", "144"))
+INDEX_VERSION = 1
+
+MODTIME_RE = re.compile(r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)$")
+
+
+def parse_modtime(text: str) -> int:
+    """ns since the epoch of an rclone ModTime (RFC 3339 with up to ns precision)"""
+    match = MODTIME_RE.match(text)
+    if not match:
+        raise ValueError(f"Invalid ModTime: {text}")
+    base, fraction, tz = match.groups()
+    dt = datetime.fromisoformat(base + ("+00:00" if tz == "Z" else tz))
+    return int(dt.timestamp()) * 10 ** 9 + int((fraction or "").ljust(9, "0")[:9])
+
+
+class RemoteIndex:
+    """What a config's destination holds, kept server-side
+
+    files maps paths under the destination to (size, mtime_ns); snapshots are
+    the --backup-dir directory names under the config's BACKUPS prefix.
+    reconciled_at is when both were last listed from the remote itself; runs
+    update them in between from what they transferred.
+    """
+
+    def __init__(self, remote: str, backup_root: str, files: dict = None, snapshots: set = None,
+                 reconciled_at: datetime = None, updated_at: datetime = None):
+        self.remote = remote
+        self.backup_root = backup_root
+        self.files = files or {}
+        self.snapshots = snapshots or set()
+        self.reconciled_at = reconciled_at
+        self.updated_at = updated_at
+
+    def usable(self, now: datetime = None) -> bool:
+        now = now or datetime.utcnow()
+        return self.reconciled_at is not None and now - self.reconciled_at < timedelta(hours=REMOTE_INDEX_MAX_AGE_HOURS)
+
+    def matches(self, remote: str, backup_root: str) -> bool:
+        return self.remote == remote and self.backup_root == backup_root
+
+    def listdir(self, path: str = "") -> tuple:
+        """(sorted subdirectory names, [(name, size, mtime_ns)]) directly under path"""
+        prefix = f"{path.strip('/')}/" if path.strip("/") else ""
+        dirs, files = set(), []
+        for name, (size, mtime) in self.files.items():
+            if not name.startswith(prefix):
+                continue
+            rest = name[len(prefix):]
+            if "/" in rest:
+                dirs.add(rest.split("/", 1)[0])
+            else:
+                files.append((rest, size, mtime))
+        return sorted(dirs), sorted(files)
+
+
+def index_path(config_id: int) -> str:
+    return f"{REMOTE_INDEX_DIR}/config_{config_id}.tsv.gz"
+
+
+def load_index(config_id: int):
+    """The stored index, or None if there is none (or it can't be read)"""
+    path = index_path(config_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8", errors="surrogateescape", newline="\n") as f:
+            header = json.loads(f.readline())
+            if header.get("version") != INDEX_VERSION:
+                return None
+            files = {}
+            for line in f:
+                name, size, mtime = line.rstrip("\n").split("\t")
+                files[unescape_name(name)] = (int(size), int(mtime))
+    except (OSError, EOFError, ValueError) as e:
+        logger.warning("Ignoring unreadable remote index %s: %s", path, e)
+        return None
+    reconciled_at = header.get("reconciled_at")
+    return RemoteIndex(
+        header["remote"],
+        header["backup_root"],
+        files,
+        set(header.get("snapshots", [])),
+        datetime.fromisoformat(reconciled_at) if reconciled_at else None,
+        datetime.fromisoformat(header["updated_at"])
+    )
+
+
+def save_index(config_id: int, index: RemoteIndex):
+    """Write through a temp file so a crash never leaves a truncated index"""
+    os.makedirs(REMOTE_INDEX_DIR, exist_ok=True)
+    index.updated_at = datetime.utcnow()
+    path = index_path(config_id)
+    tmp = f"{path}.tmp"
+    header = {
+        "version": INDEX_VERSION,
+        "remote": index.remote,
+        "backup_root": index.backup_root,
+        "snapshots": sorted(index.snapshots),
+        "reconciled_at": index.reconciled_at.isoformat() if index.reconciled_at else None,
+        "updated_at": index.updated_at.isoformat()
+    }
+    with gzip.open(tmp, "wt", encoding="utf-8", errors="surrogateescape", newline="\n", compresslevel=6) as f:
+        f.write(json.dumps(header) + "\n")
+        for name in sorted(index.files):
+            size, mtime = index.files[name]
+            f.write(f"{escape_name(name)}\t{size}\t{mtime}\n")
+    os.replace(tmp, path)
+
+
+def remove_index(config_id: int):
+    path = index_path(config_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def index_entry(item: dict):
+    """(path, (size, mtime_ns)) of an rclone lsjson item"""
+    return item["Path"], (int(item.get("Size", -1)), parse_modtime(item["ModTime"]))
+
+
+class RunChanges:
+    """Destination files a sync wrote or removed, read from its JSON log
+
+    Only the last event per path counts: with --backup-dir a replaced file is
+    first copied to the snapshot, then deleted, then uploaded again.
+    """
+
+    def __init__(self):
+        self.events = {}  # path -> "copied" | "removed"
+        self.backed_up = 0
+
+    def feed(self, entry: dict):
+        path = entry.get("object")
+        msg = entry.get("msg", "")
+        if not path:
+            return
+        if msg.startswith("Copied (server-side copy)") or msg.startswith("Moved"):
+            # A local -> remote sync only copies server-side into the --backup-dir
+            self.backed_up += 1
+            if msg.startswith("Moved"):
+                self.events[path] = "removed"
+        elif msg.startswith("Copied"):
+            self.events[path] = "copied"
+        elif msg.startswith("Deleted"):
+            self.events[path] = "removed"
+
+    def apply(self, index: RemoteIndex, source: str, scanned: dict = None):
+        """Update index with this run's events
+
+        Copied files get their source's size and mtime, preferring the pre-scan
+        (what was there before the upload started), so a file changed during the
+        run never looks up to date afterwards.
+        """
+        for path, event in self.events.items():
+            if event == "removed":
+                index.files.pop(path, None)
+                continue
+            meta = scanned.get(path) if scanned else None
+            if meta is None:
+                try:
+                    st = os.stat(os.path.join(source, path))
+                except OSError:
+                    index.files.pop(path, None)
+                    continue
+                meta = (st.st_size, st.st_mtime_ns)
+            index.files[path] = meta[:2]
+
@@ -0,0 +1,126 @@
+import asyncio
+import os
+from datetime import datetime
+
+SNAPSHOT_FORMAT = '%Y-%m-%d_%H-%M-%S'
+KEEP_WEEKS = 4  # weekly snapshots kept when keep_weekly is on and the config doesn't say how many
+PRUNE_WORKERS = int(os.environ.get("PRUNE_WORKERS", "8"))
+
+
+def parse_snapshot(name: str):
+    try:
+        return datetime.strptime(name, SNAPSHOT_FORMAT)
+    except ValueError:
+        return None
+
+
+def plan_retention(names: list, keep_daily_days: int, keep_weekly: bool, keep_monthly: int = 0,
+                   keep_weeks: int = KEEP_WEEKS):
+    """Split snapshot directory names into (keep, delete) using daily/weekly/monthly buckets
+
+    The newest snapshot of each of the last keep_daily_days days, keep_weeks
+    ISO weeks (when keep_weekly is on) and keep_monthly months that have
+    snapshots is kept. Directories that don't look like snapshots are never
+    deleted, and nothing is deleted when no rule keeps anything (that reads
+    as "retention off", not "delete all").
+    """
+    if not (keep_daily_days or keep_weekly or keep_monthly):
+        return sorted(names, reverse=True), []
+    dated = sorted(
+        ((parse_snapshot(name), name) for name in names if parse_snapshot(name)),
+        reverse=True
+    )
+    buckets = [
+        (lambda dt: dt.date(), keep_daily_days or 0),
+        (lambda dt: dt.isocalendar()[:2], (keep_weeks or KEEP_WEEKS) if keep_weekly else 0),
+        (lambda dt: (dt.year, dt.month), keep_monthly or 0),
+    ]
+
+    keep = {name for name in names if not parse_snapshot(name)}
+    for bucket_of, limit in buckets:
+        seen = set()
+        for dt, name in dated:
+            bucket = bucket_of(dt)
+            if bucket in seen:
+                continue
+            if len(seen) >= limit:
+                break
+            seen.add(bucket)
+            keep.add(name)
+
+    delete = [name for _, name in dated if name not in keep]
+    return sorted(keep, reverse=True), delete
+
+
+class RetentionEngine:
+    """Prunes a config's BACKUPS prefix with one listing and parallel purges"""
+
+    def __init__(self, rclone_manager, workers: int = PRUNE_WORKERS):
+        self.rclone_manager = rclone_manager
+        self.workers = workers
+
+    async def prune(self, config, dry_run: bool = False) -> dict:
+        if config.snapshot_mode == "dedupe":
+            return await self.prune_dedupe(config, dry_run)
+        root = self.rclone_manager.backup_root(config)
+        # The remote index answers this without a listing when it is fresh
+        names, listing = await self.rclone_manager.snapshot_names(config)
+        keep, delete = plan_retention(
+            names, config.keep_daily_days, config.keep_weekly, config.keep_monthly, config.keep_weeks
+        )
+        report = {
+            "root": root,
+            "listing": listing,
+            "dry_run": dry_run,
+            "keep": keep,
+            "delete": delete,
+            "deleted": [],
+            "errors": {}
+        }
+        if dry_run or not delete:
+            return report
+
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def remove(name):
+            async with semaphore:
+                try:
+                    await self.rclone_manager.purge(f"{root}/{name}")
+                    report["deleted"].append(name)
+                except Exception as e:
+                    if "directory not found" in str(e):
+                        report["deleted"].append(name)  # Already gone (the index was behind)
+                    else:
+                        report["errors"][name] = str(e)
+
+        await asyncio.gather(*(remove(name) for name in delete))
+        await self.rclone_manager.forget_snapshots(config, report["deleted"])
+        return report
+
+    async def prune_dedupe(self, config, dry_run: bool = False) -> dict:
+        """Drop expired snapshot manifests, then the chunks no remaining snapshot uses"""
+        def plan(names):
+            return plan_retention(names, config.keep_daily_days, config.keep_weekly, config.keep_monthly,
+                                  config.keep_weeks)
+
+        # A dry run only reports; the real run plans again on a listing taken under the repository lock
+        keep, delete = plan(await self.rclone_manager.dedupe_snapshots(config))
+        report = {
+            "root": f"{config.remote_name}:{config.remote_path}",
+            "listing": "remote",
+            "dry_run": dry_run,
+            "keep": keep,
+            "delete": delete,
+            "deleted": [],
+            "chunks_deleted": 0,
+            "errors": {}
+        }
+        if dry_run:
+            return report
+        try:
+            report["keep"], report["deleted"], report["chunks_deleted"] = \
+                await self.rclone_manager.collect_garbage(config, plan)
+            report["delete"] = report["deleted"]
+        except Exception as e:
+            report["errors"]["gc"] = str(e)
+        return report
@@ -1,23 +1,73 @@
-from apscheduler.schedulers.background import BackgroundScheduler
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from apscheduler.events import EVENT_JOB_SUBMITTED
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from sqlalchemy.orm import Session
-from .models import BackupConfig
+from .models import BackupConfig, BackupJob
 from .database import SessionLocal
-import asyncio
+from .history import compact_job_history
+from .logstore import enforce_log_retention
+from .executor import PRIORITY_SCHEDULED
+from .metrics import SCHEDULER_LAG
+from .planner import OffsetTrigger, cron_trigger, config_history, jitter_offset, plan
+from .remote_index import load_index, REMOTE_INDEX_RECONCILE_HOURS
+
+logger = logging.getLogger(__name__)
 
 class BackupScheduler:
     def __init__(self, rclone_manager):
-        self.scheduler = BackgroundScheduler()
+        # Runs on the app's event loop so backups share the async process engine
+        self.scheduler = AsyncIOScheduler()
         self.rclone_manager = rclone_manager
+        # config_id -> planned offset (seconds) into its schedule window
+        self.offsets = {}
+        self.scheduler.add_listener(self._on_submitted, EVENT_JOB_SUBMITTED)
     
     def start(self):
         # Load all enabled configs
         db = SessionLocal()
         configs = db.query(BackupConfig).filter(BackupConfig.enabled == True).all()
+        self.offsets = self._plan_offsets(db, configs)
         for config in configs:
             self.add_job(config)
         db.close()
         
+        # Roll old job rows up into daily summaries so the jobs table stays small
+        self.scheduler.add_job(
+            self._compact_history,
+            trigger=CronTrigger(hour=4, minute=30),
+            id="compact_job_history",
+            replace_existing=True,
+            coalesce=True
+        )
+        # Re-place windowed configs as their run history changes
+        self.scheduler.add_job(
+            self.replan,
+            trigger=CronTrigger(hour=12, minute=5),
+            id="replan_schedule",
+            replace_existing=True,
+            coalesce=True
+        )
+        # Keep job logs (local and agent-shipped) within LOG_RETENTION_MB
+        self.scheduler.add_job(
+            self._enforce_log_retention,
+            trigger=CronTrigger(minute=15),
+            id="log_retention",
+            replace_existing=True,
+            coalesce=True
+        )
+        
+        # List remotes again for indexes that are missing, stale or were invalidated
+        self.scheduler.add_job(
+            self._reconcile_indexes,
+            trigger=CronTrigger(minute=45),
+            id="reconcile_remote_indexes",
+            replace_existing=True,
+            coalesce=True
+        )
+        
         self.scheduler.start()
     
     def stop(self):
@@ -25,21 +75,27 @@ class BackupScheduler:
     
     def add_job(self, config: BackupConfig):
         # Parse cron (e.g., "0 2 * * *")
-        parts = config.schedule_cron.split()
-        trigger = CronTrigger(
-            minute=parts[0],
-            hour=parts[1],
-            day=parts[2],
-            month=parts[3],
-            day_of_week=parts[4]
-        )
+        trigger = cron_trigger(config.schedule_cron)
+        misfire_grace_time = 3600
+        
+        window = (config.schedule_window or 0) * 60
+        if window:
+            # Run somewhere within the window after each cron time, at the planned offset
+            offset = self.offsets.get(config.id)
+            if offset is None or offset >= window:
+                offset = jitter_offset(config.id, window)
+            trigger = OffsetTrigger(trigger, timedelta(seconds=offset))
+            # A late start is still fine as long as it is inside the window
+            misfire_grace_time = max(window - offset, 60)
         
         self.scheduler.add_job(
-            self._run_backup_sync,
+            self._run_backup,
             trigger=trigger,
             id=f"backup_{config.id}",
             args=[config.id],
-            replace_existing=True
+            replace_existing=True,
+            coalesce=True,
+            misfire_grace_time=misfire_grace_time
         )
     
     def remove_job(self, config_id: int):
@@ -48,10 +104,97 @@ class BackupScheduler:
         except:
             pass
     
-    def _run_backup_sync(self, config_id: int):
-        """Sync wrapper for async backup"""
+    def _plan_offsets(self, db: Session, configs: list) -> dict:
+        if not any(config.schedule_window for config in configs):
+            return {}
+        history = config_history(db, [config.id for config in configs])
+        offsets, _ = plan(configs, history, datetime.now(self.scheduler.timezone))
+        return offsets
+    
+    def preview(self, db: Session, hours: int) -> list:
+        """Planned runs of all enabled configs over the next hours"""
+        configs = db.query(BackupConfig).filter(BackupConfig.enabled == True).all()
+        history = config_history(db, [config.id for config in configs])
+        _, runs = plan(configs, history, datetime.now(self.scheduler.timezone), hours)
+        return runs
+    
+    def replan(self):
+        """Recompute window offsets and move the jobs whose offset changed"""
+        db = SessionLocal()
+        try:
+            configs = db.query(BackupConfig).filter(BackupConfig.enabled == True).all()
+            offsets = self._plan_offsets(db, configs)
+            changed = [config for config in configs if offsets.get(config.id) != self.offsets.get(config.id)]
+            self.offsets = offsets
+            for config in changed:
+                if self.scheduler.get_job(f"backup_{config.id}"):
+                    self.add_job(config)
+        finally:
+            db.close()
+    
+    def _on_submitted(self, event):
+        """Scheduler lag: how late a backup started relative to its cron fire time"""
+        if event.job_id.startswith("backup_") and event.scheduled_run_times:
+            lag = datetime.now(timezone.utc) - event.scheduled_run_times[0]
+            SCHEDULER_LAG.observe(max(lag.total_seconds(), 0))
+    
+    async def _run_backup(self, config_id: int):
+        """Start a scheduled backup; the job itself runs in the background"""
+        db = SessionLocal()
+        try:
+            config = db.query(BackupConfig).filter(BackupConfig.id == config_id).first()
+            if config:
+                await self.rclone_manager.run_backup(config, db, priority=PRIORITY_SCHEDULED)
+        finally:
+            db.close()
+    
+    def _compact_history(self):
+        """Runs in APScheduler's thread pool; it's plain blocking DB work"""
         db = SessionLocal()
-        config = db.query(BackupConfig).filter(BackupConfig.id == config_id).first()
-        if config:
-            asyncio.run(self.rclone_manager.run_backup(config, db))
-        db.close()
\ No newline at end of file
+        try:
+            compacted = compact_job_history(db)
+            if compacted:
+                logger.info("Compacted %d old job rows into daily summaries", compacted)
+        finally:
+            db.close()
+    
+    def _enforce_log_retention(self):
+        freed = enforce_log_retention()
+        if freed:
+            logger.info("Log retention freed %d MB", freed // (1024 * 1024))
+    
+    def _reconcile_candidates(self):
+        """(local configs, ids of configs with a job in flight); blocking DB work for a worker thread"""
+        db = SessionLocal()
+        try:
+            configs = db.query(BackupConfig).filter(
+                BackupConfig.enabled == True,
+                BackupConfig.agent_id.is_(None)
+            ).all()
+            busy = {
+                config_id for (config_id,) in db.query(BackupJob.config_id).filter(
+                    BackupJob.status.in_(["queued", "running", "paused"])
+                )
+            }
+            return configs, busy
+        finally:
+            db.close()
+    
+    async def _reconcile_indexes(self):
+        """Reconcile due remote indexes one at a time, skipping configs with a job in flight"""
+        configs, busy = await asyncio.to_thread(self._reconcile_candidates)
+        
+        due = datetime.utcnow() - timedelta(hours=REMOTE_INDEX_RECONCILE_HOURS)
+        for config in configs:
+            if config.id in busy or config.snapshot_mode == "dedupe":
+                continue
+            index = await asyncio.to_thread(load_index, config.id)
+            remote = f"{config.remote_name}:{config.remote_path}"
+            fresh = index and index.reconciled_at and index.reconciled_at > due
+            if fresh and index.matches(remote, self.rclone_manager.backup_root(config)):
+                continue
+            try:
+                index = await self.rclone_manager.reconcile_index(config)
+                logger.info("Reconciled remote index of %s: %d files, %d snapshots", config.name, len(index.files), len(index.snapshots))
+            except Exception as e:
+                logger.warning("Failed to reconcile remote index of %s: %s", config.name, e)
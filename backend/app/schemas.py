@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict
-from datetime import datetime
+from typing import Optional, Dict, Any
+from datetime import date, datetime
 
 class UserCreate(BaseModel):
     username: str
@@ -23,11 +23,19 @@ class AgentResponse(BaseModel):
     platform: str
     version: str
     status: str
+    bwlimit: Optional[str] = None
     last_seen: Optional[datetime]
     created_at: datetime
     
     class Config:
         from_attributes = True
+
+class JobLimitsUpdate(BaseModel):
+    bwlimit: Optional[str] = None  # rclone --bwlimit value or timetable; "off" lifts the limit
+    transfers: Optional[int] = Field(None, ge=1, le=256)
+
+class AgentBandwidthUpdate(BaseModel):
+    bwlimit: Optional[str] = None  # rclone --bwlimit value or timetable; None removes the limit
 class AgentRegisterResponse(BaseModel):
     id: int
     hostname: str
@@ -45,31 +53,33 @@ class AgentTokenResponse(BaseModel):
     token: str
     expires_in: int = 3600
 
-class BackupConfigCreate(BaseModel):
-    name: str
-    agent_id: Optional[int] = None
-    source_path: str
-    remote_type: str
-    remote_name: str
-    remote_path: str
-    credentials: Dict[str, str]
-    is_incremental: bool = True
-    schedule_cron: str = "0 2 * * *"
-    enabled: bool = True
-    keep_daily_days: int = 3
-    keep_weekly: bool = True
-
 class BackupConfigResponse(BaseModel):
     id: int
     name: str
     agent_id: Optional[int]
+    agent_hostname: Optional[str] = None
     source_path: str
     remote_type: str
     remote_name: str
     remote_path: str
     is_incremental: bool
     schedule_cron: str
+    schedule_window: Optional[int] = 0
     enabled: bool
+    keep_daily_days: int
+    keep_weekly: bool
+    keep_weeks: Optional[int] = 4
+    keep_monthly: Optional[int]
+    transfers: Optional[int] = None
+    checkers: Optional[int] = None
+    buffer_size: Optional[str] = None
+    multi_thread_streams: Optional[int] = None
+    bwlimit: Optional[str] = None
+    fast_list: Optional[bool] = False
+    max_backlog: Optional[int] = None
+    auto_tune: Optional[bool] = False
+    prescan: Optional[bool] = False
+    snapshot_mode: Optional[str] = "sync"
     last_run: Optional[datetime]
     
     class Config:
@@ -78,19 +88,48 @@ class BackupConfigResponse(BaseModel):
 class BackupJobResponse(BaseModel):
     id: int
     config_id: int
+    config_name: Optional[str] = None
     agent_id: Optional[int]
+    agent_hostname: Optional[str] = None
     status: str
     started_at: datetime
     completed_at: Optional[datetime]
     error_message: Optional[str]
     bytes_transferred: int
     
+    class Config:
+        from_attributes = True
+
+class JobDailySummaryResponse(BaseModel):
+    config_id: int
+    day: date
+    runs: int
+    successes: int
+    failures: int
+    bytes_transferred: int
+    total_duration_seconds: float
+    
+    class Config:
+        from_attributes = True
+
+class JobProgressResponse(BaseModel):
+    id: int
+    status: str
+    bytes_transferred: int
+    bytes_total: Optional[int]
+    transfer_speed: Optional[float]
+    eta_seconds: Optional[int]
+    files_checked: Optional[int]
+    files_transferred: Optional[int]
+    error_count: Optional[int]
+    progress_updated_at: Optional[datetime]
+    
     class Config:
         from_attributes = True
 class RemoteProfileCreate(BaseModel):
     name: str
     remote_type: str
-    credentials: Dict[str, str]
+    credentials: Dict[str, Any]
     region: Optional[str] = "us-east-1"
     endpoint: Optional[str] = "s3.wasabisys.com"
 
@@ -105,7 +144,6 @@ class RemoteProfileResponse(BaseModel):
     class Config:
         from_attributes = True
 
-# Update BackupConfigCreate to support profile_id
 class BackupConfigCreate(BaseModel):
     name: str
     agent_id: Optional[int] = None
@@ -114,9 +152,27 @@ class BackupConfigCreate(BaseModel):
     remote_type: Optional[str] = None  # Optional if using profile
     remote_name: str
     remote_path: str
-    credentials: Optional[Dict[str, str]] = None  # Optional if using profile
+    credentials: Optional[Dict[str, Any]] = None  # Optional if using profile; "options" overrides backend tuning
     is_incremental: bool = True
     schedule_cron: str = "0 2 * * *"
+    schedule_window: int = Field(0, ge=0, le=1440)  # minutes
     enabled: bool = True
     keep_daily_days: int = 3
-    keep_weekly: bool = True        
\ No newline at end of file
+    keep_weekly: bool = True
+    keep_weeks: int = Field(4, ge=1, le=520)  # weekly snapshots kept when keep_weekly is on
+    keep_monthly: int = 0
+    transfers: Optional[int] = Field(None, ge=1, le=256)
+    checkers: Optional[int] = Field(None, ge=1, le=512)
+    buffer_size: Optional[str] = None
+    multi_thread_streams: Optional[int] = Field(None, ge=0, le=64)
+    bwlimit: Optional[str] = None
+    fast_list: bool = False
+    max_backlog: Optional[int] = Field(None, ge=1)
+    auto_tune: bool = False
+    prescan: bool = False
+    snapshot_mode: str = Field("sync", pattern="^(sync|dedupe)$")
+
+class RestoreRequest(BaseModel):
+    snapshot: str
+    target_path: str  # absolute path of an empty (or missing) directory on the server
+    path: Optional[str] = ""  # restore only this file or directory of the snapshot
\ No newline at end of file
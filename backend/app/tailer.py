@@ -0,0 +1,223 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+from collections import deque
+from sqlalchemy import select
+from .database import AsyncSessionLocal
+from .events import bus
+from .history import FINISHED_STATUSES
+from .logs import LOG_CHUNK_SIZE, tail_offset
+from .logstore import open_log
+from .models import BackupJob
+
+TAIL_BACKLOG_LINES = 200
+# Lines arriving within this window go out as one frame
+TAIL_BATCH_INTERVAL = 0.1
+# Without inotify (or while the log doesn't exist yet) the file is polled
+TAIL_POLL_INTERVAL = 0.5
+# Safety net in case a status event was missed: re-check the job after this long idle
+TAIL_IDLE_RECHECK = 30
+# Frames a subscriber may fall behind before it is dropped
+TAIL_QUEUE_SIZE = 256
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+# For segmented agent logs the directory is watched
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_libc()
+
+
+class InotifyWatch:
+    """Calls on_change whenever the watched file (or a file in the watched directory) changes; Linux only"""
+
+    def __init__(self, path: str, on_change):
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF | IN_MOVED_TO | IN_CREATE
+        if _libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self.on_change = on_change
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(self.fd, self._readable)
+
+    def _readable(self):
+        # Only "something changed" matters; drain and coalesce the events
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        self.on_change()
+
+    def close(self):
+        self.loop.remove_reader(self.fd)
+        os.close(self.fd)
+
+
+def open_watch(path: str, on_change):
+    if _libc is None:
+        return None
+    try:
+        return InotifyWatch(path, on_change)
+    except OSError:
+        return None
+
+
+class Subscriber:
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=TAIL_QUEUE_SIZE)
+
+    def put(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Too slow to keep up; end its stream rather than buffer without bound
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self):
+        """Next frame of log text, or None once the stream is over"""
+        return await self.queue.get()
+
+
+class LogTailer:
+    """Follows one job's log and fans batched frames out to every subscriber"""
+
+    def __init__(self, hub, job_id: int, path: str):
+        self.hub = hub
+        self.job_id = job_id
+        self.path = path
+        self.subscribers = set()
+        self.backlog = deque(maxlen=TAIL_BACKLOG_LINES)
+        self.partial = b""
+        self.finished = False
+        self.wake = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    def add(self) -> Subscriber:
+        subscriber = Subscriber()
+        if self.backlog:
+            subscriber.put("".join(self.backlog))
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def _on_status(self, status):
+        # None: the job row is gone
+        if status is None or status in FINISHED_STATUSES:
+            self.finished = True
+            self.wake.set()
+
+    async def _run(self):
+        bus.subscribe(self.job_id, self._on_status)
+        watch = None
+        try:
+            while not os.path.exists(self.path) and not self.finished and self.subscribers:
+                await self._sleep(TAIL_POLL_INTERVAL)
+            if not os.path.exists(self.path):
+                return
+
+            watch = open_watch(self.path, self.wake.set)
+            with open_log(self.path) as f:
+                f.seek(tail_offset(self.path, TAIL_BACKLOG_LINES))
+                self._read(f, broadcast=False)
+                for subscriber in self.subscribers:
+                    if self.backlog:
+                        subscriber.put("".join(self.backlog))
+
+                idle = 0.0
+                while not self.finished and self.subscribers:
+                    timeout = TAIL_IDLE_RECHECK if watch else TAIL_POLL_INTERVAL
+                    woken = await self._sleep(timeout)
+                    if woken:
+                        await asyncio.sleep(TAIL_BATCH_INTERVAL)
+                    if self._read(f):
+                        idle = 0.0
+                        continue
+                    idle += TAIL_BATCH_INTERVAL if woken else timeout
+                    if idle >= TAIL_IDLE_RECHECK:
+                        idle = 0.0
+                        self._on_status(await self._job_status())
+                # Whatever was written between the last wakeup and the job finishing
+                self._read(f)
+        finally:
+            bus.unsubscribe(self.job_id, self._on_status)
+            if watch:
+                watch.close()
+            for subscriber in self.subscribers:
+                subscriber.put(None)
+            self.hub.tailers.pop(self.job_id, None)
+
+    async def _sleep(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.wake.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.wake.clear()
+
+    async def _job_status(self):
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(
+                select(BackupJob.status).where(BackupJob.id == self.job_id)
+            )).scalar()
+
+    def _read(self, f, broadcast: bool = True) -> bool:
+        """Read what was appended since last time; True if there were new lines"""
+        got = False
+        while True:
+            chunk = f.read(LOG_CHUNK_SIZE)
+            if not chunk:
+                return got
+            lines = (self.partial + chunk).split(b'\n')
+            self.partial = lines.pop()
+            if not lines:
+                continue
+            frame = [line.decode(errors='replace') + '\n' for line in lines]
+            self.backlog.extend(frame)
+            got = True
+            if broadcast:
+                text = "".join(frame)
+                for subscriber in list(self.subscribers):
+                    subscriber.put(text)
+
+
+class LogTailHub:
+    """One tailer per job log however many clients are watching it"""
+
+    def __init__(self):
+        self.tailers = {}
+
+    def subscribe(self, job_id: int, path: str) -> Subscriber:
+        tailer = self.tailers.get(job_id)
+        if tailer is None:
+            tailer = self.tailers[job_id] = LogTailer(self, job_id, path)
+        return tailer.add()
+
+    def unsubscribe(self, job_id: int, subscriber: Subscriber):
+        tailer = self.tailers.get(job_id)
+        if tailer:
+            tailer.subscribers.discard(subscriber)
+            if not tailer.subscribers:
+                # Let the tailer notice and shut down
+                tailer.wake.set()
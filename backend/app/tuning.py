@@ -0,0 +1,137 @@
+from sqlalchemy import select
+from .models import BackupJob
+
+DEFAULT_TRANSFERS = 8
+DEFAULT_CHECKERS = 16
+MAX_AUTO_TRANSFERS = 64
+AUTO_TUNE_HISTORY = 10
+
+# File-size profile boundaries for auto-tune
+SMALL_FILE_BYTES = 1024 * 1024
+LARGE_FILE_BYTES = 256 * 1024 * 1024
+MANY_FILES = 100_000
+# Runs that moved less than this are dominated by listing, not transfer speed
+FEEDBACK_MIN_BYTES = 64 * 1024 * 1024
+
+
+class Tuning:
+    """rclone transfer settings for one run"""
+
+    def __init__(self, transfers: int = None, checkers: int = None, buffer_size: str = None,
+                 multi_thread_streams: int = None, bwlimit: str = None, fast_list: bool = False,
+                 max_backlog: int = None):
+        self.transfers = transfers or DEFAULT_TRANSFERS
+        self.checkers = checkers or DEFAULT_CHECKERS
+        self.buffer_size = buffer_size
+        self.multi_thread_streams = multi_thread_streams
+        self.bwlimit = bwlimit
+        self.fast_list = bool(fast_list)
+        self.max_backlog = max_backlog
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            transfers=config.transfers,
+            checkers=config.checkers,
+            buffer_size=config.buffer_size,
+            multi_thread_streams=config.multi_thread_streams,
+            bwlimit=config.bwlimit,
+            fast_list=config.fast_list,
+            max_backlog=config.max_backlog
+        )
+
+    def flags(self) -> list:
+        """Command-line flags for rclone sync"""
+        flags = ["--transfers", str(self.transfers), "--checkers", str(self.checkers)]
+        if self.buffer_size:
+            flags += ["--buffer-size", self.buffer_size]
+        if self.multi_thread_streams is not None:
+            flags += ["--multi-thread-streams", str(self.multi_thread_streams)]
+        if self.bwlimit:
+            flags += ["--bwlimit", self.bwlimit]
+        if self.fast_list:
+            flags.append("--fast-list")
+        if self.max_backlog:
+            flags += ["--max-backlog", str(self.max_backlog)]
+        return flags
+
+    def rcd_options(self) -> dict:
+        """The same settings as an rc _config block
+
+        bwlimit is left out: on rcd it is daemon-wide (core/bwlimit), not per call.
+        """
+        options = {"Transfers": self.transfers, "Checkers": self.checkers}
+        if self.buffer_size:
+            options["BufferSize"] = self.buffer_size
+        if self.multi_thread_streams is not None:
+            options["MultiThreadStreams"] = self.multi_thread_streams
+        if self.fast_list:
+            options["UseListR"] = True
+        if self.max_backlog:
+            options["MaxBacklog"] = self.max_backlog
+        return options
+
+
+def history_query(config_id: int):
+    """Recent successful runs of a config, newest first"""
+    return (
+        select(BackupJob)
+        .where(BackupJob.config_id == config_id, BackupJob.status == "success")
+        .order_by(BackupJob.started_at.desc())
+        .limit(AUTO_TUNE_HISTORY)
+    )
+
+
+def auto_tune(config, history: list) -> Tuning:
+    """Pick settings from what earlier runs looked like
+
+    The file-size profile of past runs sets the starting point: many small
+    files want lots of parallel transfers and checkers, a few huge files want
+    fewer transfers split into multi-thread streams. Once runs with different
+    transfer counts have been measured, the fastest one wins; while the
+    highest count tried is also the fastest, the next run probes double that.
+    """
+    tuning = Tuning.from_config(config)
+    runs = [job for job in history if job.started_at and job.completed_at]
+    if not runs:
+        return tuning
+
+    files = max(job.files_checked or 0 for job in runs)
+    moved_files = sum(job.files_transferred or 0 for job in runs)
+    moved_bytes = sum(job.bytes_transferred or 0 for job in runs)
+    if moved_files:
+        avg_size = moved_bytes / moved_files
+        if avg_size < SMALL_FILE_BYTES:
+            tuning.transfers, tuning.checkers = 32, 64
+            # Many transfers in flight; keep per-transfer read-ahead small
+            tuning.buffer_size = tuning.buffer_size or "4M"
+        elif avg_size > LARGE_FILE_BYTES:
+            tuning.transfers, tuning.checkers = 4, 8
+            tuning.multi_thread_streams = 8
+            tuning.buffer_size = tuning.buffer_size or "64M"
+        else:
+            tuning.transfers, tuning.checkers = 16, 32
+    if files > MANY_FILES:
+        tuning.fast_list = True
+        tuning.max_backlog = max(tuning.max_backlog or 0, files // 5)
+
+    # Best throughput per transfer count among runs big enough to tell
+    rates = {}
+    for job in runs:
+        if not job.transfers or (job.bytes_transferred or 0) < FEEDBACK_MIN_BYTES:
+            continue
+        rate = job.bytes_transferred / max((job.completed_at - job.started_at).total_seconds(), 1)
+        rates[job.transfers] = max(rates.get(job.transfers, 0), rate)
+    if rates:
+        best = max(rates, key=rates.get)
+        if best == max(rates) and runs[0].transfers == best and best < MAX_AUTO_TRANSFERS:
+            best = min(best * 2, MAX_AUTO_TRANSFERS)
+        tuning.transfers = best
+        tuning.checkers = max(tuning.checkers, best * 2)
+    return tuning
+
+
+def tuning_for(config, history: list = None) -> Tuning:
+    if config.auto_tune:
+        return auto_tune(config, history or [])
+    return Tuning.from_config(config)
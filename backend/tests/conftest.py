@@ -0,0 +1,82 @@
+import os
+import sys
+import tempfile
+
+# The app reads its settings at import time; point everything at a scratch directory first
+DATA_DIR = tempfile.mkdtemp(prefix="rclone-manager-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{DATA_DIR}/app.db")
+os.environ.setdefault("PRESCAN_DIR", f"{DATA_DIR}/prescan")
+os.environ.setdefault("REMOTE_INDEX_DIR", f"{DATA_DIR}/remote_index")
+os.environ.setdefault("DEDUPE_DIR", f"{DATA_DIR}/dedupe")
+os.environ.setdefault("LOG_DIR", f"{DATA_DIR}/logs")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "agent"))
+
+import itertools
+import socket
+import threading
+import time
+import httpx
+import pytest
+import uvicorn
+
+_users = itertools.count()
+
+
+def login(client) -> dict:
+    """Register a fresh user; returns auth headers"""
+    username = f"user{next(_users)}-{os.getpid()}"
+    token = client.post("/api/auth/register", json={"username": username, "password": "secret"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def headers(client):
+    return login(client)
+
+
+@pytest.fixture(scope="session")
+def live_server():
+    """Base URL of the app served by uvicorn in a thread
+
+    One server for the whole session: the app's scheduler is bound to the
+    event loop it first starts on, so the app can't be started twice.
+    """
+    from app.main import app
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started:
+        assert time.time() < deadline, "server did not start"
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}"
+    # Don't wait out long-polls left parked
+    server.should_exit = server.force_exit = True
+    thread.join(timeout=30)
+
+
+@pytest.fixture(scope="module")
+def client(live_server):
+    with httpx.Client(base_url=live_server, timeout=30) as c:
+        yield c
+
+
+@pytest.fixture(scope="module")
+def api(live_server):
+    """Logged-in HTTP client for live_server"""
+    with httpx.Client(base_url=live_server, timeout=30) as c:
+        c.headers.update(login(c))
+        yield c
+
+
+def register_agent(api) -> dict:
+    token = api.post("/api/agents/generate-token").json()["token"]
+    return api.post(f"/api/agents/register?install_token={token}", json={
+        "hostname": f"test-{os.getpid()}-{time.time()}", "ip_address": "127.0.0.1", "platform": "linux"
+    }).json()
@@ -0,0 +1,86 @@
+"""Agent endpoints as the agent uses them: register, claim, report"""
+import time
+
+
+def queue_agent_job(client, headers, tmp_path):
+    """(agent, leased job dict) for a fresh agent with one claimed job"""
+    token = client.post("/api/agents/generate-token", headers=headers).json()["token"]
+    agent = client.post(f"/api/agents/register?install_token={token}", json={
+        "hostname": f"api-{time.time()}", "ip_address": "127.0.0.1", "platform": "linux"
+    }).json()
+    config = client.post("/api/configs", headers=headers, json={
+        "name": f"agent-api-{time.time()}", "agent_id": agent["id"], "source_path": str(tmp_path),
+        "remote_type": "local", "remote_name": f"api{agent['id']}", "remote_path": str(tmp_path / "dest"),
+        "credentials": {}, "is_incremental": False
+    }).json()
+    client.post(f"/api/configs/{config['id']}/run", headers=headers)
+    jobs = client.get(f"/api/agents/{agent['id']}/jobs", params={"agent_token": agent["agent_token"]}).json()
+    assert len(jobs) == 1
+    return agent, jobs[0]
+
+
+def complete(client, agent, job, payload, **params):
+    return client.post(
+        f"/api/agents/{agent['id']}/jobs/{job['id']}/complete",
+        params={"agent_token": agent["agent_token"], **params},
+        json=payload
+    )
+
+
+def test_complete_keeps_bytes_from_stats(client, headers, tmp_path):
+    agent, job = queue_agent_job(client, headers, tmp_path)
+    reply = complete(client, agent, job, {"status": "success", "stats": {"bytes": 4242, "totalBytes": 4242}},
+                     lease_token=job["lease_token"])
+    assert reply.status_code == 200
+    progress = client.get(f"/api/jobs/{job['id']}/progress", headers=headers).json()
+    assert progress["status"] == "success"
+    assert progress["bytes_transferred"] == 4242
+
+
+def test_complete_requires_current_lease(client, headers, tmp_path):
+    agent, job = queue_agent_job(client, headers, tmp_path)
+    assert complete(client, agent, job, {"status": "success"}).status_code == 422
+    assert complete(client, agent, job, {"status": "success"}, lease_token="stale").status_code == 409
+
+    client.delete(f"/api/jobs/{job['id']}", headers=headers)
+    reply = complete(client, agent, job, {"status": "success"}, lease_token=job["lease_token"])
+    assert reply.status_code == 409
+    assert client.get(f"/api/jobs/{job['id']}/progress", headers=headers).json()["status"] == "cancelled"
+
+
+def test_complete_rejects_non_final_status(client, headers, tmp_path):
+    agent, job = queue_agent_job(client, headers, tmp_path)
+    for status in ("running", "pending", "whatever"):
+        assert complete(client, agent, job, {"status": status}, lease_token=job["lease_token"]).status_code == 422
+    assert client.get(f"/api/jobs/{job['id']}/progress", headers=headers).json()["status"] == "running"
+    assert complete(client, agent, job, {"status": "failed"}, lease_token=job["lease_token"]).status_code == 200
+
+
+def upload(client, agent, job, offset: int, data: bytes, chunked: bool = False):
+    content = (part for part in (data,)) if chunked else data
+    return client.post(
+        f"/api/agents/{agent['id']}/jobs/{job['id']}/logs",
+        params={"agent_token": agent["agent_token"], "offset": offset},
+        content=content
+    )
+
+
+def test_log_upload_limits(client, headers, tmp_path, monkeypatch):
+    import app.main
+    monkeypatch.setattr(app.main, "LOG_MAX_JOB_BYTES", 100)
+    monkeypatch.setattr(app.main, "LOG_MAX_CHUNK", 64)
+    agent, job = queue_agent_job(client, headers, tmp_path)
+
+    # Oversized chunked bodies (no Content-Length) are refused too
+    assert upload(client, agent, job, 0, b"x" * 65, chunked=True).status_code == 413
+    assert upload(client, agent, job, 0, b"a" * 60, chunked=True).json() == {"offset": 60}
+
+    reply = upload(client, agent, job, 60, b"b" * 60)
+    assert reply.status_code == 413
+    size = reply.json()["detail"]["offset"]
+    assert upload(client, agent, job, size, b"c" * 10).status_code == 413
+    assert upload(client, agent, job, 60, b"b" * 60).status_code == 413
+
+    log = client.get(f"/api/jobs/{job['id']}/logs", headers=headers).json()["logs"]
+    assert log.startswith("a" * 60 + "b" * 40)
+    assert log.count("log truncated") == 1 and "c" * 10 not in log
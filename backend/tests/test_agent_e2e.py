@@ -0,0 +1,57 @@
+"""The Python agent against a live server, backing up to a local filesystem remote"""
+import filecmp
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import pytest
+from conftest import BACKEND_DIR, register_agent
+
+pytestmark = pytest.mark.skipif(shutil.which("rclone") is None, reason="rclone is not installed")
+
+
+def write_agent_config(agent: dict, server: str, work_dir) -> str:
+    path = os.path.join(work_dir, "config.json")
+    with open(path, "w") as f:
+        json.dump({"agent_id": agent["id"], "agent_token": agent["agent_token"], "server_url": server}, f)
+    return path
+
+
+def run_agent(config_path: str):
+    return subprocess.run(
+        [sys.executable, "-m", "rclone_agent", "--config", config_path, "--once"],
+        cwd=os.path.join(BACKEND_DIR, "agent"), capture_output=True, text=True, timeout=120
+    )
+
+
+def test_agent_backs_up_to_local_remote(api, live_server, tmp_path):
+    source, dest, work_dir = tmp_path / "source", tmp_path / "dest", tmp_path / "agent"
+    (source / "sub").mkdir(parents=True)
+    work_dir.mkdir()
+    (source / "a.bin").write_bytes(os.urandom(200_000))
+    (source / "sub" / "b.txt").write_text("hello\n")
+
+    agent = register_agent(api)
+    agent_id = agent["id"]
+    config_path = write_agent_config(agent, live_server, str(work_dir))
+    config = api.post("/api/configs", json={
+        "name": f"e2e-{time.time()}", "agent_id": agent_id, "source_path": str(source),
+        "remote_type": "local", "remote_name": f"e2e{agent_id}", "remote_path": str(dest),
+        "credentials": {}, "is_incremental": False
+    }).json()
+    job_id = api.post(f"/api/configs/{config['id']}/run").json()["job_id"]
+
+    result = run_agent(config_path)
+    assert result.returncode == 0, result.stdout + result.stderr
+
+    job = api.get(f"/api/jobs/{job_id}/progress").json()
+    assert job["status"] == "success", job
+    assert job["bytes_transferred"] == 200_006
+    comparison = filecmp.dircmp(source, dest)
+    assert not comparison.left_only and not comparison.diff_files
+    assert (dest / "sub" / "b.txt").read_text() == "hello\n"
+
+    log = api.get(f"/api/jobs/{job_id}/logs").json()["logs"]
+    assert "a.bin" in log
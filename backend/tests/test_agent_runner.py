@@ -0,0 +1,38 @@
+import asyncio
+from rclone_agent.client import LogLimitReached
+from rclone_agent.runner import JobRunner
+
+
+class LimitedServer:
+    """Takes uploads until it has `limit` bytes, then answers 413 like the server"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.size = 0
+        self.uploads = 0
+
+    async def log_offset(self, job_id: int) -> int:
+        return self.size
+
+    async def upload_log(self, job_id: int, offset: int, data: bytes) -> int:
+        self.uploads += 1
+        if offset + len(data) > self.limit:
+            raise LogLimitReached({"message": "Job log size limit reached", "offset": self.size})
+        self.size = offset + len(data)
+        return self.size
+
+
+def test_log_limit_stops_shipping(tmp_path):
+    (tmp_path / "logs").mkdir()
+    server = LimitedServer(limit=10)
+    runner = JobRunner(server, {"id": 1, "lease_token": "t", "source_path": "/src", "remote": "r:"}, str(tmp_path))
+    with open(runner.log_path, "w") as f:
+        f.write("x" * 50)
+
+    asyncio.run(runner._ship_once())
+    asyncio.run(runner._ship_once())
+
+    assert runner.shipping_stopped
+    assert server.uploads == 1
+    with open(runner.log_path) as f:
+        assert f.read().endswith("size limit was reached]\n")
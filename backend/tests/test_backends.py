@@ -0,0 +1,96 @@
+import time
+import pytest
+from app.backends import get_backend
+from app.database import SessionLocal
+from app.models import BackupConfig
+
+
+def test_render_includes_fields_and_options():
+    conf = get_backend("s3").render("wasabi", {"access_key": "AK", "secret_key": "SK", "options": {"chunk_size": "8M"}})
+    assert conf.startswith("[wasabi]\ntype = s3\n")
+    assert "access_key_id = AK\n" in conf
+    assert "chunk_size = 8M\n" in conf and "chunk_size = 32M" not in conf
+
+
+@pytest.mark.parametrize("creds", [
+    {"access_key": "AK", "secret_key": "SK\n[evil]\ntype = local"},
+    {"access_key": "AK", "secret_key": "SK", "options": {"chunk_size": "8M\r\n[evil]"}},
+    {"access_key": "AK", "secret_key": "SK", "options": {"[evil]": "x"}},
+    {"access_key": "AK", "secret_key": "SK", "options": {"a\nb": "x"}},
+    {"access_key": "AK", "secret_key": "SK", "options": {"a = b": "x"}},
+])
+def test_injection_is_rejected(creds):
+    with pytest.raises(ValueError):
+        get_backend("s3").validate(creds)
+    with pytest.raises(ValueError):
+        get_backend("s3").render("wasabi", creds)
+
+
+def test_api_rejects_injected_options(api, tmp_path):
+    reply = api.post("/api/configs", json={
+        "name": f"inject-{time.time()}", "source_path": str(tmp_path), "remote_type": "local",
+        "remote_name": "inject", "remote_path": str(tmp_path), "credentials": {"options": {"links": "true\n[x]"}}
+    })
+    assert reply.status_code == 400
+
+
+def stored_credentials(config_id: int) -> dict:
+    from app.main import rclone_manager
+    db = SessionLocal()
+    try:
+        return rclone_manager.config_credentials(db.get(BackupConfig, config_id))
+    finally:
+        db.close()
+
+
+def test_update_replaces_credentials_of_any_backend(api, tmp_path):
+    body = {
+        "name": f"gdrive-{time.time()}", "source_path": str(tmp_path), "remote_type": "gdrive",
+        "remote_name": f"gd{time.time_ns()}", "remote_path": "backups",
+        "credentials": {"client_id": "id", "client_secret": "secret", "token": "{\"a\": 1}"}
+    }
+    config = api.post("/api/configs", json=body).json()
+
+    body["credentials"] = {"client_id": "id", "client_secret": "", "token": "{\"a\": 2}", "options": {"chunk_size": "8M"}}
+    assert api.put(f"/api/configs/{config['id']}", json=body).status_code == 200
+    creds = stored_credentials(config["id"])
+    assert creds["token"] == "{\"a\": 2}"
+    assert creds["client_secret"] == "secret"  # Left blank in the form: kept
+    assert creds["options"] == {"chunk_size": "8M"}
+
+
+def config_rows(name: str) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(BackupConfig).filter(BackupConfig.name == name).count()
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("remote_name", ["evil\n[other]", "evil]x", ""])
+def test_bad_remote_name_is_rejected_before_storing(api, tmp_path, remote_name):
+    name = f"remote-name-{time.time_ns()}"
+    reply = api.post("/api/configs", json={
+        "name": name, "source_path": str(tmp_path), "remote_type": "local",
+        "remote_name": remote_name, "remote_path": str(tmp_path), "credentials": {}
+    })
+    assert reply.status_code == 400
+    assert config_rows(name) == 0
+
+
+def test_renamed_remote_drops_its_old_section(api, tmp_path):
+    from app.main import rclone_manager
+    old, new = f"old{time.time_ns()}", f"new{time.time_ns()}"
+    body = {
+        "name": f"rename-{time.time()}", "source_path": str(tmp_path), "remote_type": "s3",
+        "remote_name": old, "remote_path": "bucket", "credentials": {"access_key": "AK", "secret_key": "SK"}
+    }
+    config = api.post("/api/configs", json=body).json()
+    assert old in rclone_manager.config_store.sections
+
+    assert api.put(f"/api/configs/{config['id']}", json={**body, "remote_name": "bad\nname"}).status_code == 400
+    assert stored_credentials(config["id"])["secret_key"] == "SK"
+
+    assert api.put(f"/api/configs/{config['id']}", json={**body, "remote_name": new}).status_code == 200
+    assert old not in rclone_manager.config_store.sections
+    assert "secret_access_key = SK" in rclone_manager.config_store.sections[new]
@@ -0,0 +1,83 @@
+"""Agent polls, heartbeats and UI reads under concurrency, against a live server"""
+import asyncio
+import os
+import sqlite3
+import time
+import httpx
+import pytest
+from conftest import register_agent
+from app.database import IS_SQLITE, SQLALCHEMY_DATABASE_URL
+
+AGENTS = 10
+REQUESTS_PER_CLIENT = 20
+
+
+async def timed(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> float:
+    started = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    assert response.status_code == 200, (url, response.status_code, response.text)
+    return time.perf_counter() - started
+
+
+async def agent_traffic(base_url: str, agent: dict) -> list:
+    params = {"agent_token": agent["agent_token"]}
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as c:
+        latencies = []
+        for i in range(REQUESTS_PER_CLIENT):
+            if i % 2:
+                latencies.append(await timed(c, "POST", f"/api/agents/{agent['id']}/heartbeat", params=params))
+            else:
+                latencies.append(await timed(c, "GET", f"/api/agents/{agent['id']}/jobs", params=params))
+        return latencies
+
+
+async def ui_traffic(base_url: str, headers: dict) -> list:
+    async with httpx.AsyncClient(base_url=base_url, timeout=30, headers=headers) as c:
+        latencies = []
+        for i in range(REQUESTS_PER_CLIENT):
+            url = ("/api/agents", "/api/configs", "/api/jobs")[i % 3]
+            latencies.append(await timed(c, "GET", url))
+        return latencies
+
+
+def test_mixed_load(api, live_server):
+    agents = [register_agent(api) for _ in range(AGENTS)]
+    headers = {"Authorization": api.headers["Authorization"]}
+
+    async def run():
+        return await asyncio.gather(
+            *(agent_traffic(live_server, agent) for agent in agents),
+            *(ui_traffic(live_server, headers) for _ in range(AGENTS))
+        )
+
+    started = time.perf_counter()
+    latencies = sorted(sum(asyncio.run(run()), []))
+    elapsed = time.perf_counter() - started
+    p95 = latencies[int(len(latencies) * 0.95)]
+    print(f"{len(latencies)} requests in {elapsed:.2f}s, p95 {p95 * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+    assert len(latencies) == 2 * AGENTS * REQUESTS_PER_CLIENT
+    # Well under the 5 s SQLite busy timeout: nobody queued behind a database lock
+    assert latencies[-1] < 5
+
+
+@pytest.mark.skipif(not IS_SQLITE, reason="checks SQLite WAL mode")
+def test_reads_do_not_wait_for_a_writer(api, live_server):
+    agent = register_agent(api)
+    path = SQLALCHEMY_DATABASE_URL.split("///", 1)[1]
+    writer = sqlite3.connect(path, timeout=0, isolation_level=None)
+    try:
+        # An exclusive lock is what a committing writer holds; in WAL mode it only excludes other writers
+        writer.execute("BEGIN EXCLUSIVE")
+        writer.execute("UPDATE agents SET platform = platform WHERE id = ?", (agent["id"],))
+
+        async def read():
+            async with httpx.AsyncClient(base_url=live_server, timeout=30, headers=dict(api.headers)) as c:
+                return await asyncio.gather(*(timed(c, "GET", url) for url in
+                                              ("/api/agents", "/api/configs", "/api/jobs") * 5))
+
+        latencies = asyncio.run(read())
+        # With a rollback journal every read would block until the writer commits
+        assert max(latencies) < 2
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
@@ -0,0 +1,35 @@
+"""Range requests on job logs get the file's own bytes, even when gzip is accepted"""
+import time
+from app.database import SessionLocal
+from app.models import BackupJob
+
+
+def test_range_is_not_compressed(api, tmp_path):
+    config = api.post("/api/configs", json={
+        "name": f"range-{time.time()}", "source_path": str(tmp_path), "remote_type": "local",
+        "remote_name": "range", "remote_path": str(tmp_path / "dest"), "credentials": {},
+        "is_incremental": False
+    }).json()
+    log = tmp_path / "job.log"
+    body = b"".join(b"2026/10/18 12:00:00 INFO  : line %05d\n" % i for i in range(2000))
+    log.write_bytes(body)
+    db = SessionLocal()
+    try:
+        job = BackupJob(config_id=config["id"], status="success", log_file=str(log))
+        db.add(job)
+        db.commit()
+        job_id = job.id
+    finally:
+        db.close()
+
+    response = api.get(f"/api/jobs/{job_id}/logs", headers={"Range": "bytes=1000-49999", "Accept-Encoding": "gzip"})
+    assert response.status_code == 206
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-range"] == f"bytes 1000-49999/{len(body)}"
+    assert response.content == body[1000:50000]
+
+    # Whole-log responses are still compressed
+    response = api.get(f"/api/jobs/{job_id}/logs", params={"format": "text"}, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == body
@@ -0,0 +1,20 @@
+"""Columns added to existing tables get the model's defaults on old rows"""
+from sqlalchemy import create_engine, text
+import app.database
+from app.models import Base
+
+
+def test_added_columns_backfill_defaults(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE backup_configs (id INTEGER PRIMARY KEY, name VARCHAR)"))
+        conn.execute(text("INSERT INTO backup_configs (name) VALUES ('before')"))
+    monkeypatch.setattr(app.database, "engine", engine)
+
+    app.database._add_missing_columns(Base)
+
+    with engine.connect() as conn:
+        row = conn.execute(text(
+            "SELECT keep_monthly, keep_weekly, auto_tune, prescan, snapshot_mode, transfers FROM backup_configs"
+        )).one()
+    assert tuple(row) == (0, 1, 0, 0, "sync", None)
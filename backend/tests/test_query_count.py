@@ -0,0 +1,73 @@
+"""Queries per request must not grow with the number of jobs (N+1 check)"""
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+from conftest import register_agent
+from app.database import engine, async_engine, SessionLocal
+from app.models import BackupJob
+
+SIZES = (10, 1000)
+
+
+class QueryCounter:
+    """Counts statements on the app's sync and async engines"""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self.lock:
+            self.count += 1
+
+    @contextmanager
+    def measure(self):
+        targets = (engine, async_engine.sync_engine)
+        for target in targets:
+            event.listen(target, "before_cursor_execute", self)
+        self.count = 0
+        try:
+            yield self
+        finally:
+            for target in targets:
+                event.remove(target, "before_cursor_execute", self)
+
+
+def seed(api, tmp_path, jobs: int) -> tuple:
+    """(agent, config id) for a fresh agent config with `jobs` pending jobs"""
+    agent = register_agent(api)
+    config = api.post("/api/configs", json={
+        "name": f"queries-{jobs}-{time.time()}", "agent_id": agent["id"], "source_path": str(tmp_path),
+        "remote_type": "local", "remote_name": f"q{agent['id']}", "remote_path": str(tmp_path / "dest"),
+        "credentials": {}, "is_incremental": False
+    }).json()
+    db = SessionLocal()
+    try:
+        db.add_all(BackupJob(config_id=config["id"], agent_id=agent["id"], status="pending") for _ in range(jobs))
+        db.commit()
+    finally:
+        db.close()
+    return agent, config["id"]
+
+
+def queries(api, method: str, url: str, **kwargs) -> int:
+    with QueryCounter().measure() as counter:
+        response = api.request(method, url, **kwargs)
+    assert response.status_code == 200, response.text
+    return counter.count
+
+
+def test_query_count_is_flat(api, tmp_path):
+    counts = {}
+    for size in SIZES:
+        agent, config_id = seed(api, tmp_path, size)
+        counts[size] = {
+            "list_jobs": queries(api, "GET", "/api/jobs", params={"config_id": config_id, "limit": 500}),
+            "list_configs": queries(api, "GET", "/api/configs"),
+            # An agent claims as many jobs as it has free slots; each claim is one conditional UPDATE
+            "agent_poll": queries(api, "GET", f"/api/agents/{agent['id']}/jobs",
+                                  params={"agent_token": agent["agent_token"], "limit": 2}),
+        }
+    print(counts)
+    assert counts[SIZES[0]] == counts[SIZES[-1]]
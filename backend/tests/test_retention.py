@@ -0,0 +1,32 @@
+from app.retention import plan_retention
+
+SNAPSHOTS = [
+    "2026-01-01_02-00-00", "2026-01-02_02-00-00", "2026-01-09_02-00-00",
+    "2026-02-01_02-00-00", "2026-02-01_14-00-00", "not-a-snapshot"
+]
+
+
+def test_without_keep_rules_nothing_is_deleted():
+    keep, delete = plan_retention(SNAPSHOTS, 0, False, 0)
+    assert delete == []
+    assert sorted(keep) == sorted(SNAPSHOTS)
+
+
+def test_daily_keeps_newest_per_day():
+    keep, delete = plan_retention(SNAPSHOTS, 2, False, 0)
+    assert keep == ["not-a-snapshot", "2026-02-01_14-00-00", "2026-01-09_02-00-00"]
+    assert sorted(delete) == ["2026-01-01_02-00-00", "2026-01-02_02-00-00", "2026-02-01_02-00-00"]
+
+
+def test_monthly_keeps_newest_per_month():
+    keep, delete = plan_retention(SNAPSHOTS, 0, False, 2)
+    assert "2026-02-01_14-00-00" in keep and "2026-01-09_02-00-00" in keep
+    assert "2026-01-01_02-00-00" in delete and "not-a-snapshot" not in delete
+
+
+def test_weekly_keeps_configured_number_of_weeks():
+    # 2026-01-01 and -02 share an ISO week; -09 and 02-01 are two more
+    keep, delete = plan_retention(SNAPSHOTS, 0, True, 0, keep_weeks=2)
+    assert keep == ["not-a-snapshot", "2026-02-01_14-00-00", "2026-01-09_02-00-00"]
+    keep, delete = plan_retention(SNAPSHOTS, 0, True, 0, keep_weeks=3)
+    assert "2026-01-02_02-00-00" in keep and "2026-01-01_02-00-00" in delete
@@ -0,0 +1,85 @@
+"""rclone with default vs auto-tuned settings, syncing to a local filesystem remote
+
+Prints both timings. On a local disk the gain is modest and noisy (there is no
+per-request latency to hide), so nothing is asserted about them; run against a
+slow mount for the interesting numbers. What is asserted is the auto_tune
+decision for a small-file history and that both runs copy every file intact.
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from app.tuning import Tuning, auto_tune
+
+needs_rclone = pytest.mark.skipif(shutil.which("rclone") is None, reason="rclone is not installed")
+
+SMALL_FILES = int(os.environ.get("BENCH_SMALL_FILES", "3000"))
+SMALL_FILE_BYTES = 4096
+
+
+def make_tree(root):
+    for i in range(SMALL_FILES):
+        directory = root / f"d{i % 50:02d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"f{i:05d}").write_bytes(os.urandom(SMALL_FILE_BYTES))
+
+
+def small_file_history() -> list:
+    """Past runs of a config that backs up many small files"""
+    started = datetime.utcnow() - timedelta(days=1)
+    return [SimpleNamespace(
+        started_at=started, completed_at=started + timedelta(minutes=5),
+        files_checked=SMALL_FILES, files_transferred=SMALL_FILES,
+        bytes_transferred=SMALL_FILES * SMALL_FILE_BYTES, transfers=8
+    )]
+
+
+def tree_digest(root) -> dict:
+    """Relative path -> sha256 of every file below root"""
+    digest = {}
+    for directory, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(directory, name)
+            with open(path, "rb") as f:
+                digest[os.path.relpath(path, root)] = hashlib.sha256(f.read()).hexdigest()
+    return digest
+
+
+def timed_sync(source, dest, tuning: Tuning) -> float:
+    started = time.perf_counter()
+    subprocess.run(["rclone", "sync", str(source), f":local:{dest}", *tuning.flags()],
+                   check=True, capture_output=True)
+    return time.perf_counter() - started
+
+
+def small_file_config() -> SimpleNamespace:
+    return SimpleNamespace(auto_tune=True, transfers=None, checkers=None, buffer_size=None,
+                           multi_thread_streams=None, bwlimit=None, fast_list=False, max_backlog=None)
+
+
+def test_auto_tune_small_files_decision():
+    tuned = auto_tune(small_file_config(), small_file_history())
+    assert (tuned.transfers, tuned.checkers, tuned.buffer_size) == (32, 64, "4M")
+    assert not tuned.fast_list
+    assert tuned.flags()[:4] == ["--transfers", "32", "--checkers", "64"]
+
+
+@needs_rclone
+def test_auto_tune_small_files(tmp_path):
+    source = tmp_path / "source"
+    make_tree(source)
+    tuned = auto_tune(small_file_config(), small_file_history())
+
+    default_time = timed_sync(source, tmp_path / "default", Tuning())
+    tuned_time = timed_sync(source, tmp_path / "tuned", tuned)
+    print(f"{SMALL_FILES} files: default {' '.join(Tuning().flags())} {default_time:.2f}s, "
+          f"tuned {' '.join(tuned.flags())} {tuned_time:.2f}s ({default_time / tuned_time:.2f}x)")
+
+    expected = tree_digest(source)
+    assert len(expected) == SMALL_FILES
+    for dest in ("default", "tuned"):
+        assert tree_digest(tmp_path / dest) == expected
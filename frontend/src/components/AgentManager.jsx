@@ -30,6 +30,22 @@ function AgentManager({ agents, onRefresh, token }) {
     }
   };
 
+  const editBandwidth = async (agent) => {
+    const bwlimit = prompt(
+      'Bandwidth limit shared by all jobs on this agent (rclone --bwlimit value or timetable, e.g. "08:00,2M 19:00,off"). Leave empty for no limit.',
+      agent.bwlimit || ''
+    );
+    if (bwlimit === null) return;
+    try {
+      const api = axios.create({ baseURL: 'http://localhost:8000/api' });
+      api.defaults.headers.common['Authorization'] = `Bearer ${token}`;
+      await api.put(`/agents/${agent.id}/bandwidth`, { bwlimit: bwlimit.trim() || null });
+      onRefresh();
+    } catch (err) {
+      alert('Failed to update bandwidth: ' + (err.response?.data?.detail || err.message));
+    }
+  };
+
   const copyToClipboard = (text) => {
     navigator.clipboard.writeText(text);
     alert('Copied to clipboard!');
@@ -158,8 +174,20 @@ function AgentManager({ agents, onRefresh, token }) {
                   </span>
                   <span style={styles.infoValue}>{agent.version || 'v1.0.0'}</span>
                 </div>
+                <div style={styles.infoRow}>
+                  <span style={styles.infoLabel}>
+                    <svg width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" strokeWidth="2" style={{verticalAlign: 'middle', marginRight: '4px'}}>
+                      <polyline points="22 12 18 12 15 21 9 3 6 12 2 12"/>
+                    </svg>
+                    Bandwidth:
+                  </span>
+                  <span style={styles.infoValue}>{agent.bwlimit || 'Unlimited'}</span>
+                </div>
               </div>
               <div style={styles.cardFooter}>
+                <button onClick={() => editBandwidth(agent)} style={styles.secondaryBtn}>
+                  Bandwidth
+                </button>
                 <button 
                   onClick={() => deleteAgent(agent.id)} 
                   style={{
@@ -342,6 +370,16 @@ const styles = {
     textTransform: 'uppercase',
     letterSpacing: '0.5px'
   },
+  secondaryBtn: { 
+    background: '#e0e7ff', 
+    color: '#4338ca', 
+    border: 'none', 
+    padding: '8px 16px', 
+    borderRadius: '6px', 
+    cursor: 'pointer',
+    fontWeight: '600',
+    fontSize: '13px'
+  },
   dangerBtn: { 
     background: '#fee2e2', 
     color: '#dc2626', 
@@ -32,11 +32,27 @@ function ConfigForm({ token, agents = [], onSave, onCancel, editConfig = null })
     credentials: { access_key: '', secret_key: '', region: 'us-east-1', endpoint: 's3.wasabisys.com' },
     is_incremental: true,
     schedule_cron: '0 2 * * *',
+    schedule_window: 0,
     keep_daily_days: 3,
     keep_weekly: true,
+    keep_weeks: 4,
+    keep_monthly: 0,
+    transfers: null,
+    checkers: null,
+    buffer_size: '',
+    multi_thread_streams: null,
+    bwlimit: '',
+    fast_list: false,
+    max_backlog: null,
+    auto_tune: false,
+    prescan: false,
+    snapshot_mode: 'sync',
     enabled: true
   });
 
+  // Blank tuning inputs mean "use the default"
+  const numOrNull = v => v === '' ? null : parseInt(v);
+
   useEffect(() => {
     loadProfiles();
   }, []);
@@ -110,7 +126,11 @@ function ConfigForm({ token, agents = [], onSave, onCancel, editConfig = null })
                 <select 
                   style={styles.select}
                   value={form.agent_id || ''} 
-                  onChange={e => setForm({...form, agent_id: e.target.value ? parseInt(e.target.value) : null})}
+                  onChange={e => {
+                    const agent_id = e.target.value ? parseInt(e.target.value) : null;
+                    // Agents only run plain syncs
+                    setForm({...form, agent_id, snapshot_mode: agent_id ? 'sync' : form.snapshot_mode});
+                  }}
                 >
                   <option value="">Local (This Server)</option>
                   {agents.map(agent => (
@@ -133,6 +153,19 @@ function ConfigForm({ token, agents = [], onSave, onCancel, editConfig = null })
               />
             </div>
 
+            <div style={styles.formGroup}>
+              <label style={styles.label}>Snapshot Mode</label>
+              <select 
+                style={styles.select}
+                value={form.snapshot_mode || 'sync'} 
+                onChange={e => setForm({...form, snapshot_mode: e.target.value})}
+                disabled={!!form.agent_id}
+              >
+                <option value="sync">Sync (mirror the source)</option>
+                <option value="dedupe">Deduplicated snapshots (server-side only)</option>
+              </select>
+            </div>
+
             <div style={styles.formGroup}>
               <label style={styles.label}>Remote Name *</label>
               <input 
@@ -214,8 +247,9 @@ function ConfigForm({ token, agents = [], onSave, onCancel, editConfig = null })
                     value={form.remote_type} 
                     onChange={e => setForm({...form, remote_type: e.target.value})}
                   >
-                    <option value="s3">S3 (Wasabi/AWS)</option>
+                    <option value="s3">S3 (Wasabi/AWS/compatible)</option>
                     <option value="gdrive">Google Drive</option>
+                    <option value="local">Local / mounted filesystem</option>
                   </select>
                 </div>
 
@@ -242,6 +276,15 @@ function ConfigForm({ token, agents = [], onSave, onCancel, editConfig = null })
                         placeholder={editConfig ? "Leave blank to keep existing" : "Enter secret key"}
                       />
                     </div>
+                    <div style={styles.formGroup}>
+                      <label style={styles.label}>Provider</label>
+                      <input 
+                        style={styles.input}
+                        value={form.credentials.provider || 'Wasabi'} 
+                        onChange={e => setForm({...form, credentials: {...form.credentials, provider: e.target.value}})}
+                        placeholder="Wasabi, AWS, Minio, Ceph..."
+                      />
+                    </div>
                     <div style={styles.formGroup}>
                       <label style={styles.label}>Region</label>
                       <input 
@@ -275,6 +318,18 @@ function ConfigForm({ token, agents = [], onSave, onCancel, editConfig = null })
               />
               <small style={styles.hint}>Default: Daily at 2:00 AM</small>
             </div>
+            <div style={styles.formGroup}>
+              <label style={styles.label}>Start Window (minutes)</label>
+              <input 
+                style={styles.input}
+                type="number" 
+                value={form.schedule_window ?? 0} 
+                onChange={e => setForm({...form, schedule_window: parseInt(e.target.value) || 0})}
+                min="0"
+                max="1440"
+              />
+              <small style={styles.hint}>0 runs exactly on the cron time; otherwise the start is spread within the window to avoid peaks</small>
+            </div>
             <div style={styles.formGroup}>
               <label style={styles.label}>Keep Daily (days)</label>
               <input 
@@ -285,6 +340,94 @@ function ConfigForm({ token, agents = [], onSave, onCancel, editConfig = null })
                 min="1"
               />
             </div>
+            <div style={styles.formGroup}>
+              <label style={styles.label}>Keep Weekly (weeks)</label>
+              <input 
+                style={styles.input}
+                type="number" 
+                value={form.keep_weeks ?? 4} 
+                onChange={e => setForm({...form, keep_weeks: parseInt(e.target.value)})}
+                min="1"
+                disabled={!form.keep_weekly}
+              />
+            </div>
+            <div style={styles.formGroup}>
+              <label style={styles.label}>Keep Monthly (months)</label>
+              <input 
+                style={styles.input}
+                type="number" 
+                value={form.keep_monthly ?? 0} 
+                onChange={e => setForm({...form, keep_monthly: parseInt(e.target.value)})}
+                min="0"
+              />
+            </div>
+          </div>
+
+          <div style={styles.formGrid}>
+            <div style={styles.formGroup}>
+              <label style={styles.label}>Transfers</label>
+              <input 
+                style={styles.input}
+                type="number" 
+                value={form.transfers ?? ''} 
+                onChange={e => setForm({...form, transfers: numOrNull(e.target.value)})}
+                placeholder="8"
+                min="1"
+                disabled={form.auto_tune}
+              />
+            </div>
+            <div style={styles.formGroup}>
+              <label style={styles.label}>Checkers</label>
+              <input 
+                style={styles.input}
+                type="number" 
+                value={form.checkers ?? ''} 
+                onChange={e => setForm({...form, checkers: numOrNull(e.target.value)})}
+                placeholder="16"
+                min="1"
+                disabled={form.auto_tune}
+              />
+            </div>
+            <div style={styles.formGroup}>
+              <label style={styles.label}>Buffer Size</label>
+              <input 
+                style={styles.input}
+                value={form.buffer_size || ''} 
+                onChange={e => setForm({...form, buffer_size: e.target.value || null})}
+                placeholder="16M"
+              />
+            </div>
+            <div style={styles.formGroup}>
+              <label style={styles.label}>Multi-thread Streams</label>
+              <input 
+                style={styles.input}
+                type="number" 
+                value={form.multi_thread_streams ?? ''} 
+                onChange={e => setForm({...form, multi_thread_streams: numOrNull(e.target.value)})}
+                placeholder="4"
+                min="0"
+              />
+            </div>
+            <div style={styles.formGroup}>
+              <label style={styles.label}>Bandwidth Limit</label>
+              <input 
+                style={styles.input}
+                value={form.bwlimit || ''} 
+                onChange={e => setForm({...form, bwlimit: e.target.value || null})}
+                placeholder="e.g. 10M or 08:00,1M 19:00,off"
+              />
+            </div>
+            <div style={styles.formGroup}>
+              <label style={styles.label}>Max Backlog</label>
+              <input 
+                style={styles.input}
+                type="number" 
+                value={form.max_backlog ?? ''} 
+                onChange={e => setForm({...form, max_backlog: numOrNull(e.target.value)})}
+                placeholder="10000"
+                min="1"
+              />
+            </div>
           </div>
 
           <div style={styles.checkboxGroup}>
@@ -315,6 +458,34 @@ function ConfigForm({ token, agents = [], onSave, onCancel, editConfig = null })
               />
               Enabled
             </label>
+            <label style={styles.checkboxLabel}>
+              <input 
+                type="checkbox" 
+                checked={form.fast_list || false} 
+                onChange={e => setForm({...form, fast_list: e.target.checked})}
+                style={styles.checkbox}
+              />
+              Fast List
+            </label>
+            <label style={styles.checkboxLabel}>
+              <input 
+                type="checkbox" 
+                checked={form.auto_tune || false} 
+                onChange={e => setForm({...form, auto_tune: e.target.checked})}
+                style={styles.checkbox}
+              />
+              Auto-tune from past runs
+            </label>
+            <label style={styles.checkboxLabel}>
+              <input 
+                type="checkbox" 
+                checked={form.prescan || false} 
+                onChange={e => setForm({...form, prescan: e.target.checked})}
+                disabled={!!form.agent_id}
+                style={styles.checkbox}
+              />
+              Skip unchanged runs (pre-scan, server-side only)
+            </label>
           </div>
 
           <div style={styles.modalFooter}>
@@ -99,12 +99,25 @@ function Dashboard({ token, onLogout }) {
       }
     }
   };
+  const toggleJobPause = async (job) => {
+    const action = job.status === 'paused' ? 'resume' : 'pause';
+    try {
+      await api.post(`/jobs/${job.id}/${action}`);
+      loadJobs();
+    } catch (err) {
+      alert(`Failed to ${action}: ` + (err.response?.data?.detail || err.message));
+    }
+  };
   const getStatusColor = (status) => {
     const colors = {
       success: '#10b981',
       failed: '#ef4444',
       running: '#f59e0b',
+      paused: '#3b82f6',
+      cancelled: '#6b7280',
+      skipped: '#8b5cf6',
       pending: '#6b7280',
+      queued: '#6b7280',
       online: '#10b981',
       offline: '#ef4444'
     };
@@ -247,7 +260,9 @@ function Dashboard({ token, onLogout }) {
                       </div>
                       <div style={styles.infoRow}>
                         <span style={styles.infoLabel}>Schedule:</span>
-                        <code style={styles.infoValue}>{cfg.schedule_cron}</code>
+                        <code style={styles.infoValue}>
+                          {cfg.schedule_cron}{cfg.schedule_window ? ` (+${cfg.schedule_window}m)` : ''}
+                        </code>
                       </div>
                       <div style={styles.infoRow}>
                         <span style={styles.infoLabel}>Last Run:</span>
@@ -331,6 +346,10 @@ function Dashboard({ token, onLogout }) {
                               </svg>
                               Waiting for agent...
                             </span>
+                          ) : job.status === 'queued' ? (
+                            <span style={{color: '#6b7280'}}>Waiting for slot...</span>
+                          ) : job.status === 'paused' ? (
+                            <span style={{color: '#3b82f6'}}>❚❚ Paused</span>
                           ) : (
                             <span style={{color: '#f59e0b'}}>⟳ Running...</span>
                           )}
@@ -344,7 +363,21 @@ function Dashboard({ token, onLogout }) {
                                 <polyline points="14 2 14 8 20 8"/>
                               </svg>
                             </button>
-                          {(job.status === 'pending' || job.status === 'running') && (
+                          {['running', 'paused'].includes(job.status) && (
+                            <button onClick={() => toggleJobPause(job)} style={styles.iconBtn} title={job.status === 'paused' ? 'Resume' : 'Pause'}>
+                              {job.status === 'paused' ? (
+                                <svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" strokeWidth="2">
+                                  <polygon points="5 3 19 12 5 21 5 3"/>
+                                </svg>
+                              ) : (
+                                <svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" strokeWidth="2">
+                                  <rect x="6" y="4" width="4" height="16"/>
+                                  <rect x="14" y="4" width="4" height="16"/>
+                                </svg>
+                              )}
+                            </button>
+                          )}
+                          {['pending', 'queued', 'running', 'paused'].includes(job.status) && (
                             <button onClick={() => cancelJob(job.id)} style={{...styles.iconBtn, color: '#ef4444'}} title="Cancel">
                               <svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" strokeWidth="2">
                                <circle cx="12" cy="12" r="10"/>
@@ -3,6 +3,7 @@ import axios from 'axios';
 
 function LogViewer({ jobId, token, onClose }) {
   const [logs, setLogs] = useState('');
+  const [partial, setPartial] = useState(false);
 
   useEffect(() => {
     const api = axios.create({ baseURL: 'http://localhost:8000/api' });
@@ -10,6 +11,7 @@ function LogViewer({ jobId, token, onClose }) {
     
     api.get(`/jobs/${jobId}/logs`).then(res => {
       setLogs(res.data.logs);
+      setPartial(res.data.offset > 0);
     });
   }, [jobId]);
 
@@ -17,6 +19,7 @@ function LogViewer({ jobId, token, onClose }) {
     <div style={styles.overlay}>
       <div style={styles.modal}>
         <h3>Job {jobId} Logs</h3>
+        {partial && <p style={styles.note}>Showing the end of a large log</p>}
         <pre style={styles.logs}>{logs}</pre>
         <button onClick={onClose} style={styles.btn}>Close</button>
       </div>
@@ -28,6 +31,7 @@ const styles = {
   overlay: { position: 'fixed', top: 0, left: 0, right: 0, bottom: 0, background: 'rgba(0,0,0,0.7)', display: 'flex', justifyContent: 'center', alignItems: 'center', zIndex: 1000 },
   modal: { background: 'white', padding: '30px', borderRadius: '8px', maxWidth: '800px', width: '90%', maxHeight: '80vh', overflow: 'auto' },
   logs: { background: '#2c3e50', color: '#ecf0f1', padding: '15px', borderRadius: '5px', overflow: 'auto', maxHeight: '400px', fontSize: '12px' },
+  note: { color: '#7f8c8d', fontSize: '12px' },
   btn: { marginTop: '15px', background: '#3498db', color: 'white', padding: '10px 20px', border: 'none', borderRadius: '5px', cursor: 'pointer' }
 };
 